@@ -0,0 +1,56 @@
+"""Time how long a fresh process takes to import the app and answer its first request.
+
+    python -m benchmarks.cold_start [--runs 10] [--database-url sqlite:///cold.db]
+
+Each run is a new interpreter, as a gunicorn worker without --preload
+would be. It reports the import of main (building the app included) and
+the time until the first GET / has been answered. The database is
+bootstrapped once beforehand, so runs measure startup against an existing
+schema.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = """
+import time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.app.test_client().get("/")
+print(imported - started, time.perf_counter() - started)
+"""
+
+
+def run_probe(env, code=PROBE):
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True).stdout
+    return [float(v) for v in out.split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(tmp, 'cold.db')}",
+            METRICS_DB="", INTAKE_RATE_LIMIT_DB="",
+            PYTHONPATH=os.getcwd(),
+        )
+        subprocess.run([sys.executable, "-m", "flask", "--app", "main", "bootstrap"], env=env, check=True, capture_output=True)
+        samples = [run_probe(env) for _ in range(args.runs)]
+    imports = [s[0] * 1000 for s in samples]
+    firsts = [s[1] * 1000 for s in samples]
+    print(f"{'':>16} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for label, values in (("import main", imports), ("first response", firsts)):
+        print(f"{label:>16} {statistics.median(values):>10.0f} {min(values):>8.0f} {max(values):>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
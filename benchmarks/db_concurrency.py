@@ -0,0 +1,142 @@
+"""Concurrent writers and readers against the configured database engines.
+
+    python -m benchmarks.db_concurrency [--writers 4] [--readers 8] [--seconds 10]
+                                        [--think-ms 5] [--postgres-url postgresql://...]
+
+Each writer is its own process, like a gunicorn worker handling intake
+submissions: one transaction adds a client, a competitor and a query with
+keywords and bumps the dashboard counters. Each reader process renders
+the dashboard's queries (one keyset page, per-client counts and the
+counters). SQLite runs twice on a fresh file: with its stock rollback
+journal and with the pragmas from database/engine.py. Postgres runs too
+when --postgres-url points at an empty database. Every process pauses
+--think-ms between operations, standing in for the rest of a request;
+without it SQLite hands its write lock back to the same process and the
+other writers starve.
+"""
+from multiprocessing import Process, Queue
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+from config import Config
+from database.engine import configure_engine, database_url, engine_options
+from database.models import db, Client, Competitor, Query
+from database.pagination import keyset_paginate
+from database.stats import bump_counters, competitor_counts, get_counters, seed_counters
+
+ROLLBACK_JOURNAL = {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_BUSY_TIMEOUT_MS": "", "SQLITE_MMAP_SIZE": ""}
+
+
+def make_app(url, overrides=None):
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    app.config["SQLALCHEMY_DATABASE_URI"] = url
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(
+        url, pool_size=2, max_overflow=0, pool_timeout=30, pool_recycle=0, pre_ping=False
+    )
+    app.config.update(overrides or {})
+    db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine, app.config)
+    return app
+
+
+def write_once(n):
+    client = Client(name=f"Bench {n}", website=f"bench{n}.example.com", contact_name="B", contact_email="b@example.com")
+    db.session.add(client)
+    db.session.flush()
+    db.session.add(Competitor(client_id=client.id, website=f"rival{n}.example.com"))
+    query = Query(client_id=client.id, frequency="monthly")
+    db.session.add(query)
+    db.session.flush()
+    query.set_keywords([f"keyword {n}", "shared keyword"])
+    query.set_countries(["US"])
+    bump_counters(clients=1, competitors=1, queries=1)
+    db.session.commit()
+
+
+def read_once(n):
+    page = keyset_paginate(Client.query, Client, 25)
+    competitor_counts([c.id for c in page.items])
+    get_counters()
+    db.session.rollback()
+
+
+def _run(role, url, overrides, seconds, think, results):
+    app = make_app(url, overrides)
+    op = write_once if role == "writer" else read_once
+    latencies, errors, n = [], 0, 0
+    with app.app_context():
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            n += 1
+            started = time.perf_counter()
+            try:
+                op(os.getpid() * 1000000 + n)
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            time.sleep(think)
+    results.put((role, latencies, errors))
+
+
+def run_engine(label, url, overrides, writers, readers, seconds, think):
+    app = make_app(url, overrides)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_counters()
+        db.session.commit()
+        db.engine.dispose()
+
+    results = Queue()
+    procs = [Process(target=_run, args=("writer", url, overrides, seconds, think, results)) for _ in range(writers)]
+    procs += [Process(target=_run, args=("reader", url, overrides, seconds, think, results)) for _ in range(readers)]
+    for p in procs:
+        p.start()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+
+    for role in ("writer", "reader"):
+        latencies = [l for r, ls, _ in collected if r == role for l in ls]
+        errors = sum(e for r, _, e in collected if r == role)
+        if not latencies:
+            print(f"{label:>14} {role + 's':>8} {'0':>10} {'-':>9} {'-':>9} {errors:>8}")
+            continue
+        latencies.sort()
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(
+            f"{label:>14} {role + 's':>8} {len(latencies) / seconds:>10.0f} "
+            f"{statistics.median(latencies) * 1000:>9.1f} {p99 * 1000:>9.1f} {errors:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--think-ms", type=float, default=5)
+    parser.add_argument("--postgres-url", help="empty Postgres database to benchmark; its tables are dropped and recreated")
+    args = parser.parse_args()
+    common = (args.writers, args.readers, args.seconds, args.think_ms / 1000)
+
+    print(f"{'engine':>14} {'role':>8} {'ops/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        run_engine("sqlite", f"sqlite:///{os.path.join(tmp, 'journal.db')}", ROLLBACK_JOURNAL, *common)
+        run_engine("sqlite+wal", f"sqlite:///{os.path.join(tmp, 'wal.db')}", None, *common)
+    if args.postgres_url:
+        run_engine("postgres", database_url(args.postgres_url), None, *common)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Show that report export memory stays flat as the export grows.
+
+    python -m benchmarks.export_memory [--sizes 1000,10000,100000]
+
+Each size writes a report of that many records through ReportWriter into a
+throwaway SQLite database, then streams it through export_response() as
+NDJSON and as CSV, measuring peak Python heap with tracemalloc while the
+response body is consumed.
+"""
+from datetime import datetime
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from flask import Flask
+
+from database.models import db, Client, Query, Report
+from reports.export import export_response
+from reports.storage import ReportWriter
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db.init_app(app)
+    return app
+
+
+def fake_record(i):
+    return {
+        "competitor_id": i % 50,
+        "source": "website",
+        "url": f"https://competitor-{i % 50}.example.com/page/{i}",
+        "final_url": f"https://competitor-{i % 50}.example.com/page/{i}",
+        "status": 200,
+        "title": f"Page {i} - Competitor {i % 50}",
+        "content_type": "text/html; charset=utf-8",
+        "bytes": 20000 + i % 5000,
+        "elapsed_ms": 120.5,
+        "attempts": 1,
+        "cache": None,
+        "error": None,
+    }
+
+
+def seed_report(size):
+    client = Client(name="Bench", website="bench.example.com", contact_name="B", contact_email="b@example.com")
+    db.session.add(client)
+    db.session.flush()
+    query = Query(client_id=client.id)
+    db.session.add(query)
+    db.session.flush()
+    report = Report(query_id=query.id, status="running")
+    db.session.add(report)
+    db.session.commit()
+    writer = ReportWriter(report.id)
+    for i in range(size):
+        writer.write("results", fake_record(i))
+    for key, value in writer.close().items():
+        setattr(report, key, value)
+    report.status = "complete"
+    report.generated_at = datetime.utcnow()
+    db.session.commit()
+    return report
+
+
+def measure(app, report, fmt, gzip):
+    headers = {"Accept-Encoding": "gzip"} if gzip else {}
+    with app.test_request_context(f"/reports/{report.id}/export.{fmt}", headers=headers):
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = export_response(report, fmt)
+        total = sum(len(chunk) for chunk in response.response)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return total, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        with app.app_context():
+            db.create_all()
+            print(f"{'records':>10} {'format':>12} {'export bytes':>14} {'peak heap KB':>13} {'seconds':>8}")
+            for size in sizes:
+                report = seed_report(size)
+                for fmt, gzip in (("ndjson", False), ("ndjson", True), ("csv", False), ("csv", True)):
+                    total, peak, elapsed = measure(app, report, fmt, gzip)
+                    label = fmt + ("+gzip" if gzip else "")
+                    print(f"{size:>10} {label:>12} {total:>14} {peak / 1024:>13.0f} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
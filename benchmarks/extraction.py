@@ -0,0 +1,100 @@
+"""Measure page extraction throughput across pool sizes, and how long it blocks the event loop.
+
+    python -m benchmarks.extraction [--pages 400] [--page-kb 150] [--processes 0,1,2,4,8]
+
+Synthetic HTML pages of about --page-kb KB (title, meta tags, headings,
+links, JSON-LD with an aggregate rating) go through an ExtractionStage
+(sources/extract.py) as the collect loop feeds them, for each pool size;
+0 runs the extractors inline in the loop, as a single process would.
+Alongside, a ticker coroutine wakes every millisecond and records how
+late it woke, which is how long fetches would have been stalled. The
+output shows pages/s, MB/s, speedup over one pool process and the worst
+loop stall. Pool startup is excluded: each size is warmed up first.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from sources.extract import ExtractionStage, get_pool
+from sources.extractors import review_page
+
+TICK = 0.001
+CONTENT_TYPE = "text/html; charset=utf-8"
+
+
+def fake_page(n, size):
+    rating = {"@context": "https://schema.org", "@type": "Product", "name": f"Product {n}",
+              "aggregateRating": {"@type": "AggregateRating", "ratingValue": "4.3", "reviewCount": str(100 + n)}}
+    head = (
+        f"<!doctype html><html><head><title>Competitor {n} - Reviews</title>"
+        f'<meta name="description" content="What customers say about competitor {n}">'
+        f'<meta property="og:title" content="Competitor {n}">'
+        f'<link rel="canonical" href="https://reviews.example.com/competitor-{n}">'
+        f'<script type="application/ld+json">{json.dumps(rating)}</script>'
+        "<style>body { font-family: sans-serif }</style></head><body>"
+        f"<h1>Competitor {n} reviews</h1>"
+    )
+    review = (
+        '<div class="review"><h2>Great service</h2><p>Delivery was quick and the <a href="/item">item</a> '
+        'matched the description. Would order again from this shop.</p><img src="/a.png" alt=""></div>'
+    )
+    body = review * max(1, (size - len(head)) // len(review))
+    return (head + body + "</body></html>").encode()
+
+
+async def run(pages, processes, buffer_bytes):
+    stalls = []
+    done_at = []
+
+    async def ticker():
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(TICK)
+            stalls.append(time.perf_counter() - started - TICK)
+
+    tick = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    async with ExtractionStage(processes, buffer_bytes) as stage:
+        for body in pages:
+            await stage.submit(review_page, body, CONTENT_TYPE, lambda fields, error: done_at.append(error))
+            await asyncio.sleep(0)  # the collect loop yields to fetches between results
+    elapsed = time.perf_counter() - started
+    tick.cancel()
+    errors = [e for e in done_at if e]
+    if errors:
+        raise SystemExit(f"extraction failed: {errors[0]}")
+    return elapsed, max(stalls, default=0.0), stage.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--page-kb", type=int, default=150)
+    parser.add_argument("--processes", default="0,1,2,4,8")
+    parser.add_argument("--buffer-mb", type=int, default=32)
+    args = parser.parse_args()
+    pages = [fake_page(n, args.page_kb * 1024) for n in range(args.pages)]
+    megabytes = sum(len(p) for p in pages) / 1024 ** 2
+    print(f"{args.pages} pages, {megabytes:.0f} MB, {os.cpu_count()} CPUs")
+    print(f"{'processes':>9} {'pages/s':>8} {'MB/s':>7} {'speedup':>8} {'max stall ms':>13} {'waits':>6}")
+    base = None
+    for processes in [int(p) for p in args.processes.split(",")]:
+        if processes:
+            asyncio.run(run(pages[:processes * 4], processes, args.buffer_mb * 1024 ** 2))  # start the pool
+        elapsed, stall, stats = asyncio.run(run(pages, processes, args.buffer_mb * 1024 ** 2))
+        if processes == 1:
+            base = elapsed
+        speedup = f"{base / elapsed:.2f}x" if base and processes else "-"
+        print(
+            f"{processes:>9} {args.pages / elapsed:>8.0f} {megabytes / elapsed:>7.1f} {speedup:>8} "
+            f"{stall * 1000:>13.1f} {stats['waits']:>6}"
+        )
+        if processes:
+            get_pool(processes).shutdown()
+
+
+if __name__ == "__main__":
+    main()
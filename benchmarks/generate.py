@@ -0,0 +1,152 @@
+"""Populate a database with synthetic clients, queries and reports at a chosen scale.
+
+    python -m benchmarks.generate --database-url sqlite:///bench.db [--scale small|medium|large]
+                                  [--clients N] [--competitors N] [--keywords N] [--countries N]
+                                  [--reports N] [--report-records N] [--seed 1]
+
+Every run with the same scale and seed produces the same data. Clients,
+competitors, queries and their keyword/country rows go through
+write_clients() (intake/pipeline.py), the same batched inserts a bulk
+import uses. Keywords come from a shared vocabulary, so queries overlap
+the way real ones do. Completed reports of --report-records records each
+are written through ReportWriter, spread evenly over the queries. A
+shareable link with the token "bench" is created for intake benchmarks.
+
+--scale picks the defaults; the individual options override them. At
+"large" (10k clients, 50 competitors each, 1000 keywords x 100 countries
+per query) expect a database of several GB and a long run.
+"""
+from datetime import date, datetime, timedelta
+import argparse
+import json
+import os
+import random
+import time
+
+from flask import current_app
+
+from benchmarks.export_memory import fake_record
+from countries import COUNTRIES
+from database.models import db, Query, Report, ShareableLink
+from database.stats import bump_counters
+from intake.pipeline import write_clients
+from reports.storage import ReportWriter
+
+SCALES = {
+    "small": dict(clients=200, competitors=5, keywords=50, countries=5, reports=50, report_records=2000),
+    "medium": dict(clients=2000, competitors=20, keywords=200, countries=20, reports=200, report_records=10000),
+    "large": dict(clients=10000, competitors=50, keywords=1000, countries=100, reports=200, report_records=20000),
+}
+VOCABULARY_SIZE = 20000
+BATCH_CLIENTS = 100
+TIERS = ("trial", "6month", "1year")
+FREQUENCIES = ("monthly", "fortnightly", "quarterly")
+BENCH_TOKEN = "bench"
+PERIOD_END = date(2025, 1, 31)
+
+
+def client_rows(rng, start, count, scale, countries):
+    """Rows shaped like clean_row() output, ready for write_clients()."""
+    for n in range(start, start + count):
+        yield {
+            "client": {
+                "name": f"Client {n}",
+                "website": f"client{n}.example.com",
+                "contact_name": f"Contact {n}",
+                "contact_email": f"contact{n}@client{n}.example.com",
+                "subscription_tier": rng.choice(TIERS),
+                "social_handles": json.dumps([{"platform": "linkedin", "handle": f"client-{n}"}]),
+            },
+            "competitors": [
+                {
+                    "name": f"Rival {n}-{i}",
+                    "website": f"rival{n}-{i}.example.com",
+                    "youtube_url": "",
+                    "vimeo_url": "",
+                    "review_page_url": f"https://reviews.example.com/rival{n}-{i}",
+                    "social_handles": "[]",
+                }
+                for i in range(scale["competitors"])
+            ],
+            "keywords": [f"keyword {k}" for k in rng.sample(range(VOCABULARY_SIZE), scale["keywords"])],
+            "countries": rng.sample(countries, scale["countries"]),
+            "query": {
+                "frequency": rng.choice(FREQUENCIES),
+                "auto_run": rng.random() < 0.5,
+                "period_start": PERIOD_END - timedelta(days=30),
+                "period_end": PERIOD_END,
+            },
+        }
+
+
+def write_reports(query_ids, count, records, segment_records):
+    if not query_ids or not count:
+        return 0
+    chosen = query_ids[::max(1, len(query_ids) // count)][:count]
+    for query_id in chosen:
+        report = Report(query_id=query_id, status="complete", attempts=1)
+        db.session.add(report)
+        db.session.flush()
+        bump_counters(reports=1)
+        db.session.commit()
+        writer = ReportWriter(report.id, segment_records)
+        for i in range(records):
+            writer.write("results" if i % 4 else "keyword_results", fake_record(i))
+        counts = writer.close()
+        report.data = json.dumps({"query_id": query_id, "sections": writer.section_counts, "competitors": []})
+        report.summary = json.dumps(dict(writer.section_counts, competitors=0))
+        report.generated_at = datetime.utcnow()
+        report.duration_seconds = 0.0
+        for key, value in counts.items():
+            setattr(report, key, value)
+        db.session.commit()
+    return len(chosen)
+
+
+def populate(scale, seed=1):
+    """Fill the app's database with `scale` (a dict like SCALES["small"]). Returns what was written."""
+    rng = random.Random(seed)
+    countries = list(COUNTRIES)
+    if scale["countries"] > len(countries):
+        raise ValueError(f"at most {len(countries)} countries per query")
+    for start in range(0, scale["clients"], BATCH_CLIENTS):
+        rows = list(client_rows(rng, start, min(BATCH_CLIENTS, scale["clients"] - start), scale, countries))
+        write_clients(rows)
+        db.session.commit()
+        print(f"  {start + len(rows)}/{scale['clients']} clients", end="\r", flush=True)
+    print()
+    if db.session.scalar(db.select(ShareableLink.id).where(ShareableLink.token == BENCH_TOKEN)) is None:
+        db.session.add(ShareableLink(token=BENCH_TOKEN, label="Benchmark"))
+        db.session.commit()
+    query_ids = db.session.scalars(db.select(Query.id).order_by(Query.id)).all()
+    reports = write_reports(
+        query_ids, scale["reports"], scale["report_records"], current_app.config["REPORT_SEGMENT_RECORDS"]
+    )
+    return dict(scale, reports=reports, queries=len(query_ids))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", required=True, help="database to fill; bootstrapped first, so it may be new")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    scale = dict(SCALES[args.scale])
+    scale.update({name: getattr(args, name) for name in scale if getattr(args, name) is not None})
+
+    # main reads its configuration at import time.
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ.setdefault("METRICS_DB", "")
+    from main import app, bootstrap
+
+    started = time.perf_counter()
+    with app.app_context():
+        bootstrap()
+        written = populate(scale, args.seed)
+    print(", ".join(f"{k}={v}" for k, v in written.items()) + f" in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Drive the Flask app with concurrent clients and compare against a saved baseline.
+
+    python -m benchmarks.harness --database-url sqlite:///bench.db [--processes 4] [--requests 50]
+                                 [--scenarios dashboard,client_detail,...] [--save baseline.json]
+                                 [--compare baseline.json] [--tolerance 0.5]
+
+Fill the database first with benchmarks.generate; the harness changes it
+(intake posts add clients, run_report queues reports, delete removes
+clients), so regenerate it before each comparable run. Each process
+stands in for a gunicorn worker and sends --requests requests per
+scenario through the full Flask stack. Scenarios run one after another,
+with every process starting a scenario together:
+
+    dashboard      GET /
+    client_detail  GET /clients/<id>
+    intake_get     GET /intake/bench
+    intake_post    POST /intake/bench
+    run_report     POST /queries/<id>/run
+    delete         POST /clients/<id>/delete
+
+For each scenario it reports throughput, p50/p95/p99 latency, SQL
+statements per request and the peak RSS of the busiest process.
+--save writes the results as JSON; --compare reads such a file and exits
+non-zero if statements per request grew at all (beyond 5%, for scenarios
+that pick random rows) or p95 latency grew by more than --tolerance.
+Statement counts are deterministic; latency is only comparable between
+runs on the same host.
+"""
+from multiprocessing import Barrier, Process, Queue
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+SCENARIOS = ("dashboard", "client_detail", "intake_get", "intake_post", "run_report", "delete")
+BENCH_TOKEN = "bench"
+STATEMENT_TOLERANCE = 0.05
+
+
+def _intake_form(n):
+    return {
+        "idempotency_key": f"bench-{n}",
+        "client_name": f"Load {n}",
+        "client_website": f"load{n}.example.com",
+        "contact_name": "Load Test",
+        "contact_email": f"load{n}@example.com",
+        "subscription_tier": "trial",
+        "comp_website[]": [f"rival{n}.example.com"],
+        "comp_name[]": ["Rival"],
+        "keywords": "\n".join(f"keyword {k}" for k in range(20)),
+        "countries[]": ["Germany", "France"],
+        "frequency": "monthly",
+    }
+
+
+def _request(client, scenario, rng, ids, n):
+    if scenario == "dashboard":
+        return client.get("/")
+    if scenario == "client_detail":
+        return client.get(f"/clients/{rng.choice(ids['clients'])}")
+    if scenario == "intake_get":
+        return client.get(f"/intake/{BENCH_TOKEN}", headers={"Accept-Encoding": "gzip"})
+    if scenario == "intake_post":
+        return client.post(f"/intake/{BENCH_TOKEN}", data=_intake_form(n))
+    if scenario == "run_report":
+        return client.post(f"/queries/{rng.choice(ids['queries'])}/run")
+    if scenario == "delete":
+        return client.post(f"/clients/{ids['deletable'].pop()}/delete")
+    raise ValueError(f"unknown scenario {scenario!r}")
+
+
+def _worker(index, scenarios, requests, ids, barrier, results):
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from main import app, db
+
+    with app.app_context():
+        db.engine.dispose(close=False)  # don't share the parent's connections
+    statements = [0]
+    event.listen(Engine, "before_cursor_execute", lambda *args: statements.__setitem__(0, statements[0] + 1))
+    client = app.test_client()
+    rng = random.Random(index)
+    for scenario in scenarios:
+        latencies, counts, errors = [], [], 0
+        barrier.wait()
+        started = time.time()
+        for i in range(requests):
+            before = statements[0]
+            t = time.perf_counter()
+            response = _request(client, scenario, rng, ids, f"{os.getpid()}-{scenario}-{i}")
+            response.close()
+            latencies.append(time.perf_counter() - t)
+            counts.append(statements[0] - before)
+            errors += response.status_code >= 400
+        rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results.put((scenario, started, time.time(), latencies, counts, errors, rss_kb))
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def summarize(collected):
+    latencies = sorted(l for _, _, lats, _, _, _ in collected for l in lats)
+    counts = [c for _, _, _, cs, _, _ in collected for c in cs]
+    wall = max(end for _, end, *_ in collected) - min(start for start, *_ in collected)
+    return {
+        "requests": len(latencies),
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "statements_per_request": sum(counts) / len(counts),
+        "errors": sum(errors for *_, errors, _ in collected),
+        "peak_rss_mb": max(rss for *_, rss in collected) / 1024,
+    }
+
+
+def load_ids(app, processes, deletes):
+    """Client and query ids to request. Deletes take the newest clients, a disjoint slice per process."""
+    from database.models import db, Client, Query
+
+    with app.app_context():
+        clients = db.session.scalars(db.select(Client.id).where(Client.deleted_at.is_(None)).order_by(Client.id)).all()
+        queries = db.session.scalars(db.select(Query.id).order_by(Query.id)).all()
+        db.engine.dispose()
+    if len(clients) < deletes + 1 or not queries:
+        sys.exit(f"Only {len(clients)} clients; generate at least {deletes + 1} for this run.")
+    keep = clients[: len(clients) - deletes]
+    doomed = clients[len(keep):]
+    return keep, queries, [doomed[i::processes] for i in range(processes)]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against `baseline` per scenario. Returns the names of regressed metrics."""
+    regressions = []
+    print(f"\nAgainst {baseline['meta'].get('commit') or 'baseline'}:")
+    for scenario, now in results.items():
+        before = baseline["scenarios"].get(scenario)
+        if before is None:
+            continue
+        changes = []
+        # Throughput is shown but not judged; like latency it mostly tracks the host.
+        limits = {"p95_ms": tolerance, "statements_per_request": STATEMENT_TOLERANCE, "throughput": None}
+        for metric, limit in limits.items():
+            old, new = before[metric], now[metric]
+            change = (new - old) / old if old else 0.0
+            changes.append(f"{metric} {old:.1f} -> {new:.1f} ({change:+.0%})")
+            if limit is not None and change > limit:
+                regressions.append(f"{scenario}.{metric}")
+        print(f"  {scenario:>14}: " + ", ".join(changes))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", required=True, help="database filled by benchmarks.generate")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=50, help="requests per process per scenario")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file from an earlier --save")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative growth of p95 latency")
+    args = parser.parse_args()
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # main reads its configuration at import time; keep side channels out of the measurements.
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["INTAKE_RATE_LIMIT_DB"] = ""
+    os.environ.setdefault("METRICS_DB", "")
+    from main import app
+
+    keep, queries, deletable = load_ids(app, args.processes, args.processes * args.requests if "delete" in scenarios else 0)
+    barrier = Barrier(args.processes)
+    results_queue = Queue()
+    procs = [
+        Process(
+            target=_worker,
+            args=(i, scenarios, args.requests, {"clients": keep, "queries": queries, "deletable": deletable[i]}, barrier, results_queue),
+        )
+        for i in range(args.processes)
+    ]
+    for p in procs:
+        p.start()
+    collected = {s: [] for s in scenarios}
+    for _ in range(len(scenarios) * args.processes):
+        scenario, *sample = results_queue.get()
+        collected[scenario].append(sample)
+    for p in procs:
+        p.join()
+
+    results = {s: summarize(collected[s]) for s in scenarios}
+    print(f"{'scenario':>14} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'SQL/req':>8} {'errors':>7} {'RSS MB':>7}")
+    for scenario, r in results.items():
+        print(
+            f"{scenario:>14} {r['requests']:>9} {r['throughput']:>8.0f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+            f"{r['p99_ms']:>8.1f} {r['statements_per_request']:>8.1f} {r['errors']:>7} {r['peak_rss_mb']:>7.0f}"
+        )
+
+    if args.save:
+        meta = {
+            "commit": _git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "processes": args.processes,
+            "requests": args.requests,
+            "database": args.database_url.split(":", 1)[0],
+        }
+        with open(args.save, "w") as f:
+            json.dump({"meta": meta, "scenarios": results}, f, indent=2)
+        print(f"\nSaved {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressed: " + ", ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Fire concurrent public intake submissions at one shareable link.
+
+    python -m benchmarks.intake_load [--processes 8] [--submissions 50] [--max-uses 200]
+                                     [--double-submit 0.2] [--rate-limit 0]
+
+Runs against a throwaway SQLite database. Each process stands in for a
+gunicorn worker and posts --submissions forms to /intake/<token>; a
+--double-submit fraction of them is posted twice with the same
+idempotency key, like a double-clicked submit button. Afterwards the
+link's use_count, the recorded submissions and the clients created must
+all agree and stay within --max-uses.
+"""
+from multiprocessing import Process, Queue
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def _form(n, key):
+    return {
+        "idempotency_key": key,
+        "client_name": f"Load {n}",
+        "client_website": f"load{n}.example.com",
+        "contact_name": "Load Test",
+        "contact_email": f"load{n}@example.com",
+        "subscription_tier": "trial",
+        "comp_website[]": [f"rival{n}.example.com"],
+        "comp_name[]": ["Rival"],
+        "keywords": "alpha\nbeta\ngamma",
+        "countries[]": ["Germany"],
+        "frequency": "monthly",
+    }
+
+
+def _submitter(token, submissions, double_submit, results):
+    from main import app, db
+
+    with app.app_context():
+        db.engine.dispose(close=False)  # don't share the parent's connections
+    client = app.test_client()
+    outcomes = {"created": 0, "duplicate": 0, "link_closed": 0, "rate_limited": 0, "error": 0}
+    latencies = []
+    accepted = set()
+    for i in range(submissions):
+        n = f"{os.getpid()}-{i}"
+        key = f"k-{n}"
+        for _ in range(2 if random.random() < double_submit else 1):
+            started = time.perf_counter()
+            response = client.post(f"/intake/{token}", data=_form(n, key))
+            latencies.append(time.perf_counter() - started)
+            if response.status_code == 429:
+                outcomes["rate_limited"] += 1
+            elif response.status_code == 302:
+                outcomes["link_closed"] += 1
+            elif response.status_code == 200 and key in accepted:
+                outcomes["duplicate"] += 1
+            elif response.status_code == 200:
+                outcomes["created"] += 1
+                accepted.add(key)
+            else:
+                outcomes["error"] += 1
+    results.put((outcomes, latencies))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--submissions", type=int, default=50, help="distinct submissions per process")
+    parser.add_argument("--max-uses", type=int, default=200)
+    parser.add_argument("--double-submit", type=float, default=0.2)
+    parser.add_argument("--rate-limit", type=float, default=0, help="submissions per minute per link; 0 disables")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'load.db')}"
+    os.environ["INTAKE_RATE_LIMIT_DB"] = os.path.join(tmp, "ratelimit.db") if args.rate_limit else ""
+    os.environ["INTAKE_RATE_LIMIT_PER_MINUTE"] = str(args.rate_limit)
+    os.environ["INTAKE_RATE_LIMIT_BURST"] = str(max(1, int(args.rate_limit // 6)))
+
+    from main import app, bootstrap
+    from database.models import db, Client, IntakeSubmission, ShareableLink
+
+    with app.app_context():
+        bootstrap()
+        link = ShareableLink(token="load-test", label="Load test", max_uses=args.max_uses)
+        db.session.add(link)
+        db.session.commit()
+        link_id = link.id
+        db.engine.dispose()
+
+    results = Queue()
+    procs = [
+        Process(target=_submitter, args=("load-test", args.submissions, args.double_submit, results))
+        for _ in range(args.processes)
+    ]
+    started = time.perf_counter()
+    for p in procs:
+        p.start()
+    collected = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    totals = {}
+    latencies = []
+    for outcomes, lats in collected:
+        for name, count in outcomes.items():
+            totals[name] = totals.get(name, 0) + count
+        latencies.extend(lats)
+    latencies.sort()
+
+    with app.app_context():
+        use_count = db.session.scalar(db.select(ShareableLink.use_count).where(ShareableLink.id == link_id))
+        recorded = db.session.scalar(db.select(db.func.count()).select_from(IntakeSubmission).where(IntakeSubmission.link_id == link_id))
+        clients = db.session.scalar(db.select(db.func.count(Client.id)))
+
+    print(f"{len(latencies)} posts in {elapsed:.1f}s ({len(latencies) / elapsed:.0f}/s), "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    print("outcomes: " + ", ".join(f"{k}={v}" for k, v in totals.items()))
+    print(f"link use_count={use_count} recorded submissions={recorded} clients={clients} max_uses={args.max_uses}")
+    consistent = use_count == recorded == clients == totals["created"] and use_count <= args.max_uses
+    print("consistent" if consistent else "INCONSISTENT")
+    sys.exit(0 if consistent else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Time trend queries over a query's keyword rank history at full size.
+
+    python -m benchmarks.trends [--keywords 1000] [--countries 100] [--periods 24] [--competitors 50]
+
+Fills a throwaway TRENDS_DIR with random positions through
+append_period(), as the report worker would one report at a time, then
+times loading the history and computing share of voice, average
+position, deltas, a moving average and top movers: over the whole query
+(served from the stored per-period totals) and over a keyword and a
+country subset (scanned from the memory-mapped ranks).
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from reports.trends import append_period, deltas, load, moving_average
+
+SUBSETS = (("whole query", 1.0, 1.0), ("10% of keywords", 0.1, 1.0), ("10% of countries", 1.0, 0.1))
+
+
+def fill(root, keywords, countries, entities, periods, seed=1):
+    rng = np.random.default_rng(seed)
+    for p in range(periods):
+        positions = rng.integers(0, 40, size=(len(keywords), len(countries), len(entities)))
+        positions[positions > 20] = 0  # about half of the cells don't rank
+        cells = {
+            (keyword, country): {entities[e]: int(positions[k, c, e]) for e in np.flatnonzero(positions[k, c])}
+            for k, keyword in enumerate(keywords)
+            for c, country in enumerate(countries)
+        }
+        started = time.perf_counter()
+        append_period(root, 1, f"period-{p:03d}", keywords, countries, entities, cells)
+        print(f"  period {p + 1}/{periods} appended in {time.perf_counter() - started:.2f}s", end="\r", flush=True)
+    print()
+
+
+def timed(trends_root, keywords=None, countries=None, runs=5):
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        trends = load(trends_root, 1)
+        share = trends.share_of_voice(keywords=keywords, countries=countries)
+        trends.average_position(keywords=keywords, countries=countries)
+        deltas(share)
+        moving_average(share, 3)
+        trends.top_movers(n=20, keywords=keywords, countries=countries)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keywords", type=int, default=1000)
+    parser.add_argument("--countries", type=int, default=100)
+    parser.add_argument("--periods", type=int, default=24)
+    parser.add_argument("--competitors", type=int, default=50)
+    args = parser.parse_args()
+    keywords = [f"keyword {i}" for i in range(args.keywords)]
+    countries = [f"country {i}" for i in range(args.countries)]
+    entities = list(range(args.competitors + 1))
+
+    with tempfile.TemporaryDirectory() as root:
+        fill(root, keywords, countries, entities, args.periods)
+        size = sum(os.path.getsize(os.path.join(root, "1", name)) for name in os.listdir(os.path.join(root, "1")))
+        print(f"{args.keywords} keywords x {args.countries} countries x {len(entities)} entities x {args.periods} periods, {size / 1024 ** 2:.0f} MB")
+        print(f"{'selection':>18} {'ms':>8}")
+        for label, keyword_share, country_share in SUBSETS:
+            selection = {
+                "keywords": keywords[:int(len(keywords) * keyword_share)] if keyword_share < 1 else None,
+                "countries": countries[:int(len(countries) * country_share)] if country_share < 1 else None,
+            }
+            print(f"{label:>18} {timed(root, **selection) * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
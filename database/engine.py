@@ -0,0 +1,61 @@
+"""Database engine configuration shared by the web app, worker and scheduler.
+
+The URL comes from DATABASE_URL, so the same code runs on a local SQLite
+file or on Postgres. Under gunicorn several processes write to the same
+SQLite file, so every SQLite connection is switched to WAL (readers no
+longer block the writer, and the writer doesn't block readers), waits
+busy_timeout ms for a lock instead of failing with "database is locked",
+uses synchronous=NORMAL (safe under WAL, one fsync per checkpoint rather
+than per commit) and memory-maps up to mmap_size bytes for reads.
+"""
+from sqlalchemy import event
+import sqlite3
+
+
+def database_url(url):
+    """Normalize DATABASE_URL. Bare postgres:// URLs (as hosting providers hand them out) get the psycopg 3 driver."""
+    for prefix in ("postgres://", "postgresql://"):
+        if url.startswith(prefix):
+            return "postgresql+psycopg://" + url[len(prefix):]
+    return url
+
+
+def engine_options(url, pool_size, max_overflow, pool_timeout, pool_recycle, pre_ping):
+    """SQLALCHEMY_ENGINE_OPTIONS for `url`. In-memory SQLite uses a single shared connection, so gets no pool sizing."""
+    options = {"pool_pre_ping": pre_ping}
+    if url.startswith("sqlite") and (url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url):
+        return options
+    options.update(pool_size=pool_size, max_overflow=max_overflow, pool_timeout=pool_timeout)
+    if pool_recycle:
+        options["pool_recycle"] = pool_recycle
+    return options
+
+
+def sqlite_pragmas(config):
+    """PRAGMA name -> value applied to every new SQLite connection."""
+    return {
+        "journal_mode": config["SQLITE_JOURNAL_MODE"],
+        "synchronous": config["SQLITE_SYNCHRONOUS"],
+        "busy_timeout": config["SQLITE_BUSY_TIMEOUT_MS"],
+        "mmap_size": config["SQLITE_MMAP_SIZE"],
+    }
+
+
+def configure_engine(engine, config):
+    """Install the connect-time SQLite pragmas on `engine`. A no-op for other databases.
+
+    Call it before the engine opens its first connection.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            if value not in (None, ""):
+                cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
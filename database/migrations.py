@@ -0,0 +1,227 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+from database.models import db
+from database.search import install_search_index
+import json
+
+# Columns added after the initial schema. db.create_all() only creates missing
+# tables, so existing databases get these through ALTER TABLE on startup.
+ADDED_COLUMNS = {
+    "clients": [
+        ("deleted_at", "TIMESTAMP"),
+    ],
+    "shareable_links": [
+        ("max_uses", "INTEGER"),
+    ],
+    "queries": [
+        ("keyword_count", "INTEGER DEFAULT 0"),
+        ("country_count", "INTEGER DEFAULT 0"),
+        ("next_run_at", "TIMESTAMP"),
+    ],
+    "reports": [
+        ("worker_id", "VARCHAR(100)"),
+        ("attempts", "INTEGER DEFAULT 0"),
+        ("started_at", "TIMESTAMP"),
+        ("lease_expires_at", "TIMESTAMP"),
+        ("duration_seconds", "FLOAT"),
+        ("error", "TEXT"),
+        ("record_count", "INTEGER DEFAULT 0"),
+        ("raw_bytes", "INTEGER DEFAULT 0"),
+        ("stored_bytes", "INTEGER DEFAULT 0"),
+        ("summary", "TEXT DEFAULT '{}'"),
+    ],
+}
+
+# Indexes added to tables that already existed; create_all() skips these too.
+ADDED_INDEXES = [
+    ("clients", "ix_clients_created_at_id"),
+    ("queries", "ix_queries_auto_run_next_run_at"),
+    ("reports", "ix_reports_query_id_status"),
+    ("reports", "ix_reports_status_query_id_created_at"),
+]
+
+# Indexes the models no longer declare; dropped from existing databases on startup.
+DROPPED_INDEXES = [
+    ("reports", "ix_reports_status_created_at"),  # superseded by ix_reports_status_query_id_created_at
+]
+
+
+def add_missing_columns(engine):
+    """Add any columns from ADDED_COLUMNS that the live schema lacks. Returns the added (table, column) pairs."""
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table, columns in ADDED_COLUMNS.items():
+            if not inspector.has_table(table):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            for name, ddl in columns:
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                    added.append((table, name))
+    return added
+
+
+def add_missing_indexes(engine):
+    """Create any index from ADDED_INDEXES that the live schema lacks."""
+    inspector = inspect(engine)
+    for table, index_name in ADDED_INDEXES:
+        if not inspector.has_table(table):
+            continue
+        if index_name in {ix["name"] for ix in inspector.get_indexes(table)}:
+            continue
+        index = next(ix for ix in db.metadata.tables[table].indexes if ix.name == index_name)
+        index.create(bind=engine)
+
+
+def drop_obsolete_indexes(engine):
+    """Drop any index from DROPPED_INDEXES that the live schema still has."""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, index_name in DROPPED_INDEXES:
+            if inspector.has_table(table) and index_name in {ix["name"] for ix in inspector.get_indexes(table)}:
+                conn.execute(text(f"DROP INDEX {index_name}"))
+
+
+def backfill_query_counts(engine, batch_size=500):
+    """Populate keyword_count/country_count from the JSON columns for rows created before they existed."""
+    with engine.begin() as conn:
+        rows = conn.execute(text("SELECT id, keywords, countries FROM queries")).fetchall()
+        params = [
+            {
+                "id": row.id,
+                "kw": len(json.loads(row.keywords)) if row.keywords else 0,
+                "co": len(json.loads(row.countries)) if row.countries else 0,
+            }
+            for row in rows
+        ]
+        stmt = text("UPDATE queries SET keyword_count = :kw, country_count = :co WHERE id = :id")
+        for i in range(0, len(params), batch_size):
+            conn.execute(stmt, params[i:i + batch_size])
+
+
+def backfill_report_summaries(engine, batch_size=500):
+    """Fill reports.summary from each report's data header for rows created before the column existed.
+
+    Reports stored before segmented storage carry their records inside
+    data, so their counts are the lengths of those lists. Rows are read in
+    batches of `batch_size` so large legacy blobs are never all in memory.
+    """
+    stmt = text("UPDATE reports SET summary = :summary WHERE id = :id")
+    last_id = 0
+    with engine.begin() as conn:
+        while True:
+            rows = conn.execute(
+                text("SELECT id, data FROM reports WHERE id > :last ORDER BY id LIMIT :n"),
+                {"last": last_id, "n": batch_size},
+            ).fetchall()
+            if not rows:
+                break
+            params = []
+            for row in rows:
+                data = json.loads(row.data) if row.data else {}
+                summary = data.get("sections") or {
+                    name: len(data[name]) for name in ("results", "keyword_results") if isinstance(data.get(name), list)
+                }
+                competitors = data.get("competitors")
+                if isinstance(competitors, list):
+                    summary["competitors"] = len(competitors)
+                params.append({"id": row.id, "summary": json.dumps(summary)})
+            conn.execute(stmt, params)
+            last_id = rows[-1].id
+
+
+def migrate_query_terms(engine, batch_size=500):
+    """Copy legacy JSON keywords/countries into query_keywords/query_countries.
+
+    Only rows whose terms have not been copied yet are touched, so this is
+    safe to run on every start. The JSON columns are left as they were;
+    Query.set_keywords()/set_countries() empty them, so a query whose terms
+    were cleared since isn't backfilled again.
+    """
+    targets = [
+        ("keywords", "query_keywords", "keyword"),
+        ("countries", "query_countries", "country"),
+    ]
+    with engine.begin() as conn:
+        for column, table, field in targets:
+            rows = conn.execute(text(
+                f"SELECT id, {column} FROM queries q "
+                f"WHERE {column} IS NOT NULL AND {column} != '[]' "
+                f"AND NOT EXISTS (SELECT 1 FROM {table} t WHERE t.query_id = q.id)"
+            )).fetchall()
+            stmt = text(f"INSERT INTO {table} (query_id, position, {field}) VALUES (:qid, :pos, :val)")
+            params = []
+            for row in rows:
+                values = json.loads(row[1])
+                params.extend({"qid": row.id, "pos": i, "val": v} for i, v in enumerate(values))
+                if len(params) >= batch_size:
+                    conn.execute(stmt, params)
+                    params = []
+            if params:
+                conn.execute(stmt, params)
+
+
+def _missing_cascades(inspector, table):
+    """True when a model foreign key declares ON DELETE CASCADE but the live one doesn't."""
+    wanted = {
+        fk.parent.name for fk in db.metadata.tables[table].foreign_keys if (fk.ondelete or "").upper() == "CASCADE"
+    }
+    live = {
+        col
+        for fk in inspector.get_foreign_keys(table)
+        if (fk.get("options", {}).get("ondelete") or "").upper() == "CASCADE"
+        for col in fk["constrained_columns"]
+    }
+    return bool(wanted - live)
+
+
+def rebuild_foreign_keys(engine):
+    """Recreate SQLite tables whose foreign keys predate ON DELETE CASCADE.
+
+    SQLite can't alter a constraint, so each table is rebuilt the way its
+    documentation describes: create the new definition under a temporary
+    name, copy the rows, drop the old table and rename. Foreign keys are off
+    meanwhile so the drop doesn't cascade. Other databases get the cascades
+    from create_all() on a fresh schema. Returns the rebuilt table names.
+    """
+    if engine.dialect.name != "sqlite":
+        return []
+    inspector = inspect(engine)
+    tables = [t for t in db.metadata.tables if inspector.has_table(t) and _missing_cascades(inspector, t)]
+    if not tables:
+        return []
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        try:
+            for name in tables:
+                table = db.metadata.tables[name]
+                live_columns = {c["name"] for c in inspector.get_columns(name)}
+                columns = ", ".join(c.name for c in table.columns if c.name in live_columns)
+                ddl = str(CreateTable(table).compile(engine)).replace(
+                    f"CREATE TABLE {name} ", f"CREATE TABLE {name}__rebuild ", 1
+                )
+                conn.exec_driver_sql(ddl)
+                conn.exec_driver_sql(f"INSERT INTO {name}__rebuild ({columns}) SELECT {columns} FROM {name}")
+                conn.exec_driver_sql(f"DROP TABLE {name}")
+                conn.exec_driver_sql(f"ALTER TABLE {name}__rebuild RENAME TO {name}")
+                for index in table.indexes:
+                    index.create(bind=conn)
+            conn.commit()
+        finally:
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+    return tables
+
+
+def upgrade(engine):
+    """Bring an existing database up to the current model definitions."""
+    added = add_missing_columns(engine)
+    if ("queries", "keyword_count") in added or ("queries", "country_count") in added:
+        backfill_query_counts(engine)
+    if ("reports", "summary") in added:
+        backfill_report_summaries(engine)
+    rebuild_foreign_keys(engine)
+    add_missing_indexes(engine)
+    drop_obsolete_indexes(engine)
+    migrate_query_terms(engine)
+    install_search_index(engine)
@@ -1,12 +1,28 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import deferred
 from datetime import datetime
 import json
+import sqlite3
 
 db = SQLAlchemy()
 
 
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys, and so their ON DELETE CASCADE, unless enabled per connection.
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
 class Client(db.Model):
     __tablename__ = "clients"
+    __table_args__ = (
+        db.Index("ix_clients_created_at_id", "created_at", "id"),  # dashboard keyset pagination
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
@@ -16,9 +32,11 @@ class Client(db.Model):
     contact_email = db.Column(db.String(255), nullable=False)
     subscription_tier = db.Column(db.String(50), default="trial")  # trial, 6month, 1year
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime, nullable=True)  # set while a large client waits for database.purge
 
-    competitors = db.relationship("Competitor", backref="client", cascade="all, delete-orphan")
-    queries = db.relationship("Query", backref="client", cascade="all, delete-orphan")
+    # passive_deletes: child rows are removed by ON DELETE CASCADE, never loaded just to be deleted.
+    competitors = db.relationship("Competitor", backref="client", cascade="all, delete-orphan", passive_deletes=True)
+    queries = db.relationship("Query", backref="client", cascade="all, delete-orphan", passive_deletes=True)
 
     def get_social_handles(self):
         return json.loads(self.social_handles) if self.social_handles else []
@@ -31,7 +49,7 @@ class Competitor(db.Model):
     __tablename__ = "competitors"
 
     id = db.Column(db.Integer, primary_key=True)
-    client_id = db.Column(db.Integer, db.ForeignKey("clients.id"), nullable=False)
+    client_id = db.Column(db.Integer, db.ForeignKey("clients.id", ondelete="CASCADE"), nullable=False)
     name = db.Column(db.String(255), default="")
     website = db.Column(db.String(500), nullable=False)
     social_handles = db.Column(db.Text, default="[]")  # JSON list
@@ -49,41 +67,121 @@ class Competitor(db.Model):
 
 class Query(db.Model):
     __tablename__ = "queries"
+    __table_args__ = (
+        db.Index("ix_queries_auto_run_next_run_at", "auto_run", "next_run_at"),  # scheduler poll
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    client_id = db.Column(db.Integer, db.ForeignKey("clients.id"), nullable=False)
-    keywords = db.Column(db.Text, default="[]")  # JSON list, up to 1000
-    countries = db.Column(db.Text, default="[]")  # JSON list, up to 100
+    client_id = db.Column(db.Integer, db.ForeignKey("clients.id", ondelete="CASCADE"), nullable=False)
+    keywords = db.Column(db.Text, default="[]")  # legacy JSON list, superseded by query_keywords
+    countries = db.Column(db.Text, default="[]")  # legacy JSON list, superseded by query_countries
+    keyword_count = db.Column(db.Integer, default=0)  # cached len(keywords)
+    country_count = db.Column(db.Integer, default=0)  # cached len(countries)
     period_start = db.Column(db.Date, nullable=True)
     period_end = db.Column(db.Date, nullable=True)
     frequency = db.Column(db.String(50), default="monthly")  # monthly, fortnightly, custom
     auto_run = db.Column(db.Boolean, default=False)
+    next_run_at = db.Column(db.DateTime, nullable=True)  # next auto-run due time, None when not scheduled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    reports = db.relationship("Report", backref="query", cascade="all, delete-orphan")
+    reports = db.relationship("Report", backref="query", cascade="all, delete-orphan", passive_deletes=True)
+    keyword_rows = db.relationship("QueryKeyword", order_by="QueryKeyword.position", cascade="all, delete-orphan", passive_deletes=True)
+    country_rows = db.relationship("QueryCountry", order_by="QueryCountry.position", cascade="all, delete-orphan", passive_deletes=True)
 
     def get_keywords(self):
-        return json.loads(self.keywords) if self.keywords else []
+        return [row.keyword for row in self.keyword_rows]
 
     def set_keywords(self, kw_list):
-        self.keywords = json.dumps(kw_list)
+        """Replace this query's keywords with one DELETE and one executemany INSERT."""
+        self._replace_terms(QueryKeyword, "keyword", "keywords", kw_list)
+        self.keyword_count = len(kw_list)
 
     def get_countries(self):
-        return json.loads(self.countries) if self.countries else []
+        return [row.country for row in self.country_rows]
 
     def set_countries(self, countries_list):
-        self.countries = json.dumps(countries_list)
+        """Replace this query's countries with one DELETE and one executemany INSERT."""
+        self._replace_terms(QueryCountry, "country", "countries", countries_list)
+        self.country_count = len(countries_list)
+
+    def _replace_terms(self, model, field, legacy_column, values):
+        # Empty the legacy JSON too, or migrate_query_terms would copy it back over a cleared list.
+        setattr(self, legacy_column, "[]")
+        if self.id is None:
+            db.session.add(self)
+            db.session.flush()
+        db.session.execute(db.delete(model).where(model.query_id == self.id))
+        if values:
+            db.session.execute(
+                db.insert(model),
+                [{"query_id": self.id, "position": i, field: v} for i, v in enumerate(values)],
+            )
+        db.session.expire(self, [f"{field}_rows"])
+
+
+class QueryKeyword(db.Model):
+    __tablename__ = "query_keywords"
+    __table_args__ = (
+        db.Index("ix_query_keywords_keyword_query", "keyword", "query_id"),  # "who tracks keyword X"
+    )
+
+    query_id = db.Column(db.Integer, db.ForeignKey("queries.id", ondelete="CASCADE"), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)  # preserves submitted order
+    keyword = db.Column(db.String(500), nullable=False)
+
+
+class QueryCountry(db.Model):
+    __tablename__ = "query_countries"
+    __table_args__ = (
+        db.Index("ix_query_countries_country_query", "country", "query_id"),
+    )
+
+    query_id = db.Column(db.Integer, db.ForeignKey("queries.id", ondelete="CASCADE"), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    country = db.Column(db.String(100), nullable=False)
 
 
 class Report(db.Model):
     __tablename__ = "reports"
+    __table_args__ = (
+        # worker claim: covers the pending scan and the join to the client's tier
+        db.Index("ix_reports_status_query_id_created_at", "status", "query_id", "created_at"),
+        db.Index("ix_reports_query_id_status", "query_id", "status"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    query_id = db.Column(db.Integer, db.ForeignKey("queries.id"), nullable=False)
+    query_id = db.Column(db.Integer, db.ForeignKey("queries.id", ondelete="CASCADE"), nullable=False)
     status = db.Column(db.String(50), default="pending")  # pending, running, complete, failed
-    data = db.Column(db.Text, default="{}")  # JSON blob with all scraped results
+    data = deferred(db.Column(db.Text, default="{}"))  # JSON header: what the report covers plus stats; records live in report_segments
     generated_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    worker_id = db.Column(db.String(100), nullable=True)  # host:pid of the worker holding the claim
+    attempts = db.Column(db.Integer, default=0)
+    started_at = db.Column(db.DateTime, nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)  # stale running rows are reclaimed after this
+    duration_seconds = db.Column(db.Float, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    record_count = db.Column(db.Integer, default=0)
+    raw_bytes = db.Column(db.Integer, default=0)  # uncompressed NDJSON size of all segments
+    stored_bytes = db.Column(db.Integer, default=0)  # compressed size on disk
+    summary = db.Column(db.Text, default="{}")  # JSON row counts per section, small enough for list pages
+
+    segments = db.relationship("ReportSegment", order_by="ReportSegment.seq", cascade="all, delete-orphan", passive_deletes=True)
+
+    def get_summary(self):
+        return json.loads(self.summary) if self.summary else {}
+
+
+class ReportSegment(db.Model):
+    """A compressed chunk of a report's result records (see reports/storage.py)."""
+    __tablename__ = "report_segments"
+
+    report_id = db.Column(db.Integer, db.ForeignKey("reports.id", ondelete="CASCADE"), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True)
+    section = db.Column(db.String(50), nullable=False)  # results, keyword_results, ...
+    record_count = db.Column(db.Integer, nullable=False)
+    raw_bytes = db.Column(db.Integer, nullable=False)
+    payload = deferred(db.Column(db.LargeBinary, nullable=False))  # zlib-compressed NDJSON
 
 
 class SubscriptionTier(db.Model):
@@ -114,5 +212,27 @@ class ShareableLink(db.Model):
     label = db.Column(db.String(255), default="Intake Form")
     is_active = db.Column(db.Boolean, default=True)
     use_count = db.Column(db.Integer, default=0)
+    max_uses = db.Column(db.Integer, nullable=True)  # None for unlimited
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=True)
+
+
+class IntakeSubmission(db.Model):
+    """Idempotency key of an accepted intake submission, so a resubmitted form maps back to the same client."""
+    __tablename__ = "intake_submissions"
+    __table_args__ = (
+        db.Index("ix_intake_submissions_created_at", "created_at"),  # expiry sweep
+    )
+
+    idempotency_key = db.Column(db.String(64), primary_key=True)
+    client_id = db.Column(db.Integer, db.ForeignKey("clients.id", ondelete="CASCADE"), nullable=False)
+    link_id = db.Column(db.Integer, db.ForeignKey("shareable_links.id", ondelete="SET NULL"), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class Counter(db.Model):
+    """Running totals shown on the dashboard, maintained alongside the writes that change them, and cache versions."""
+    __tablename__ = "counters"
+
+    name = db.Column(db.String(50), primary_key=True)  # clients, competitors, queries, reports, reference_data
+    value = db.Column(db.Integer, default=0, nullable=False)
@@ -0,0 +1,74 @@
+from datetime import datetime
+from sqlalchemy import tuple_
+
+
+def encode_cursor(created_at, row_id):
+    return f"{created_at.isoformat()}_{row_id}"
+
+
+def decode_cursor(cursor):
+    """Parse a cursor produced by encode_cursor. Returns (created_at, id) or None if malformed."""
+    if not cursor:
+        return None
+    try:
+        stamp, row_id = cursor.rsplit("_", 1)
+        return datetime.fromisoformat(stamp), int(row_id)
+    except ValueError:
+        return None
+
+
+class KeysetPage:
+    """One page of rows ordered newest first on (created_at, id)."""
+
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor  # older rows
+        self.prev_cursor = prev_cursor  # newer rows
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, model, per_page, before=None, after=None):
+    """Page `query` newest-first by (created_at, id) without OFFSET.
+
+    `before` returns the page of rows older than the cursor, `after` the page
+    of rows newer than it. Each page costs one indexed range scan of
+    per_page + 1 rows no matter how deep into the listing it is.
+    """
+    key = tuple_(model.created_at, model.id)
+    before_key = decode_cursor(before)
+    after_key = decode_cursor(after)
+
+    if after_key:
+        rows = (
+            query.filter(key > after_key)
+            .order_by(model.created_at.asc(), model.id.asc())
+            .limit(per_page + 1)
+            .all()
+        )
+        more_newer = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        more_older = True
+    else:
+        if before_key:
+            query = query.filter(key < before_key)
+        rows = (
+            query.order_by(model.created_at.desc(), model.id.desc())
+            .limit(per_page + 1)
+            .all()
+        )
+        more_older = len(rows) > per_page
+        items = rows[:per_page]
+        more_newer = before_key is not None
+
+    if not items:
+        return KeysetPage([], None, None)
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if more_older else None
+    prev_cursor = encode_cursor(items[0].created_at, items[0].id) if more_newer else None
+    return KeysetPage(items, next_cursor, prev_cursor)
@@ -0,0 +1,101 @@
+"""Set-based client deletion.
+
+Every table below clients references its parent with ON DELETE CASCADE
+(enforced on SQLite by the connect hook in database/models.py), so
+deleting a clients row removes its competitors, queries, query terms,
+reports and report segments inside the database, without loading any of
+them into the session.
+
+Clients with more than PURGE_BACKGROUND_THRESHOLD reports are marked
+(Client.deleted_at) and hidden straight away instead. purge_marked(),
+run by the scheduler, then deletes their reports in batches before the
+client row, so no single statement holds the write lock for long.
+
+Both paths finally remove the client's keyword rank history
+(reports/trends.py), which lives in files rather than tables.
+
+The scheduler also sweeps idempotency keys of old intake submissions
+(see intake/pipeline.py) once they are too old to matter.
+"""
+from datetime import datetime, timedelta
+import logging
+
+from flask import current_app
+from sqlalchemy import func
+
+from database.models import db, Client, Competitor, Query, Report, IntakeSubmission
+from database.stats import bump_counters
+from reports.trends import remove as remove_trends
+
+log = logging.getLogger(__name__)
+
+
+def _remove_trends(query_ids):
+    root = current_app.config.get("TRENDS_DIR")
+    if root and query_ids:
+        remove_trends(root, query_ids)
+
+
+def client_totals(client_id):
+    """Rows owned by a client, keyed like the dashboard counters."""
+    query_ids = db.select(Query.id).where(Query.client_id == client_id)
+    return {
+        "clients": 1,
+        "competitors": db.session.scalar(db.select(func.count(Competitor.id)).where(Competitor.client_id == client_id)) or 0,
+        "queries": db.session.scalar(db.select(func.count(Query.id)).where(Query.client_id == client_id)) or 0,
+        "reports": db.session.scalar(db.select(func.count(Report.id)).where(Report.query_id.in_(query_ids))) or 0,
+    }
+
+
+def delete_client(client_id, background_threshold=None):
+    """Delete a client and everything under it. Returns True if deleted now, False if left to purge_marked().
+
+    With `background_threshold` set, a client owning more reports than
+    that is only marked as deleted; it disappears from every page at once
+    and the counters are adjusted immediately either way.
+    """
+    totals = client_totals(client_id)
+    bump_counters(**{name: -count for name, count in totals.items()})
+    if background_threshold is not None and totals["reports"] > background_threshold:
+        db.session.execute(db.update(Client).where(Client.id == client_id).values(deleted_at=datetime.utcnow()))
+        db.session.execute(
+            db.update(Query).where(Query.client_id == client_id).values(auto_run=False, next_run_at=None)
+        )
+        db.session.commit()
+        return False
+    query_ids = db.session.scalars(db.select(Query.id).where(Query.client_id == client_id)).all()
+    db.session.execute(db.delete(Client).where(Client.id == client_id))
+    db.session.commit()
+    _remove_trends(query_ids)
+    return True
+
+
+def purge_marked(batch_size=200):
+    """Finish deleting clients marked by delete_client(). Returns how many clients were removed."""
+    purged = 0
+    client_ids = db.session.scalars(db.select(Client.id).where(Client.deleted_at.is_not(None))).all()
+    for client_id in client_ids:
+        query_ids = db.select(Query.id).where(Query.client_id == client_id)
+        while True:
+            report_ids = db.session.scalars(
+                db.select(Report.id).where(Report.query_id.in_(query_ids)).limit(batch_size)
+            ).all()
+            if not report_ids:
+                break
+            db.session.execute(db.delete(Report).where(Report.id.in_(report_ids)))
+            db.session.commit()
+        doomed_queries = db.session.scalars(query_ids).all()
+        db.session.execute(db.delete(Client).where(Client.id == client_id))
+        db.session.commit()
+        _remove_trends(doomed_queries)
+        purged += 1
+        log.info("Purged client %d", client_id)
+    return purged
+
+
+def expire_intake_keys(max_age_seconds):
+    """Forget intake idempotency keys older than `max_age_seconds`. Returns how many were removed."""
+    cutoff = datetime.utcnow() - timedelta(seconds=max_age_seconds)
+    result = db.session.execute(db.delete(IntakeSubmission).where(IntakeSubmission.created_at < cutoff))
+    db.session.commit()
+    return result.rowcount
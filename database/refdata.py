@@ -0,0 +1,105 @@
+"""In-process cache of reference data: subscription tiers and countries.
+
+Tiers change a few times a year but are read on every form render and
+every intake validation. Each worker keeps an immutable snapshot of them,
+with features already parsed, and of the country <option> list rendered
+once. The snapshot is stamped with the "reference_data" row of the
+counters table:
+
+- Writes to subscription_tiers call invalidate() in their transaction,
+  which bumps that row and drops this worker's snapshot.
+- Other workers re-read the row at most once every
+  REFERENCE_DATA_RECHECK_SECONDS and reload when it has moved. Between
+  checks, reference_data() doesn't touch the database at all.
+"""
+from dataclasses import dataclass
+import json
+import threading
+import time
+
+from flask import current_app
+from markupsafe import Markup, escape
+
+from database.models import db, Counter, SubscriptionTier
+from database.stats import bump_counters
+from countries import COUNTRIES
+
+VERSION_COUNTER = "reference_data"
+
+
+@dataclass(frozen=True)
+class Tier:
+    id: int
+    name: str
+    slug: str
+    price: float
+    duration_months: int
+    features: tuple
+    is_active: bool
+    sort_order: int
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    version: int
+    tiers: tuple  # every tier, in sort order
+    active_tiers: tuple
+    active_slugs: frozenset
+    countries: tuple
+    country_options: Markup  # <option> per country, for the intake selects
+
+
+COUNTRY_OPTIONS = Markup("".join(f'<option value="{escape(c)}">{escape(c)}</option>' for c in COUNTRIES))
+
+_snapshot = None
+_checked_at = float("-inf")
+_lock = threading.Lock()
+
+
+def _load(version):
+    tiers = tuple(
+        Tier(
+            id=t.id,
+            name=t.name,
+            slug=t.slug,
+            price=t.price or 0.0,
+            duration_months=t.duration_months or 0,
+            features=tuple(json.loads(t.features) if t.features else ()),
+            is_active=bool(t.is_active),
+            sort_order=t.sort_order or 0,
+        )
+        for t in db.session.scalars(db.select(SubscriptionTier).order_by(SubscriptionTier.sort_order, SubscriptionTier.id))
+    )
+    active = tuple(t for t in tiers if t.is_active)
+    return ReferenceData(
+        version=version,
+        tiers=tiers,
+        active_tiers=active,
+        active_slugs=frozenset(t.slug for t in active),
+        countries=tuple(COUNTRIES),
+        country_options=COUNTRY_OPTIONS,
+    )
+
+
+def reference_data():
+    """The current ReferenceData snapshot, reloaded if another worker has changed it."""
+    global _snapshot, _checked_at
+    now = time.monotonic()
+    snapshot = _snapshot
+    if snapshot is not None and now - _checked_at < current_app.config["REFERENCE_DATA_RECHECK_SECONDS"]:
+        return snapshot
+    with _lock:
+        # Version first: a write landing between the two reads leaves an old
+        # version on new tiers, which only costs an extra reload.
+        version = db.session.scalar(db.select(Counter.value).where(Counter.name == VERSION_COUNTER)) or 0
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = _load(version)
+        _checked_at = now
+        return _snapshot
+
+
+def invalidate():
+    """Mark reference data as changed, in the caller's transaction. Call before committing a tier write."""
+    global _checked_at
+    bump_counters(**{VERSION_COUNTER: 1})
+    _checked_at = float("-inf")  # this worker reloads on its next read
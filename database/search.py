@@ -0,0 +1,198 @@
+"""Full-text search over clients, competitors and tracked keywords.
+
+On SQLite each searchable table has an FTS5 shadow index kept in sync by
+triggers, so every write path (the routes, bulk imports, set_keywords(),
+ON DELETE CASCADE and the background purge) updates it without any code
+knowing about search:
+
+    clients_fts      name, website, contact_email    rowid = clients.id
+    competitors_fts  name, website                   rowid = competitors.id
+    keywords_fts     keyword                         rowid = query_id * KEYWORD_SLOTS + position
+
+install_search_index() creates the tables and triggers and fills them
+from existing rows; upgrade() runs it. Words of the search text must all
+match, and the last one matches as a prefix, so "acme.c" finds
+"jane@acme.com". Results are best-first by FTS5 rank, except for a term
+so common that ranking all its matches would take seconds (see
+RANK_ALL_MATCHES). Other databases, or SQLite builds without FTS5, fall
+back to LIKE scans over the same columns.
+"""
+import logging
+import re
+
+from sqlalchemy import inspect, or_, text
+from sqlalchemy.exc import OperationalError
+
+from database.models import db, Client, Competitor, Query, QueryKeyword
+
+log = logging.getLogger(__name__)
+
+KEYWORD_SLOTS = 1 << 20  # keyword positions per query in keywords_fts rowids
+MIN_QUERY_LENGTH = 2
+# FTS5 scores every match before sorting (a few microseconds each), which
+# takes seconds for a prefix like "k" over a million keywords. An index with
+# at most RANK_ALL_MATCHES matches is ranked in full; past that only its
+# RANKED_CANDIDATES newest live matches are, and search() lists it as partial.
+RANK_ALL_MATCHES = 20000
+RANKED_CANDIDATES = 1000
+
+# table -> (source table, indexed columns, rowid expression over a source row)
+INDEXES = {
+    "clients_fts": ("clients", ("name", "website", "contact_email"), "{row}.id"),
+    "competitors_fts": ("competitors", ("name", "website"), "{row}.id"),
+    "keywords_fts": ("query_keywords", ("keyword",), f"{{row}}.query_id * {KEYWORD_SLOTS} + {{row}}.position"),
+}
+
+_available = None
+
+
+def _ddl(fts, source, columns, rowid):
+    cols = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    new_rowid, old_rowid = rowid.format(row="new"), rowid.format(row="old")
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {fts} (rowid, {cols}) VALUES ({new_rowid}, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {source} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = {old_rowid}; "
+        f"INSERT INTO {fts} (rowid, {cols}) VALUES ({new_rowid}, {new_values}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = {old_rowid}; END",
+    ]
+
+
+def install_search_index(engine):
+    """Create missing FTS5 tables and their triggers on SQLite. Returns the index tables created and filled."""
+    if engine.dialect.name != "sqlite":
+        return []
+    inspector = inspect(engine)
+    created = []
+    with engine.begin() as conn:
+        for fts, (source, columns, rowid) in INDEXES.items():
+            create_table, *triggers = _ddl(fts, source, columns, rowid)
+            if not inspector.has_table(fts):
+                try:
+                    conn.exec_driver_sql(create_table)
+                except OperationalError:
+                    log.warning("This SQLite build has no FTS5; search falls back to LIKE scans")
+                    return created
+                cols = ", ".join(columns)
+                conn.exec_driver_sql(
+                    f"INSERT INTO {fts} (rowid, {cols}) SELECT {rowid.format(row=source)}, {cols} FROM {source}"
+                )
+                created.append(fts)
+            # Always: rebuild_foreign_keys() drops a table's triggers along with it.
+            for trigger in triggers:
+                conn.exec_driver_sql(trigger)
+    return created
+
+
+def fts_available():
+    """Whether this database has the FTS5 indexes (checked once per process)."""
+    global _available
+    if _available is None:
+        _available = db.engine.dialect.name == "sqlite" and inspect(db.engine).has_table("keywords_fts")
+    return _available
+
+
+def words(q):
+    """Whitespace-separated words of a search, each split into the alphanumeric tokens FTS5 indexes."""
+    return [tokens for tokens in (re.findall(r"\w+", w) for w in q.split()) if tokens]
+
+
+def match_expression(q):
+    """FTS5 MATCH text: one phrase per word, all required, the last one a prefix. None if nothing is searchable."""
+    phrases = ['"' + " ".join(tokens) + '"' for tokens in words(q)]
+    if not phrases:
+        return None
+    phrases[-1] += "*"
+    return " ".join(phrases)
+
+
+def _too_many_matches(fts, match):
+    probe = f"SELECT count(*) FROM (SELECT rowid FROM {fts} WHERE {fts} MATCH :match LIMIT {RANK_ALL_MATCHES + 1})"
+    return db.session.execute(text(probe), {"match": match}).scalar() > RANK_ALL_MATCHES
+
+
+def _best(fts, columns, joins, params):
+    """Best live matches in one index as (rows, partial). `joins` must bring in live clients as `c`."""
+    partial = _too_many_matches(fts, params["match"])
+    matches = (
+        f"SELECT {', '.join(f'{expr} AS {name}' for name, expr in columns)}, {fts}.rank AS rank "
+        f"FROM {fts} {joins} WHERE {fts} MATCH :match AND c.deleted_at IS NULL"
+    )
+    if partial:
+        matches += f" ORDER BY {fts}.rowid DESC LIMIT {RANKED_CANDIDATES}"
+    rows = db.session.execute(text(
+        f"SELECT {', '.join(name for name, _ in columns)} FROM ({matches}) ORDER BY rank LIMIT :n"
+    ), params).all()
+    return rows, partial
+
+
+def _fts_search(match, limit):
+    params = {"match": match, "n": limit}
+    clients = _best(
+        "clients_fts",
+        [("id", "c.id"), ("name", "c.name"), ("website", "c.website"), ("contact_email", "c.contact_email")],
+        "JOIN clients c ON c.id = clients_fts.rowid",
+        params,
+    )
+    competitors = _best(
+        "competitors_fts",
+        [("id", "p.id"), ("client_id", "p.client_id"), ("name", "p.name"), ("website", "p.website")],
+        "JOIN competitors p ON p.id = competitors_fts.rowid JOIN clients c ON c.id = p.client_id",
+        params,
+    )
+    keywords = _best(
+        "keywords_fts",
+        [("keyword", "keywords_fts.keyword"), ("query_id", "q.id"), ("client_id", "q.client_id")],
+        f"JOIN queries q ON q.id = keywords_fts.rowid / {KEYWORD_SLOTS} JOIN clients c ON c.id = q.client_id",
+        params,
+    )
+    return clients, competitors, keywords
+
+
+def _like_search(q, limit):
+    terms = [" ".join(tokens) for tokens in words(q)]
+    live = Client.deleted_at.is_(None)
+
+    def every_term(*columns):
+        return [or_(*(c.ilike(f"%{t}%") for c in columns)) for t in terms]
+
+    clients = db.session.execute(
+        db.select(Client.id, Client.name, Client.website, Client.contact_email)
+        .where(live, *every_term(Client.name, Client.website, Client.contact_email)).limit(limit)
+    ).all()
+    competitors = db.session.execute(
+        db.select(Competitor.id, Competitor.client_id, Competitor.name, Competitor.website)
+        .join(Client, Client.id == Competitor.client_id)
+        .where(live, *every_term(Competitor.name, Competitor.website)).limit(limit)
+    ).all()
+    keywords = db.session.execute(
+        db.select(QueryKeyword.keyword, Query.id.label("query_id"), Query.client_id)
+        .join(Query, Query.id == QueryKeyword.query_id).join(Client, Client.id == Query.client_id)
+        .where(live, *every_term(QueryKeyword.keyword)).limit(limit)
+    ).all()
+    # LIKE scans don't rank: a section that filled its limit holds arbitrary matches, not the best ones.
+    return tuple((rows, len(rows) >= limit) for rows in (clients, competitors, keywords))
+
+
+def search(q, limit=20):
+    """Best matches for `q`, up to `limit` each, as {"clients": [...], "competitors": [...], "keywords": [...],
+    "partial": [...]}.
+
+    "partial" names the sections whose matches were too many to rank in
+    full: they hold the best of the newest RANKED_CANDIDATES matches, not
+    necessarily the best overall, and a longer search narrows them down.
+    """
+    match = match_expression(q) if len(q.strip()) >= MIN_QUERY_LENGTH else None
+    if match is None:
+        return {"clients": [], "competitors": [], "keywords": [], "partial": []}
+    sections = dict(zip(
+        ("clients", "competitors", "keywords"),
+        _fts_search(match, limit) if fts_available() else _like_search(q, limit),
+    ))
+    results = {name: [dict(row._mapping) for row in rows] for name, (rows, _) in sections.items()}
+    results["partial"] = [name for name, (_, partial) in sections.items() if partial]
+    return results
@@ -0,0 +1,113 @@
+from sqlalchemy import func
+from database.models import db, Client, Competitor, Query, QueryKeyword, QueryCountry, Report, Counter
+
+COUNTED_MODELS = {
+    "clients": Client,
+    "competitors": Competitor,
+    "queries": Query,
+    "reports": Report,
+}
+
+# Rows of the counters table that version cached data instead of counting rows (database/refdata.py)
+VERSION_COUNTERS = ("reference_data",)
+
+
+def _count_by_client(column, id_column, client_ids):
+    stmt = db.session.query(column, func.count(id_column))
+    if client_ids is not None:
+        if not client_ids:
+            return {}
+        stmt = stmt.filter(column.in_(client_ids))
+    return dict(stmt.group_by(column).all())
+
+
+def competitor_counts(client_ids=None):
+    """Map client_id -> number of competitors, in one GROUP BY statement. None counts every client."""
+    return _count_by_client(Competitor.client_id, Competitor.id, client_ids)
+
+
+def query_counts(client_ids=None):
+    """Map client_id -> number of saved queries, in one GROUP BY statement. None counts every client."""
+    return _count_by_client(Query.client_id, Query.id, client_ids)
+
+
+def report_stats(query_ids):
+    """Map query_id -> (number of reports, status of the newest report), in two statements."""
+    if not query_ids:
+        return {}
+    rows = (
+        db.session.query(Report.query_id, func.count(Report.id), func.max(Report.id))
+        .filter(Report.query_id.in_(query_ids))
+        .group_by(Report.query_id)
+        .all()
+    )
+    latest = dict(
+        db.session.query(Report.id, Report.status).filter(Report.id.in_([row[2] for row in rows])).all()
+    )
+    return {query_id: (count, latest.get(newest_id)) for query_id, count, newest_id in rows}
+
+
+def clients_tracking(keyword, country=None):
+    """Clients with a query tracking `keyword` (optionally in `country`), via the term indexes."""
+    query_ids = db.select(QueryKeyword.query_id).where(QueryKeyword.keyword == keyword)
+    if country is not None:
+        query_ids = query_ids.where(QueryKeyword.query_id.in_(
+            db.select(QueryCountry.query_id).where(QueryCountry.country == country)
+        ))
+    return Client.query.filter(
+        Client.id.in_(db.select(Query.client_id).where(Query.id.in_(query_ids)))
+    ).all()
+
+
+def keyword_usage(limit=20):
+    """Most-tracked keywords as (keyword, number of queries), computed in SQL."""
+    return (
+        db.session.query(QueryKeyword.keyword, func.count(QueryKeyword.query_id))
+        .group_by(QueryKeyword.keyword)
+        .order_by(func.count(QueryKeyword.query_id).desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def recount():
+    """Rebuild every counter from a full COUNT(*). Only needed on first run or to repair drift."""
+    for name, model in COUNTED_MODELS.items():
+        value = db.session.query(func.count(model.id)).scalar() or 0
+        counter = db.session.get(Counter, name)
+        if counter is None:
+            db.session.add(Counter(name=name, value=value))
+        else:
+            counter.value = value
+    db.session.commit()
+
+
+def seed_counters():
+    """Initialise the counters table if it is empty."""
+    names = set(db.session.scalars(db.select(Counter.name)))
+    if not names.issuperset(COUNTED_MODELS):
+        recount()
+    for name in VERSION_COUNTERS:
+        if name not in names:
+            db.session.add(Counter(name=name, value=0))
+    db.session.commit()
+
+
+def bump_counters(**deltas):
+    """Add deltas to named counters in the caller's transaction, e.g. bump_counters(clients=1, queries=1).
+
+    Each is a single `UPDATE ... SET value = value + :delta`, so concurrent
+    workers never lose increments.
+    """
+    for name, delta in deltas.items():
+        if delta:
+            db.session.execute(
+                db.update(Counter).where(Counter.name == name).values(value=Counter.value + delta)
+            )
+
+
+def get_counters():
+    """Return {name: value} for every dashboard counter in one statement."""
+    totals = {name: 0 for name in COUNTED_MODELS}
+    totals.update(dict(db.session.query(Counter.name, Counter.value).filter(Counter.name.in_(COUNTED_MODELS)).all()))
+    return totals
@@ -0,0 +1,14 @@
+# Read by gunicorn from the working directory: gunicorn --bind 0.0.0.0:5000 main:app
+# Run `flask --app main bootstrap` once per deploy first; workers never create or migrate tables.
+
+# Import the app once in the master and fork warmed workers from it. create_app() opens no
+# database connections, so there is nothing for the workers to share by accident.
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Should anything open a connection in the master, never let two processes share it.
+    from main import app, db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -0,0 +1,162 @@
+"""Bulk client import from CSV or NDJSON.
+
+    python -m intake.bulk clients.csv [--format csv|ndjson] [--batch-size 1000]
+
+The same import is available over HTTP as POST /clients/import.
+
+Each row is one client with its competitors, keywords, countries and
+reporting settings:
+
+    name, website, contact_name, contact_email, subscription_tier,
+    social_handles, competitors, keywords, countries, frequency,
+    auto_run, period_start, period_end
+
+In CSV, list cells are separated by ";" (keywords may also use newlines).
+social_handles are "platform:handle" pairs, and competitors are websites
+or a JSON list of competitor objects. NDJSON rows use real lists and
+objects instead.
+
+Rows are validated as they stream in, by the same rules as the intake
+forms (intake/pipeline.py). Valid rows are written BATCH_SIZE at a time,
+with one executemany INSERT per table and one transaction per batch. A row that fails
+validation, or that the database rejects, is reported with its row
+number, and the rest of the import carries on.
+"""
+from datetime import datetime
+import argparse
+import csv
+import io
+import json
+import sys
+
+from sqlalchemy.exc import SQLAlchemyError
+from database.models import db
+from intake.pipeline import active_tiers, clean_row, write_clients
+
+FORMATS = ("csv", "ndjson")
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000  # later failures are counted but not listed
+
+
+class ImportResult:
+    def __init__(self):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []  # [{"row": n, "errors": [...]}], at most MAX_REPORTED_ERRORS
+
+    def fail(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "errors": errors})
+
+    def to_dict(self):
+        return {"imported": self.imported, "failed": self.failed, "errors": self.errors}
+
+
+def detect_format(filename="", mimetype=""):
+    """Guess csv/ndjson from an upload's filename or content type. Returns None if unknown."""
+    filename = (filename or "").lower()
+    if filename.endswith((".ndjson", ".jsonl")) or "ndjson" in (mimetype or ""):
+        return "ndjson"
+    if filename.endswith(".csv") or (mimetype or "") == "text/csv":
+        return "csv"
+    return None
+
+
+def read_rows(stream, fmt):
+    """Yield (row_number, record or None, parse error or None) from a binary stream."""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="" if fmt == "csv" else None)
+    if fmt == "csv":
+        for number, record in enumerate(csv.DictReader(text), start=1):
+            yield number, record, None
+        return
+    number = 0
+    for line in text:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield number, None, f"invalid JSON: {exc}"
+            continue
+        if not isinstance(record, dict):
+            yield number, None, "each line must be a JSON object"
+            continue
+        yield number, record, None
+
+
+def _db_error(exc):
+    return f"database error: {exc.__class__.__name__}: {str(exc.orig if hasattr(exc, 'orig') else exc).splitlines()[0]}"
+
+
+def _flush(batch, result):
+    """Commit a batch. If the database rejects it, retry row by row so only the bad rows fail."""
+    if not batch:
+        return
+    try:
+        write_clients([row for _, row in batch])
+        db.session.commit()
+        result.imported += len(batch)
+        return
+    except SQLAlchemyError as exc:
+        db.session.rollback()
+        if len(batch) == 1:
+            result.fail(batch[0][0], [_db_error(exc)])
+            return
+    for number, row in batch:
+        try:
+            write_clients([row])
+            db.session.commit()
+            result.imported += 1
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            result.fail(number, [_db_error(exc)])
+
+
+def import_rows(rows, batch_size=BATCH_SIZE):
+    """Validate and write (row_number, record, parse_error) tuples from read_rows(). Returns an ImportResult."""
+    result = ImportResult()
+    tiers = active_tiers()
+    batch = []
+    for number, record, parse_error in rows:
+        if parse_error:
+            result.fail(number, [parse_error])
+            continue
+        row, errors = clean_row(record, tiers)
+        if errors:
+            result.fail(number, errors)
+            continue
+        batch.append((number, row))
+        if len(batch) >= batch_size:
+            _flush(batch, result)
+            batch = []
+    _flush(batch, result)
+    return result
+
+
+def import_stream(stream, fmt, batch_size=BATCH_SIZE):
+    """Import every row of a binary CSV or NDJSON stream."""
+    return import_rows(read_rows(stream, fmt), batch_size)
+
+
+if __name__ == "__main__":
+    from main import app
+
+    parser = argparse.ArgumentParser(description="Import clients from a CSV or NDJSON file.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    fmt = args.format or detect_format(args.path)
+    if fmt is None:
+        parser.error("can't tell the format from the file name; pass --format")
+
+    with app.app_context(), open(args.path, "rb") as f:
+        started = datetime.utcnow()
+        result = import_stream(f, fmt, args.batch_size)
+    elapsed = (datetime.utcnow() - started).total_seconds()
+    print(f"Imported {result.imported} clients in {elapsed:.1f}s; {result.failed} rows failed.")
+    for error in result.errors:
+        print(f"  row {error['row']}: {'; '.join(error['errors'])}")
+    sys.exit(1 if result.failed else 0)
@@ -0,0 +1,99 @@
+"""Rendered, pre-compressed copies of the intake form pages.
+
+The intake forms are long templates whose output depends only on the
+templates themselves, the reference data (database/refdata.py) and, for
+public links, the token. Each worker renders a page once per
+(template version, reference data version) and keeps the body together
+with its gzip and, when the optional `brotli` package is installed,
+brotli encodings.
+
+Responses carry a strong ETag per encoding and are revalidated with
+If-None-Match, so a repeat visitor gets a bodiless 304. Every worker
+renders the same bytes and compresses them deterministically, so the
+ETags agree across workers. Pages with pending flash messages are
+rendered normally and never cached. Nothing user-specific may go into a
+cached page: the forms' idempotency key is filled in by the browser.
+"""
+from collections import OrderedDict
+import gzip
+import hashlib
+import threading
+
+from flask import current_app, render_template, request, session
+
+from database.refdata import reference_data
+
+try:
+    import brotli
+except ImportError:  # pip install balthazaar[brotli]
+    brotli = None
+
+
+class Page:
+    def __init__(self, body):
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.bodies = {"identity": body, "gzip": gzip.compress(body, 9, mtime=0)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body, quality=11)
+
+
+_pages = OrderedDict()  # key -> (stamp, Page), least recently used first
+_lock = threading.Lock()
+_template_stamp = None
+
+
+def template_version():
+    """Digest of every template's source; recomputed per call while templates auto-reload."""
+    global _template_stamp
+    env = current_app.jinja_env
+    if _template_stamp is None or env.auto_reload:
+        digest = hashlib.sha256()
+        for name in sorted(env.list_templates()):
+            digest.update(name.encode())
+            digest.update(env.loader.get_source(env, name)[0].encode())
+        _template_stamp = digest.hexdigest()[:16]
+    return _template_stamp
+
+
+def _page(key, template, context):
+    stamp = (template_version(), reference_data().version)
+    with _lock:
+        cached = _pages.get(key)
+        if cached is not None and cached[0] == stamp:
+            _pages.move_to_end(key)
+            return cached[1]
+    page = Page(render_template(template, **context).encode())
+    with _lock:
+        _pages[key] = (stamp, page)
+        _pages.move_to_end(key)
+        while len(_pages) > current_app.config["PAGE_CACHE_MAX_ENTRIES"]:
+            _pages.popitem(last=False)
+    return page
+
+
+def _encoding(page):
+    accepted = request.accept_encodings
+    for encoding in ("br", "gzip"):
+        if encoding in page.bodies and accepted[encoding] > 0:
+            return encoding
+    return "identity"
+
+
+def cached_page(key, template, private=False, **context):
+    """Render `template` through the page cache and answer with the best encoding, or 304."""
+    # Only look at the session when there is one, so cookieless visitors don't get Vary: Cookie.
+    if current_app.config["SESSION_COOKIE_NAME"] in request.cookies and session.get("_flashes"):
+        return render_template(template, **context)
+    page = _page(key, template, context)
+    encoding = _encoding(page)
+    etag = page.etag if encoding == "identity" else f"{page.etag}-{encoding}"
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(page.bodies[encoding], mimetype="text/html")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = ("private" if private else "public") + ", no-cache"
+    response.vary.add("Accept-Encoding")
+    return response
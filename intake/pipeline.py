@@ -0,0 +1,336 @@
+"""One intake pipeline for every way a client arrives.
+
+The admin form (/clients/new), public shareable links (/intake/<token>)
+and bulk imports (intake/bulk.py) all validate with clean_row() and write
+with write_clients(). Form submissions go through submit(), which also
+makes them idempotent and accounts for shareable link use:
+
+- The forms carry an idempotency key (a hidden field, or an
+  Idempotency-Key header). A key that was already accepted returns the
+  client it created instead of creating another.
+- A shareable link is used with a single conditional UPDATE that checks
+  is_active, expires_at and max_uses and increments use_count together.
+  It commits with the new client, so a failed submission never uses up
+  the link and concurrent submissions can't overshoot max_uses.
+"""
+from datetime import datetime
+from types import SimpleNamespace
+import json
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from database.models import (
+    db, Client, Competitor, Query, QueryKeyword, QueryCountry, ShareableLink, IntakeSubmission,
+)
+from database.refdata import reference_data
+from database.stats import bump_counters
+from countries import COUNTRIES
+from reports.scheduler import next_run_time
+
+FREQUENCIES = ("monthly", "fortnightly", "quarterly", "custom")
+MAX_KEYWORDS = 1000
+COMPETITOR_FIELDS = ("name", "website", "youtube_url", "vimeo_url", "review_page_url")
+VALID_COUNTRIES = frozenset(COUNTRIES)
+
+
+def active_tiers():
+    return reference_data().active_slugs
+
+
+def _text(record, key):
+    value = record.get(key)
+    return "" if value is None else str(value).strip()
+
+
+def _list(value, separators=(";", "\n")):
+    if value is None or value == "":
+        return []
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    value = str(value)
+    if value.lstrip().startswith("["):
+        return _list(json.loads(value))
+    for sep in separators[1:]:
+        value = value.replace(sep, separators[0])
+    return [v.strip() for v in value.split(separators[0]) if v.strip()]
+
+
+def _handles(value):
+    if isinstance(value, str) and value.lstrip().startswith("["):
+        value = json.loads(value)
+    if isinstance(value, list) and all(isinstance(v, dict) for v in value):
+        return [{"platform": v.get("platform", ""), "handle": str(v.get("handle", "")).strip()} for v in value if v.get("handle")]
+    handles = []
+    for pair in _list(value, separators=(";",)):
+        platform, sep, handle = pair.partition(":")
+        if not sep or handle.startswith("//"):  # bare handle or a URL
+            platform, handle = "", pair
+        handles.append({"platform": platform.strip(), "handle": handle.strip()})
+    return handles
+
+
+def _competitors(value):
+    if isinstance(value, str) and value.lstrip().startswith("["):
+        value = json.loads(value)
+    if isinstance(value, list) and all(isinstance(v, dict) for v in value):
+        competitors = []
+        for entry in value:
+            comp = {field: _text(entry, field) for field in COMPETITOR_FIELDS}
+            comp["social_handles"] = json.dumps(_handles(entry.get("social_handles") or []))
+            competitors.append(comp)
+        return competitors
+    return [
+        dict({field: "" for field in COMPETITOR_FIELDS}, website=website, social_handles="[]")
+        for website in _list(value, separators=(";",))
+    ]
+
+
+def _date(record, key, errors):
+    value = _text(record, key)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        errors.append(f"{key} must be YYYY-MM-DD")
+        return None
+
+
+def clean_row(record, tiers):
+    """Validate one raw row. Returns (row, errors); `row` is only usable when `errors` is empty."""
+    errors = []
+    for key in ("name", "website", "contact_name", "contact_email"):
+        if not _text(record, key):
+            errors.append(f"{key} is required")
+    if _text(record, "contact_email") and "@" not in _text(record, "contact_email"):
+        errors.append("contact_email is not an email address")
+    tier = _text(record, "subscription_tier") or "trial"
+    if tier not in tiers:
+        errors.append(f"unknown subscription_tier '{tier}'")
+    frequency = _text(record, "frequency").lower() or "monthly"
+    if frequency not in FREQUENCIES:
+        errors.append(f"frequency must be one of {', '.join(FREQUENCIES)}")
+
+    try:
+        social_handles = _handles(record.get("social_handles"))
+        competitors = _competitors(record.get("competitors"))
+        keywords = _list(record.get("keywords"))[:MAX_KEYWORDS]
+        countries = _list(record.get("countries"), separators=(";",))
+    except (ValueError, AttributeError) as exc:
+        return None, errors + [f"could not read list fields: {exc}"]
+    if any(not c["website"] for c in competitors):
+        errors.append("every competitor needs a website")
+    unknown = [c for c in countries if c not in VALID_COUNTRIES]
+    if unknown:
+        errors.append(f"unknown countries: {', '.join(unknown[:5])}")
+
+    period_start = _date(record, "period_start", errors)
+    period_end = _date(record, "period_end", errors)
+    if period_start and period_end and period_end < period_start:
+        errors.append("period_end is before period_start")
+
+    auto_run = record.get("auto_run")
+    if not isinstance(auto_run, bool):
+        auto_run = _text(record, "auto_run").lower() in ("1", "true", "yes", "y", "on")
+
+    row = {
+        "client": {
+            "name": _text(record, "name"),
+            "website": _text(record, "website"),
+            "contact_name": _text(record, "contact_name"),
+            "contact_email": _text(record, "contact_email"),
+            "subscription_tier": tier,
+            "social_handles": json.dumps(social_handles),
+        },
+        "competitors": competitors,
+        "keywords": keywords,
+        "countries": countries,
+        "query": {
+            "frequency": frequency,
+            "auto_run": auto_run,
+            "period_start": period_start,
+            "period_end": period_end,
+        },
+    }
+    return row, errors
+
+
+def write_clients(rows):
+    """Insert cleaned rows in the current transaction, one executemany per table. Returns the new client ids.
+
+    Child tables go through Core inserts, since nothing needs their ids
+    and the ORM bulk layer's per-row bookkeeping would be wasted. Auto-run
+    queries are scheduled and the dashboard counters bumped as well.
+    """
+    jitter_seconds = current_app.config["SCHEDULER_JITTER_SECONDS"]
+    now = datetime.utcnow()
+    client_ids = db.session.scalars(
+        db.insert(Client).returning(Client.id, sort_by_parameter_order=True),
+        [dict(row["client"], created_at=now) for row in rows],
+    ).all()
+
+    competitors = [
+        dict(comp, client_id=client_id, created_at=now)
+        for client_id, row in zip(client_ids, rows)
+        for comp in row["competitors"]
+    ]
+    if competitors:
+        db.session.execute(Competitor.__table__.insert(), competitors)
+
+    query_ids = db.session.scalars(
+        db.insert(Query).returning(Query.id, sort_by_parameter_order=True),
+        [
+            dict(
+                row["query"], client_id=client_id, created_at=now,
+                keyword_count=len(row["keywords"]), country_count=len(row["countries"]),
+            )
+            for client_id, row in zip(client_ids, rows)
+        ],
+    ).all()
+
+    keywords = [
+        {"query_id": query_id, "position": i, "keyword": keyword}
+        for query_id, row in zip(query_ids, rows)
+        for i, keyword in enumerate(row["keywords"])
+    ]
+    if keywords:
+        db.session.execute(QueryKeyword.__table__.insert(), keywords)
+    countries = [
+        {"query_id": query_id, "position": i, "country": country}
+        for query_id, row in zip(query_ids, rows)
+        for i, country in enumerate(row["countries"])
+    ]
+    if countries:
+        db.session.execute(QueryCountry.__table__.insert(), countries)
+
+    schedule = []
+    for query_id, row in zip(query_ids, rows):
+        if row["query"]["auto_run"]:
+            query = SimpleNamespace(id=query_id, created_at=now, **row["query"])
+            due = next_run_time(query, now, jitter_seconds)
+            if due is not None:
+                schedule.append({"id": query_id, "next_run_at": due})
+    if schedule:
+        db.session.execute(db.update(Query), schedule)
+
+    bump_counters(clients=len(rows), competitors=len(competitors), queries=len(rows))
+    return client_ids
+
+
+def _pairs(form, platform_field, handle_field):
+    return [
+        {"platform": p, "handle": h.strip()}
+        for p, h in zip(form.getlist(platform_field), form.getlist(handle_field))
+        if h.strip()
+    ]
+
+
+def form_record(form):
+    """Turn an intake form post into a record for clean_row()."""
+    names = form.getlist("comp_name[]")
+    youtubes = form.getlist("comp_youtube[]")
+    vimeos = form.getlist("comp_vimeo[]")
+    reviews = form.getlist("comp_review[]")
+    competitors = []
+    for i, website in enumerate(form.getlist("comp_website[]")):
+        if not website.strip():
+            continue
+        competitors.append({
+            "name": names[i] if i < len(names) else "",
+            "website": website,
+            "youtube_url": youtubes[i] if i < len(youtubes) else "",
+            "vimeo_url": vimeos[i] if i < len(vimeos) else "",
+            "review_page_url": reviews[i] if i < len(reviews) else "",
+            "social_handles": _pairs(form, f"comp_social_platform_{i}[]", f"comp_social_handle_{i}[]"),
+        })
+    return {
+        "name": form.get("client_name", ""),
+        "website": form.get("client_website", ""),
+        "contact_name": form.get("contact_name", ""),
+        "contact_email": form.get("contact_email", ""),
+        "subscription_tier": form.get("subscription_tier", "trial"),
+        "social_handles": _pairs(form, "social_platform[]", "social_handle[]"),
+        "competitors": competitors,
+        "keywords": [k.strip() for k in form.get("keywords", "").split("\n") if k.strip()],
+        "countries": [c for c in form.getlist("countries[]") if c],
+        "frequency": form.get("frequency", "monthly"),
+        "auto_run": bool(form.get("auto_run")),
+        "period_start": form.get("period_start", ""),
+        "period_end": form.get("period_end", ""),
+    }
+
+
+def _usable():
+    """Conditions for a link that can still take a submission."""
+    return (
+        ShareableLink.is_active.is_(True),
+        db.or_(ShareableLink.expires_at.is_(None), ShareableLink.expires_at > datetime.utcnow()),
+        db.or_(ShareableLink.max_uses.is_(None), ShareableLink.use_count < ShareableLink.max_uses),
+    )
+
+
+def live_link(token):
+    """The shareable link for `token` if it can still take submissions, else None."""
+    return ShareableLink.query.filter(ShareableLink.token == token, *_usable()).first()
+
+
+def use_link(link_id):
+    """Count one use of a link, in the same statement that checks it is still usable. Returns False if it isn't."""
+    result = db.session.execute(
+        db.update(ShareableLink)
+        .where(ShareableLink.id == link_id, *_usable())
+        .values(use_count=ShareableLink.use_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+class Submission:
+    """Outcome of submit(). `client_id` is set when a client was created, or already had been for this key."""
+
+    def __init__(self, client_id=None, name="", keyword_count=0, country_count=0, errors=None, duplicate=False, link_unavailable=False):
+        self.client_id = client_id
+        self.name = name
+        self.keyword_count = keyword_count
+        self.country_count = country_count
+        self.errors = errors or []
+        self.duplicate = duplicate
+        self.link_unavailable = link_unavailable
+
+    @property
+    def ok(self):
+        return self.client_id is not None
+
+
+def _accepted(idempotency_key):
+    existing = db.session.get(IntakeSubmission, idempotency_key)
+    if existing is None:
+        return None
+    name = db.session.scalar(db.select(Client.name).where(Client.id == existing.client_id))
+    return Submission(existing.client_id, name, duplicate=True)
+
+
+def submit(form, idempotency_key=None, link_id=None):
+    """Validate and save one intake form post, committing on success."""
+    key = (idempotency_key or "").strip()[:64] or None
+    if key and (previous := _accepted(key)):
+        return previous
+
+    row, errors = clean_row(form_record(form), active_tiers())
+    if errors:
+        return Submission(errors=errors)
+    if link_id is not None and not use_link(link_id):
+        db.session.rollback()
+        return Submission(link_unavailable=True)
+
+    client_id = write_clients([row])[0]
+    if key:
+        db.session.add(IntakeSubmission(idempotency_key=key, client_id=client_id, link_id=link_id))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same key was committed concurrently (a double-click); keep that one.
+        db.session.rollback()
+        return _accepted(key) or Submission(errors=["This form was already submitted."])
+    return Submission(client_id, row["client"]["name"], len(row["keywords"]), len(row["countries"]))
+
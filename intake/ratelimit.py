@@ -0,0 +1,50 @@
+"""Per-key token buckets in a local SQLite file.
+
+Every gunicorn worker on the host shares the same file, so a limit holds
+across processes without a separate service. A bucket holds up to
+`burst` tokens and refills at `per_minute` tokens a minute. Each hit is
+one UPSERT that refills, checks and takes a token in a single statement,
+so concurrent hits can't overdraw a bucket.
+"""
+from contextlib import contextmanager
+import os
+import sqlite3
+import time
+
+# Refill, then take a token only if one is available. When the WHERE on
+# DO UPDATE is false nothing changes and changes() reports 0.
+TAKE_TOKEN = """
+INSERT INTO buckets (key, tokens, updated_at) VALUES (:key, :burst - 1, :now)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = MIN(:burst, tokens + (:now - updated_at) * :rate) - 1,
+    updated_at = :now
+WHERE MIN(:burst, tokens + (:now - updated_at) * :rate) >= 1
+"""
+
+
+class RateLimiter:
+    def __init__(self, path, per_minute, burst):
+        self.path = path
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def hit(self, key):
+        """Take one token from `key`'s bucket. Returns False when the bucket is empty."""
+        with self._connect() as conn:
+            cursor = conn.execute(TAKE_TOKEN, {"key": key, "burst": self.burst, "rate": self.rate, "now": time.time()})
+            return cursor.rowcount == 1
@@ -1,15 +1,30 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
-from sqlalchemy import func
-from database.models import db, Client, Competitor, Query, Report, SubscriptionTier, ShareableLink
+from flask import Blueprint, Flask, current_app, render_template, request, redirect, url_for, flash, jsonify
+from flask.cli import with_appcontext
+import click
+from sqlalchemy.orm import selectinload, load_only
+from database.models import db, Client, Query, Report, SubscriptionTier, ShareableLink
+from database import purge
+from database.engine import configure_engine
+from database.migrations import upgrade
+from database.pagination import keyset_paginate
+from database.refdata import invalidate as invalidate_reference_data, reference_data
+from database.search import search as search_index
+from database.stats import competitor_counts, query_counts, seed_counters, bump_counters, get_counters, report_stats
+from intake.bulk import FORMATS as IMPORT_FORMATS, detect_format, import_stream
+from intake.pagecache import cached_page
+from intake.pipeline import live_link, submit
+from intake.ratelimit import RateLimiter
+from monitoring.instrument import init_app as init_monitoring, render_metrics
+from reports.export import export_response
+from reports.scheduler import schedule_query
+from reports.trends import load as load_trends, trend_summary
 from config import Config
-from countries import COUNTRIES
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
 import secrets
 
-app = Flask(__name__)
-app.config.from_object(Config)
-db.init_app(app)
+bp = Blueprint("web", __name__)
+
 
 def seed_default_tiers():
     """Create default subscription tiers if they don't exist"""
@@ -44,135 +59,126 @@ def seed_default_tiers():
             db.session.add(tier)
         db.session.commit()
 
-with app.app_context():
+
+def bootstrap():
+    """Create or upgrade the schema and seed reference data. Run once per deploy, not per worker."""
     db.create_all()
+    upgrade(db.engine)
     seed_default_tiers()
+    seed_counters()
+
+
+@click.command("bootstrap")
+@with_appcontext
+def bootstrap_command():
+    """Create or upgrade the database schema and seed default data."""
+    bootstrap()
+    click.echo("Database ready.")
+
+
+def create_app(config=Config):
+    """Build the web app. Touches no database, so it is safe to run in a gunicorn --preload master."""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine, app.config)  # creates the engine; connections open on first use
+    init_monitoring(app)
+    if app.config["INTAKE_RATE_LIMIT_DB"]:
+        app.extensions["intake_limiter"] = RateLimiter(
+            app.config["INTAKE_RATE_LIMIT_DB"], app.config["INTAKE_RATE_LIMIT_PER_MINUTE"], app.config["INTAKE_RATE_LIMIT_BURST"]
+        )
+    app.register_blueprint(bp)
+    app.cli.add_command(bootstrap_command)
+    return app
+
+
+def _idempotency_key():
+    return request.headers.get("Idempotency-Key") or request.form.get("idempotency_key")
+
+
+def live_clients():
+    """Clients not waiting to be purged (see database/purge.py)."""
+    return Client.query.filter(Client.deleted_at.is_(None))
 
 
 # --- Dashboard ---
-@app.route("/")
+@bp.route("/")
 def dashboard():
-    clients = Client.query.order_by(Client.created_at.desc()).all()
-    total_reports = db.session.query(func.count(Report.id)).scalar() or 0
-    total_competitors = db.session.query(func.count(Competitor.id)).scalar() or 0
-    total_queries = db.session.query(func.count(Query.id)).scalar() or 0
-    return render_template("dashboard.html", clients=clients, total_reports=total_reports, total_competitors=total_competitors, total_queries=total_queries)
+    # Fixed number of statements regardless of client count: one keyset page of
+    # clients, selectin loads for their queries and countries (never keywords),
+    # two GROUP BY counts scoped to the page, and one read of the counters table.
+    clients_query = live_clients().options(
+        selectinload(Client.queries)
+        .load_only(Query.id, Query.client_id, Query.keyword_count, Query.frequency, Query.auto_run)
+        .selectinload(Query.country_rows)
+    )
+    page = keyset_paginate(
+        clients_query, Client, current_app.config["CLIENTS_PER_PAGE"],
+        before=request.args.get("before"), after=request.args.get("after"),
+    )
+    client_ids = [c.id for c in page.items]
+    comp_counts = competitor_counts(client_ids)
+    q_counts = query_counts(client_ids)
+    totals = get_counters()
+    return render_template("dashboard.html", clients=page.items, page=page, competitor_counts=comp_counts, query_counts=q_counts, total_clients=totals["clients"], total_reports=totals["reports"], total_competitors=totals["competitors"], total_queries=totals["queries"])
 
 
 # --- New Client + Intake Form ---
-@app.route("/clients/new", methods=["GET", "POST"])
+@bp.route("/clients/new", methods=["GET", "POST"])
 def new_client():
     if request.method == "GET":
-        tiers = SubscriptionTier.query.filter_by(is_active=True).order_by(SubscriptionTier.sort_order).all()
-        return render_template("intake_form.html", countries=COUNTRIES, tiers=tiers)
-
-    # Parse form data
-    client_name = request.form.get("client_name", "").strip()
-    client_website = request.form.get("client_website", "").strip()
-    contact_name = request.form.get("contact_name", "").strip()
-    contact_email = request.form.get("contact_email", "").strip()
-    subscription_tier = request.form.get("subscription_tier", "trial")
-
-    if not client_name or not client_website or not contact_name or not contact_email:
-        flash("Please fill in all required fields.", "error")
-        return redirect(url_for("new_client"))
-
-    # Client social handles
-    platforms = request.form.getlist("social_platform[]")
-    handles = request.form.getlist("social_handle[]")
-    social_handles = []
-    for p, h in zip(platforms, handles):
-        if h.strip():
-            social_handles.append({"platform": p, "handle": h.strip()})
-
-    # Create client
-    client = Client(
-        name=client_name,
-        website=client_website,
-        contact_name=contact_name,
-        contact_email=contact_email,
-        subscription_tier=subscription_tier,
-    )
-    client.set_social_handles(social_handles)
-    db.session.add(client)
-    db.session.flush()  # get client.id
-
-    # Competitors
-    comp_names = request.form.getlist("comp_name[]")
-    comp_websites = request.form.getlist("comp_website[]")
-    comp_youtubes = request.form.getlist("comp_youtube[]")
-    comp_vimeos = request.form.getlist("comp_vimeo[]")
-    comp_reviews = request.form.getlist("comp_review[]")
-
-    for i in range(len(comp_websites)):
-        if not comp_websites[i].strip():
-            continue
-        # Competitor social handles
-        comp_platforms = request.form.getlist(f"comp_social_platform_{i}[]")
-        comp_handles = request.form.getlist(f"comp_social_handle_{i}[]")
-        comp_socials = []
-        for p, h in zip(comp_platforms, comp_handles):
-            if h.strip():
-                comp_socials.append({"platform": p, "handle": h.strip()})
-
-        comp = Competitor(
-            client_id=client.id,
-            name=comp_names[i].strip() if i < len(comp_names) else "",
-            website=comp_websites[i].strip(),
-            youtube_url=comp_youtubes[i].strip() if i < len(comp_youtubes) else "",
-            vimeo_url=comp_vimeos[i].strip() if i < len(comp_vimeos) else "",
-            review_page_url=comp_reviews[i].strip() if i < len(comp_reviews) else "",
-        )
-        comp.set_social_handles(comp_socials)
-        db.session.add(comp)
-
-    # Keywords
-    keywords_raw = request.form.get("keywords", "")
-    keywords = [k.strip() for k in keywords_raw.split("\n") if k.strip()]
-    if len(keywords) > 1000:
-        keywords = keywords[:1000]
-
-    # Countries
-    countries = [c for c in request.form.getlist("countries[]") if c]
-
-    # Reporting settings
-    frequency = request.form.get("frequency", "monthly")
-    auto_run = bool(request.form.get("auto_run"))
-    period_start = request.form.get("period_start")
-    period_end = request.form.get("period_end")
-
-    query = Query(
-        client_id=client.id,
-        frequency=frequency,
-        auto_run=auto_run,
-        period_start=datetime.strptime(period_start, "%Y-%m-%d").date() if period_start else None,
-        period_end=datetime.strptime(period_end, "%Y-%m-%d").date() if period_end else None,
+        ref = reference_data()
+        return cached_page(("intake_form",), "intake_form.html", private=True, country_options=ref.country_options, tiers=ref.active_tiers)
+
+    result = submit(request.form, _idempotency_key())
+    if not result.ok:
+        flash("Please fix the form: " + "; ".join(result.errors) + ".", "error")
+        return redirect(url_for(".new_client"))
+    if not result.duplicate:
+        flash(f"Client '{result.name}' created with {result.keyword_count} keywords and {result.country_count} countries.", "success")
+    return redirect(url_for(".dashboard"))
+
+
+# --- Bulk Client Import (CSV or NDJSON upload or request body, see intake/bulk.py) ---
+@bp.route("/clients/import", methods=["POST"])
+def import_clients():
+    upload = request.files.get("file")
+    fmt = request.args.get("format") or (
+        detect_format(upload.filename, upload.mimetype) if upload else detect_format(mimetype=request.mimetype)
     )
-    query.set_keywords(keywords)
-    query.set_countries(countries)
-    db.session.add(query)
+    if fmt not in IMPORT_FORMATS:
+        return jsonify(error="Send a .csv or .ndjson file, or pass ?format=csv|ndjson."), 400
+    result = import_stream(upload.stream if upload else request.stream, fmt)
+    return jsonify(result.to_dict())
 
-    db.session.commit()
-    flash(f"Client '{client_name}' created with {len(keywords)} keywords and {len(countries)} countries.", "success")
-    return redirect(url_for("dashboard"))
+
+# --- Search clients, competitors and tracked keywords (see database/search.py) ---
+@bp.route("/search")
+def search():
+    limit = min(request.args.get("limit", 20, type=int), 100)
+    return jsonify(search_index(request.args.get("q", ""), limit))
 
 
 # --- View Client ---
-@app.route("/clients/<int:client_id>")
+@bp.route("/clients/<int:client_id>")
 def view_client(client_id):
-    client = Client.query.get_or_404(client_id)
-    report_count = sum(len(q.reports) for q in client.queries)
-    return render_template("client_detail.html", client=client, report_count=report_count)
+    client = live_clients().options(
+        selectinload(Client.queries).selectinload(Query.reports),
+        selectinload(Client.queries).selectinload(Query.country_rows),
+    ).filter_by(id=client_id).first_or_404()
+    stats = report_stats([q.id for q in client.queries])
+    report_count = sum(count for count, _ in stats.values())
+    return render_template("client_detail.html", client=client, report_count=report_count, report_stats=stats)
 
 
 # --- Edit Client ---
-@app.route("/clients/<int:client_id>/edit", methods=["GET", "POST"])
+@bp.route("/clients/<int:client_id>/edit", methods=["GET", "POST"])
 def edit_client(client_id):
-    client = Client.query.get_or_404(client_id)
+    client = live_clients().filter_by(id=client_id).first_or_404()
 
     if request.method == "GET":
-        tiers = SubscriptionTier.query.filter_by(is_active=True).order_by(SubscriptionTier.sort_order).all()
-        return render_template("edit_client.html", client=client, tiers=tiers)
+        return render_template("edit_client.html", client=client, tiers=reference_data().active_tiers)
 
     client.name = request.form.get("client_name", client.name).strip()
     client.website = request.form.get("client_website", client.website).strip()
@@ -182,183 +188,156 @@ def edit_client(client_id):
 
     db.session.commit()
     flash(f"Client '{client.name}' updated.", "success")
-    return redirect(url_for("view_client", client_id=client.id))
+    return redirect(url_for(".view_client", client_id=client.id))
 
 
 # --- Delete Client ---
-@app.route("/clients/<int:client_id>/delete", methods=["POST"])
+@bp.route("/clients/<int:client_id>/delete", methods=["POST"])
 def delete_client(client_id):
-    client = Client.query.get_or_404(client_id)
+    client = live_clients().filter_by(id=client_id).first_or_404()
     name = client.name
-    db.session.delete(client)
-    db.session.commit()
+    if not purge.delete_client(client.id, current_app.config["PURGE_BACKGROUND_THRESHOLD"]):
+        flash(f"Client '{name}' deleted. Their reports are being removed in the background.", "success")
+        return redirect(url_for(".dashboard"))
     flash(f"Client '{name}' and all associated data deleted.", "success")
-    return redirect(url_for("dashboard"))
+    return redirect(url_for(".dashboard"))
 
 
-# --- Run Report (placeholder for future milestones) ---
-@app.route("/queries/<int:query_id>/run", methods=["POST"])
+# --- Run Report (picked up by the background worker, see reports/worker.py) ---
+@bp.route("/queries/<int:query_id>/run", methods=["POST"])
 def run_report(query_id):
     query = Query.query.get_or_404(query_id)
     report = Report(query_id=query.id, status="pending")
     db.session.add(report)
+    bump_counters(reports=1)
     db.session.commit()
-    flash("Report queued. Data collection will begin when sources are connected (Milestone 2+).", "success")
-    return redirect(url_for("view_client", client_id=query.client_id))
+    flash("Report queued. A background worker will pick it up shortly.", "success")
+    return redirect(url_for(".view_client", client_id=query.client_id))
+
+
+# --- Export Report Records (streamed, see reports/export.py) ---
+@bp.route("/reports/<int:report_id>/export.<fmt>")
+def export_report(report_id, fmt):
+    if fmt not in ("ndjson", "csv"):
+        return "Unsupported export format.", 404
+    report = db.get_or_404(Report, report_id)
+    if report.status != "complete":
+        flash("Only completed reports can be exported.", "error")
+        return redirect(url_for(".view_client", client_id=report.query.client_id))
+    return export_response(report, fmt, request.args.get("section", "results"))
+
+
+# --- Keyword rank trends across a query's reports (see reports/trends.py) ---
+@bp.route("/queries/<int:query_id>/trends")
+def query_trends(query_id):
+    query = Query.query.get_or_404(query_id)
+    root = current_app.config["TRENDS_DIR"]
+    trends = load_trends(root, query.id) if root else None
+    if trends is None:
+        return jsonify(error="No completed reports with keyword results for this query yet."), 404
+    return jsonify(trend_summary(
+        trends, query,
+        keywords=[k.strip().lower() for k in request.args.getlist("keyword")] or None,
+        countries=request.args.getlist("country") or None,
+        window=max(request.args.get("window", 3, type=int), 1),
+        movers=min(request.args.get("movers", 10, type=int), 100),
+    ))
 
 
 # --- Toggle Auto-Run ---
-@app.route("/queries/<int:query_id>/toggle-auto", methods=["POST"])
+@bp.route("/queries/<int:query_id>/toggle-auto", methods=["POST"])
 def toggle_auto(query_id):
     query = Query.query.get_or_404(query_id)
     query.auto_run = not query.auto_run
+    schedule_query(query)
     db.session.commit()
     status = "enabled" if query.auto_run else "disabled"
     flash(f"Auto-run {status} for this query.", "success")
-    return redirect(url_for("view_client", client_id=query.client_id))
+    return redirect(url_for(".view_client", client_id=query.client_id))
 
 
 # --- Public Intake Form (Shareable Link) ---
-@app.route("/intake/<token>", methods=["GET", "POST"])
+@bp.route("/intake/<token>", methods=["GET", "POST"])
 def public_intake(token):
-    link = ShareableLink.query.filter_by(token=token, is_active=True).first()
-    if not link:
-        flash("Invalid or expired form link.", "error")
-        return redirect(url_for("dashboard"))
-
     if request.method == "GET":
-        tiers = SubscriptionTier.query.filter_by(is_active=True).order_by(SubscriptionTier.sort_order).all()
-        return render_template("public_intake.html", countries=COUNTRIES, tiers=tiers, token=token)
-
-    # Process submission (same as new_client POST logic)
-    client_name = request.form.get("client_name", "").strip()
-    client_website = request.form.get("client_website", "").strip()
-    contact_name = request.form.get("contact_name", "").strip()
-    contact_email = request.form.get("contact_email", "").strip()
-    subscription_tier = request.form.get("subscription_tier", "trial")
-
-    if not client_name or not client_website or not contact_name or not contact_email:
-        flash("Please fill in all required fields.", "error")
-        return redirect(url_for("public_intake", token=token))
-
-    platforms = request.form.getlist("social_platform[]")
-    handles = request.form.getlist("social_handle[]")
-    social_handles = []
-    for p, h in zip(platforms, handles):
-        if h.strip():
-            social_handles.append({"platform": p, "handle": h.strip()})
-
-    client = Client(
-        name=client_name,
-        website=client_website,
-        contact_name=contact_name,
-        contact_email=contact_email,
-        subscription_tier=subscription_tier,
-    )
-    client.set_social_handles(social_handles)
-    db.session.add(client)
-    db.session.flush()
-
-    comp_names = request.form.getlist("comp_name[]")
-    comp_websites = request.form.getlist("comp_website[]")
-    comp_youtubes = request.form.getlist("comp_youtube[]")
-    comp_vimeos = request.form.getlist("comp_vimeo[]")
-    comp_reviews = request.form.getlist("comp_review[]")
-
-    for i in range(len(comp_websites)):
-        if not comp_websites[i].strip():
-            continue
-        comp_platforms = request.form.getlist(f"comp_social_platform_{i}[]")
-        comp_handles = request.form.getlist(f"comp_social_handle_{i}[]")
-        comp_socials = []
-        for p, h in zip(comp_platforms, comp_handles):
-            if h.strip():
-                comp_socials.append({"platform": p, "handle": h.strip()})
-
-        comp = Competitor(
-            client_id=client.id,
-            name=comp_names[i].strip() if i < len(comp_names) else "",
-            website=comp_websites[i].strip(),
-            youtube_url=comp_youtubes[i].strip() if i < len(comp_youtubes) else "",
-            vimeo_url=comp_vimeos[i].strip() if i < len(comp_vimeos) else "",
-            review_page_url=comp_reviews[i].strip() if i < len(comp_reviews) else "",
-        )
-        comp.set_social_handles(comp_socials)
-        db.session.add(comp)
-
-    keywords_raw = request.form.get("keywords", "")
-    keywords = [k.strip() for k in keywords_raw.split("\n") if k.strip()]
-    if len(keywords) > 1000:
-        keywords = keywords[:1000]
-
-    countries = [c for c in request.form.getlist("countries[]") if c]
-    frequency = request.form.get("frequency", "monthly")
-    auto_run = bool(request.form.get("auto_run"))
-    period_start = request.form.get("period_start")
-    period_end = request.form.get("period_end")
-
-    query = Query(
-        client_id=client.id,
-        frequency=frequency,
-        auto_run=auto_run,
-        period_start=datetime.strptime(period_start, "%Y-%m-%d").date() if period_start else None,
-        period_end=datetime.strptime(period_end, "%Y-%m-%d").date() if period_end else None,
-    )
-    query.set_keywords(keywords)
-    query.set_countries(countries)
-    db.session.add(query)
+        if not live_link(token):
+            flash("Invalid or expired form link.", "error")
+            return redirect(url_for(".dashboard"))
+        ref = reference_data()
+        return cached_page(("public_intake", token), "public_intake.html", country_options=ref.country_options, tiers=ref.active_tiers, token=token)
+
+    # Expiry and max_uses are checked by submit() in the statement that counts the use,
+    # after an already-accepted idempotency key has been answered.
+    link_id = db.session.scalar(db.select(ShareableLink.id).where(ShareableLink.token == token))
+    if link_id is None:
+        flash("Invalid or expired form link.", "error")
+        return redirect(url_for(".dashboard"))
+    limiter = current_app.extensions.get("intake_limiter")
+    if limiter and not limiter.hit(f"link:{link_id}"):
+        return "Too many submissions for this form right now. Please try again in a minute.", 429
 
-    link.use_count += 1
-    db.session.commit()
+    result = submit(request.form, _idempotency_key(), link_id=link_id)
+    if result.link_unavailable:
+        flash("Invalid or expired form link.", "error")
+        return redirect(url_for(".dashboard"))
+    if not result.ok:
+        flash("Please fix the form: " + "; ".join(result.errors) + ".", "error")
+        return redirect(url_for(".public_intake", token=token))
 
-    return render_template("public_intake_success.html", client_name=client_name)
+    return render_template("public_intake_success.html", client_name=result.name)
 
 
 # --- Manage Shareable Links ---
-@app.route("/links")
+@bp.route("/links")
 def manage_links():
     links = ShareableLink.query.order_by(ShareableLink.created_at.desc()).all()
     return render_template("manage_links.html", links=links)
 
 
-@app.route("/links/new", methods=["POST"])
+@bp.route("/links/new", methods=["POST"])
 def create_link():
     label = request.form.get("label", "Intake Form").strip()
+    max_uses = request.form.get("max_uses", type=int)
+    expires_in_days = request.form.get("expires_in_days", type=int)
     token = secrets.token_urlsafe(32)
-    link = ShareableLink(token=token, label=label)
+    link = ShareableLink(
+        token=token,
+        label=label,
+        max_uses=max_uses if max_uses and max_uses > 0 else None,
+        expires_at=datetime.utcnow() + timedelta(days=expires_in_days) if expires_in_days and expires_in_days > 0 else None,
+    )
     db.session.add(link)
     db.session.commit()
     flash(f"Shareable link created: {label}", "success")
-    return redirect(url_for("manage_links"))
+    return redirect(url_for(".manage_links"))
 
 
-@app.route("/links/<int:link_id>/toggle", methods=["POST"])
+@bp.route("/links/<int:link_id>/toggle", methods=["POST"])
 def toggle_link(link_id):
     link = ShareableLink.query.get_or_404(link_id)
     link.is_active = not link.is_active
     db.session.commit()
     status = "activated" if link.is_active else "deactivated"
     flash(f"Link {status}.", "success")
-    return redirect(url_for("manage_links"))
+    return redirect(url_for(".manage_links"))
 
 
-@app.route("/links/<int:link_id>/delete", methods=["POST"])
+@bp.route("/links/<int:link_id>/delete", methods=["POST"])
 def delete_link(link_id):
     link = ShareableLink.query.get_or_404(link_id)
     db.session.delete(link)
     db.session.commit()
     flash("Link deleted.", "success")
-    return redirect(url_for("manage_links"))
+    return redirect(url_for(".manage_links"))
 
 
 # --- Settings: Manage Subscription Tiers ---
-@app.route("/settings")
+@bp.route("/settings")
 def settings():
-    tiers = SubscriptionTier.query.order_by(SubscriptionTier.sort_order).all()
-    return render_template("settings.html", tiers=tiers)
+    return render_template("settings.html", tiers=reference_data().tiers)
 
 
-@app.route("/settings/tiers/new", methods=["POST"])
+@bp.route("/settings/tiers/new", methods=["POST"])
 def create_tier():
     name = request.form.get("name", "").strip()
     slug = request.form.get("slug", "").strip()
@@ -369,7 +348,7 @@ def create_tier():
 
     if not name or not slug:
         flash("Name and slug are required.", "error")
-        return redirect(url_for("settings"))
+        return redirect(url_for(".settings"))
 
     tier = SubscriptionTier(
         name=name,
@@ -380,12 +359,13 @@ def create_tier():
     )
     tier.set_features(features)
     db.session.add(tier)
+    invalidate_reference_data()
     db.session.commit()
     flash(f"Tier '{name}' created.", "success")
-    return redirect(url_for("settings"))
+    return redirect(url_for(".settings"))
 
 
-@app.route("/settings/tiers/<int:tier_id>/edit", methods=["POST"])
+@bp.route("/settings/tiers/<int:tier_id>/edit", methods=["POST"])
 def edit_tier(tier_id):
     tier = SubscriptionTier.query.get_or_404(tier_id)
     tier.name = request.form.get("name", tier.name).strip()
@@ -395,30 +375,47 @@ def edit_tier(tier_id):
     features_raw = request.form.get("features", "")
     features = [f.strip() for f in features_raw.split("\n") if f.strip()]
     tier.set_features(features)
+    invalidate_reference_data()
     db.session.commit()
     flash(f"Tier '{tier.name}' updated.", "success")
-    return redirect(url_for("settings"))
+    return redirect(url_for(".settings"))
 
 
-@app.route("/settings/tiers/<int:tier_id>/delete", methods=["POST"])
+@bp.route("/settings/tiers/<int:tier_id>/delete", methods=["POST"])
 def delete_tier(tier_id):
     tier = SubscriptionTier.query.get_or_404(tier_id)
     name = tier.name
     db.session.delete(tier)
+    invalidate_reference_data()
     db.session.commit()
     flash(f"Tier '{name}' deleted.", "success")
-    return redirect(url_for("settings"))
+    return redirect(url_for(".settings"))
 
 
-@app.route("/settings/tiers/<int:tier_id>/toggle", methods=["POST"])
+@bp.route("/settings/tiers/<int:tier_id>/toggle", methods=["POST"])
 def toggle_tier(tier_id):
     tier = SubscriptionTier.query.get_or_404(tier_id)
     tier.is_active = not tier.is_active
+    invalidate_reference_data()
     db.session.commit()
     status = "activated" if tier.is_active else "deactivated"
     flash(f"Tier '{tier.name}' {status}.", "success")
-    return redirect(url_for("settings"))
+    return redirect(url_for(".settings"))
+
+
+# --- Prometheus metrics for every process on the host (see monitoring/) ---
+@bp.route("/metrics")
+def metrics():
+    text = render_metrics()
+    if text is None:
+        return "Metrics are disabled.", 404
+    return current_app.response_class(text, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+app = create_app()
 
 
 if __name__ == "__main__":
+    with app.app_context():
+        bootstrap()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,142 @@
+"""Timing and SQL accounting for requests and report pipeline stages.
+
+init_app() hooks every request of the Flask app: its latency goes into a
+per-endpoint histogram, and each SQL statement it runs, as seen by
+SQLAlchemy's cursor events, is counted and timed against it. Requests
+slower than SLOW_REQUEST_SECONDS are logged with the statements they
+ran. Report pipeline code wraps its stages in `with stage("name"):` to
+get the same accounting under a stage label.
+
+All of it lands in the shared MetricsStore (monitoring/metrics.py),
+served as Prometheus text by GET /metrics.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import atexit
+import logging
+import time
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from monitoring.metrics import MetricsStore
+
+log = logging.getLogger(__name__)
+
+MAX_LOGGED_STATEMENTS = 50
+MAX_STATEMENT_LENGTH = 300
+
+_store = None
+_slow_seconds = None
+_scope = ContextVar("monitoring_scope", default=None)
+
+
+class Scope:
+    """SQL run on behalf of one request or stage."""
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.log = []  # (seconds, statement) for the first MAX_LOGGED_STATEMENTS
+
+    def record(self, statement, seconds):
+        self.statements += 1
+        self.sql_seconds += seconds
+        if len(self.log) < MAX_LOGGED_STATEMENTS:
+            self.log.append((seconds, " ".join(statement.split())[:MAX_STATEMENT_LENGTH]))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the execution context, not the connection: a statement that raises never
+    # reaches after_cursor_execute, and its start time goes away with the context.
+    context._monitoring_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = context._monitoring_started
+    scope = _scope.get()
+    if scope is not None:
+        scope.record(statement, time.perf_counter() - started)
+
+
+def _start_request():
+    g.monitoring = (_scope.set(Scope()), time.perf_counter())
+
+
+def _record_request(response):
+    _finish_request(response.status_code)
+    return response
+
+
+def _teardown_request(exc):
+    if "monitoring" in g:  # after_request didn't run: the view raised
+        _finish_request(500)
+
+
+def _finish_request(status):
+    token, started = g.pop("monitoring")
+    elapsed = time.perf_counter() - started
+    scope = _scope.get()
+    _scope.reset(token)
+    endpoint = request.endpoint or "unmatched"
+    _store.inc("balthazaar_http_requests_total", endpoint=endpoint, method=request.method, status=status)
+    _store.observe("balthazaar_http_request_duration_seconds", elapsed, endpoint=endpoint)
+    _store.inc("balthazaar_http_sql_statements_total", scope.statements, endpoint=endpoint)
+    _store.inc("balthazaar_http_sql_seconds_total", scope.sql_seconds, endpoint=endpoint)
+    if elapsed >= _slow_seconds:
+        lines = [f"  {seconds * 1000:8.1f} ms  {statement}" for seconds, statement in scope.log]
+        if scope.statements > len(scope.log):
+            lines.append(f"  ... and {scope.statements - len(scope.log)} more")
+        log.warning(
+            "Slow request %s %s (%s): %.0f ms, %d SQL statements in %.0f ms\n%s",
+            request.method, request.full_path.rstrip("?"), endpoint, elapsed * 1000,
+            scope.statements, scope.sql_seconds * 1000, "\n".join(lines),
+        )
+    _store.maybe_flush()
+
+
+@contextmanager
+def stage(name):
+    """Time a report pipeline stage and the SQL it runs. A no-op when metrics are disabled."""
+    if _store is None:
+        yield
+        return
+    scope = Scope()
+    token = _scope.set(scope)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+        _store.observe("balthazaar_stage_duration_seconds", time.perf_counter() - started, stage=name)
+        _store.inc("balthazaar_stage_sql_statements_total", scope.statements, stage=name)
+        _store.inc("balthazaar_stage_sql_seconds_total", scope.sql_seconds, stage=name)
+        _store.maybe_flush()
+
+
+def flush():
+    """Write this process's pending observations now, e.g. before a pool process exits."""
+    if _store is not None:
+        _store.flush()
+
+
+def render_metrics():
+    """Prometheus text for every process on the host, or None when metrics are disabled."""
+    return _store.render() if _store is not None else None
+
+
+def init_app(app):
+    """Instrument `app` and open the shared store. Does nothing if METRICS_DB is empty."""
+    global _store, _slow_seconds
+    if not app.config["METRICS_DB"]:
+        return
+    _store = MetricsStore(app.config["METRICS_DB"], app.config["METRICS_FLUSH_SECONDS"])
+    _slow_seconds = app.config["SLOW_REQUEST_SECONDS"]
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    app.teardown_request(_teardown_request)
+    atexit.register(_store.flush)
@@ -0,0 +1,129 @@
+"""Counters and histograms shared by every process on the host.
+
+Each process (gunicorn worker, report worker, pool process) adds its
+observations to an in-memory batch and folds it into a local SQLite
+file at most every METRICS_FLUSH_SECONDS, with one UPSERT per series
+that adds to the stored value. The file therefore holds totals for all
+processes, and render() turns it into the Prometheus text format for
+GET /metrics. Histograms are stored the way Prometheus exposes them:
+cumulative buckets plus _sum and _count.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+import math
+import os
+import sqlite3
+import threading
+import time
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# name -> (type, help)
+FAMILIES = {
+    "balthazaar_http_requests_total": ("counter", "HTTP requests by endpoint, method and status."),
+    "balthazaar_http_request_duration_seconds": ("histogram", "HTTP request latency by endpoint."),
+    "balthazaar_http_sql_statements_total": ("counter", "SQL statements executed while handling requests."),
+    "balthazaar_http_sql_seconds_total": ("counter", "Time spent in SQL while handling requests."),
+    "balthazaar_stage_duration_seconds": ("histogram", "Report pipeline stage latency."),
+    "balthazaar_stage_sql_statements_total": ("counter", "SQL statements executed by report pipeline stages."),
+    "balthazaar_stage_sql_seconds_total": ("counter", "Time spent in SQL by report pipeline stages."),
+}
+
+ADD_SAMPLE = """
+INSERT INTO samples (name, labels, le, value) VALUES (?, ?, ?, ?)
+ON CONFLICT (name, labels, le) DO UPDATE SET value = value + excluded.value
+"""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+
+
+def _number(value):
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _le(bound):
+    return "+Inf" if bound == math.inf else repr(bound)
+
+
+class MetricsStore:
+    def __init__(self, path, flush_seconds=10.0):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self._pending = defaultdict(float)  # (name, labels, le) -> delta
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                "name TEXT NOT NULL, labels TEXT NOT NULL, le TEXT NOT NULL, value REAL NOT NULL, "
+                "PRIMARY KEY (name, labels, le))"
+            )
+        os.register_at_fork(after_in_child=self._forget)
+
+    def _forget(self):
+        # A forked child starts with a copy of the parent's batch, which the parent will flush itself.
+        self._pending = defaultdict(float)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._pending[(name, _labels(labels), "")] += value
+
+    def observe(self, name, value, **labels):
+        key = _labels(labels)
+        with self._lock:
+            for bound in BUCKETS + (math.inf,):  # every bucket, so empty ones are exposed as 0
+                self._pending[(f"{name}_bucket", key, _le(bound))] += value <= bound
+            self._pending[(f"{name}_sum", key, "")] += value
+            self._pending[(f"{name}_count", key, "")] += 1
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """Add everything observed since the last flush to the shared file."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        with self._connect() as conn:
+            conn.executemany(ADD_SAMPLE, [(name, labels, le, value) for (name, labels, le), value in pending.items()])
+
+    def render(self):
+        """Every series in the Prometheus text exposition format."""
+        self.flush()
+        with self._connect() as conn:
+            rows = conn.execute("SELECT name, labels, le, value FROM samples").fetchall()
+        series = defaultdict(list)
+        for name, labels, le, value in rows:
+            family = next((f for f in FAMILIES if name == f or name.startswith(f + "_")), name)
+            series[family].append((name, labels, le, value))
+        lines = []
+        for family in sorted(series):
+            kind, help_text = FAMILIES.get(family, ("untyped", ""))
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {kind}")
+            for name, labels, le, value in sorted(series[family], key=lambda r: (r[1], r[0], float(r[2] or 0))):
+                if le:
+                    labels = f'{labels},le="{le}"' if labels else f'le="{le}"'
+                lines.append(f"{name}{{{labels}}} {_number(value)}" if labels else f"{name} {_number(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,178 @@
+"""Streaming NDJSON and CSV exports of report records.
+
+Both formats are produced by generators that read one storage segment at a
+time (see reports/storage.py), so server memory stays flat however large
+the report is.
+
+NDJSON is the stored lines verbatim. Its length is known up front from the
+segments' raw_bytes, so it supports Content-Length and byte-range resume
+(`Range: bytes=N-` / `bytes=N-M`). Whole segments before the range are
+skipped without being decompressed. CSV length isn't known in advance, so
+CSV resumes by row instead (`?start=<row>`). Either format is gzip-encoded
+on the fly when the client accepts it and no range was requested.
+"""
+import csv
+import io
+import json
+import re
+import zlib
+
+from flask import Response, request, stream_with_context
+
+from database.models import db, ReportSegment
+from reports.storage import iter_records
+
+RANGE_RE = re.compile(r"^bytes=(\d+)-(\d*)$")
+CSV_FLUSH_ROWS = 200
+
+# Column order per section; sections not listed here use the first record's keys.
+CSV_COLUMNS = {
+    "results": [
+        "competitor_id", "source", "platform", "url", "final_url", "status", "title",
+        "description", "canonical_url", "word_count", "link_count", "image_count",
+        "video_count", "view_count", "rating_value", "rating_count", "followers",
+        "content_type", "bytes", "elapsed_ms", "attempts", "cache", "error", "extract_error",
+    ],
+    "keyword_results": [
+        "keyword", "country", "source", "url", "status", "content_type", "bytes",
+        "elapsed_ms", "attempts", "cache", "error", "body",
+    ],
+    "keywords": ["keyword"],
+}
+
+
+def _segments(report_id, section):
+    return db.session.execute(
+        db.select(ReportSegment.seq, ReportSegment.raw_bytes)
+        .where(ReportSegment.report_id == report_id, ReportSegment.section == section)
+        .order_by(ReportSegment.seq)
+    ).all()
+
+
+def ndjson_bytes(report_id, section, start=0, end=None):
+    """Yield bytes [start, end] (inclusive) of the section's NDJSON, skipping untouched segments."""
+    offset = 0
+    for seq, raw_bytes in _segments(report_id, section):
+        seg_start, seg_end = offset, offset + raw_bytes - 1
+        offset += raw_bytes
+        if seg_end < start:
+            continue
+        if end is not None and seg_start > end:
+            return
+        payload = db.session.scalar(
+            db.select(ReportSegment.payload).where(ReportSegment.report_id == report_id, ReportSegment.seq == seq)
+        )
+        chunk = zlib.decompress(payload)
+        lo = max(start - seg_start, 0)
+        hi = (end - seg_start + 1) if end is not None and end <= seg_end else len(chunk)
+        yield chunk[lo:hi]
+
+
+def ndjson_length(report_id, section):
+    return sum(raw for _, raw in _segments(report_id, section))
+
+
+def legacy_ndjson(report_id, section):
+    """NDJSON for reports stored before segments existed (records inside Report.data)."""
+    for record in iter_records(report_id, section):
+        yield json.dumps(record, separators=(",", ":")).encode() + b"\n"
+
+
+def csv_chunks(report_id, section, start_row=0):
+    """Yield CSV text in batches of CSV_FLUSH_ROWS rows, starting after `start_row` data rows."""
+    buffer = io.StringIO()
+    writer = None
+    rows = 0
+    for index, record in enumerate(iter_records(report_id, section)):
+        if writer is None:
+            columns = CSV_COLUMNS.get(section) or list(record)
+            writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+            writer.writeheader()
+        if index < start_row:
+            continue
+        writer.writerow({k: v if not isinstance(v, (dict, list)) else json.dumps(v) for k, v in record.items()})
+        rows += 1
+        if rows % CSV_FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _accepts_gzip():
+    return request.accept_encodings["gzip"] > 0
+
+
+def _etag(report, section, fmt):
+    stamp = report.generated_at.strftime("%Y%m%d%H%M%S%f") if report.generated_at else "0"
+    return f"{report.id}-{section}-{fmt}-{stamp}"
+
+
+def _parse_range(total, etag):
+    """(start, end) for a satisfiable single byte range, None for no/ignored range, or False if unsatisfiable."""
+    header = request.headers.get("Range")
+    if not header:
+        return None
+    if_range = request.headers.get("If-Range")
+    if if_range and if_range.strip('"') != etag:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else total - 1
+    if start >= total or end < start:
+        return False
+    return start, min(end, total - 1)
+
+
+def export_response(report, fmt, section="results"):
+    """Build the streaming response for /reports/<id>/export.<fmt>."""
+    filename = f"report-{report.id}-{section}.{fmt}"
+    etag = _etag(report, section, fmt)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"', "ETag": f'"{etag}"'}
+    has_segments = db.session.scalar(
+        db.select(ReportSegment.seq).where(ReportSegment.report_id == report.id).limit(1)
+    ) is not None
+
+    if fmt == "ndjson":
+        mimetype = "application/x-ndjson"
+        if has_segments:
+            total = ndjson_length(report.id, section)
+            headers["Accept-Ranges"] = "bytes"
+            byte_range = _parse_range(total, etag)
+            if byte_range is False:
+                headers["Content-Range"] = f"bytes */{total}"
+                return Response(status=416, headers=headers)
+            if byte_range:
+                start, end = byte_range
+                headers["Content-Range"] = f"bytes {start}-{end}/{total}"
+                headers["Content-Length"] = str(end - start + 1)
+                body = ndjson_bytes(report.id, section, start, end)
+                return Response(stream_with_context(body), status=206, mimetype=mimetype, headers=headers)
+            body = ndjson_bytes(report.id, section)
+            if not _accepts_gzip():
+                headers["Content-Length"] = str(total)
+        else:
+            body = legacy_ndjson(report.id, section)
+    else:
+        mimetype = "text/csv"
+        body = csv_chunks(report.id, section, request.args.get("start", 0, type=int))
+
+    if _accepts_gzip():
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+        headers["ETag"] = f'"{etag}-gzip"'
+
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
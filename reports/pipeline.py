@@ -0,0 +1,40 @@
+from flask import current_app
+from database.models import db, Query, Competitor
+from sources.collect import run_collection
+
+
+def build_report(query_id, writer, plan_summary=None):
+    """Collect one query's competitor sources into `writer` (a reports.storage.ReportWriter).
+
+    The query's keywords go to the "keywords" section and each fetched
+    competitor URL becomes one record in the "results" section. Returns the small header stored in Report.data: what the
+    report covers, per-source collection stats and the keyword plan summary.
+    """
+    query = db.session.get(Query, query_id)
+    competitors = [
+        {
+            "id": c.id,
+            "name": c.name,
+            "website": c.website,
+            "youtube_url": c.youtube_url,
+            "vimeo_url": c.vimeo_url,
+            "review_page_url": c.review_page_url,
+            "social_handles": c.get_social_handles(),
+        }
+        for c in Competitor.query.filter_by(client_id=query.client_id).all()
+    ]
+    keywords = query.get_keywords()
+    for keyword in keywords:
+        writer.write("keywords", {"keyword": keyword})
+    stats = run_collection(competitors, current_app.config, lambda record: writer.write("results", record))
+    return {
+        "query_id": query.id,
+        "client_id": query.client_id,
+        "period_start": query.period_start.isoformat() if query.period_start else None,
+        "period_end": query.period_end.isoformat() if query.period_end else None,
+        "keyword_count": len(keywords),
+        "countries": query.get_countries(),
+        "competitors": competitors,
+        "collection_stats": stats,
+        "keyword_plan": plan_summary or {},
+    }
@@ -0,0 +1,163 @@
+"""Keyword x country fan-out planning for a window of reports.
+
+Every report covers its query's keywords x countries for the query's
+period. Clients often track the same terms, so a window of reports is
+expanded into (keyword, country, period) work units, identical units are
+looked up once, and each result is fanned back out to every report that
+needs it. Units are ordered by the best subscription tier asking for them,
+so paid tiers finish first when the collection layer is the bottleneck.
+"""
+from array import array
+from collections import defaultdict, namedtuple
+import asyncio
+
+import numpy as np
+
+from database.models import db, Client, Query, QueryKeyword, QueryCountry, Report, SubscriptionTier
+from sources.collect import engine_options
+from sources.engine import FetchEngine
+from sources.keyword import KeywordSource
+
+WorkUnit = namedtuple("WorkUnit", "keyword country period_start period_end")
+
+# Bound on query ids per IN (...) so huge windows stay under driver parameter limits.
+ID_CHUNK = 500
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def query_priorities(query_ids):
+    """Map query_id -> (price, sort_order) of the client's tier; unknown tiers rank lowest."""
+    priorities = {}
+    for chunk in _chunks(query_ids, ID_CHUNK):
+        rows = db.session.execute(
+            db.select(Query.id, SubscriptionTier.price, SubscriptionTier.sort_order)
+            .join(Client, Client.id == Query.client_id)
+            .outerjoin(SubscriptionTier, SubscriptionTier.slug == Client.subscription_tier)
+            .where(Query.id.in_(chunk))
+        ).all()
+        priorities.update({row.id: (row.price or 0.0, row.sort_order or 0) for row in rows})
+    return priorities
+
+
+class UnitPlan:
+    """Deduplicated work units and the queries that need each, in flat arrays.
+
+    `units[i]` is the i-th unique unit; the query ids that need it are
+    `query_ids[offsets[i]:offsets[i + 1]]`. One int64 per (unit, query)
+    pair instead of a set per unit keeps large windows small.
+    """
+
+    def __init__(self, index, unit_of, query_of):
+        self.index = index
+        self.units = list(index)
+        pairs = np.unique(
+            np.stack([np.frombuffer(unit_of, dtype=np.int64), np.frombuffer(query_of, dtype=np.int64)], axis=1), axis=0
+        )  # sorted by unit, then query; duplicate pairs dropped
+        self.query_ids = pairs[:, 1].copy()
+        self.offsets = np.searchsorted(pairs[:, 0], np.arange(len(self.units) + 1))
+
+    def __len__(self):
+        return len(self.units)
+
+    def queries(self, unit):
+        i = self.index[unit]
+        return self.query_ids[self.offsets[i]:self.offsets[i + 1]].tolist()
+
+
+def plan_units(query_ids):
+    """Expand queries into deduplicated work units. Returns a UnitPlan."""
+    index = {}
+    unit_of, query_of = array("q"), array("q")  # one entry per (unit, query) pair
+    for chunk in _chunks(query_ids, ID_CHUNK):
+        periods = dict(
+            (row.id, (row.period_start, row.period_end))
+            for row in db.session.execute(
+                db.select(Query.id, Query.period_start, Query.period_end).where(Query.id.in_(chunk))
+            )
+        )
+        rows = db.session.execute(
+            db.select(QueryKeyword.query_id, QueryKeyword.keyword, QueryCountry.country)
+            .outerjoin(QueryCountry, QueryCountry.query_id == QueryKeyword.query_id)
+            .where(QueryKeyword.query_id.in_(chunk))
+        )
+        for query_id, keyword, country in rows:
+            start, end = periods[query_id]
+            unit_of.append(index.setdefault(WorkUnit(keyword.strip().lower(), country, start, end), len(index)))
+            query_of.append(query_id)
+    return UnitPlan(index, unit_of, query_of)
+
+
+def prioritize(plan, priorities):
+    """Order units by the highest-priority query that needs them, then by how many share them."""
+    if not len(plan):
+        return []
+    # Rank the distinct (price, sort_order) levels so a unit's best tier is one max over ints.
+    levels = {level: rank for rank, level in enumerate(sorted(set(priorities.values()) | {(0.0, 0)}))}
+    queries, inverse = np.unique(plan.query_ids, return_inverse=True)
+    ranks = np.array([levels[priorities.get(q, (0.0, 0))] for q in queries.tolist()], dtype=np.int64)[inverse]
+    best = np.maximum.reduceat(ranks, plan.offsets[:-1]).tolist()
+    shared = np.diff(plan.offsets).tolist()
+    units = plan.units
+
+    def key(i):
+        return (-best[i], -shared[i], units[i].keyword, units[i].country or "")
+
+    return [units[i] for i in sorted(range(len(units)), key=key)]
+
+
+def plan_window(report_ids):
+    """Plan the work units for a window of reports.
+
+    Returns (ordered_units, plan, report_queries): the units in priority
+    order, the UnitPlan with each unit's queries and {report_id: query_id}.
+    """
+    report_queries = dict(
+        db.session.execute(db.select(Report.id, Report.query_id).where(Report.id.in_(report_ids))).all()
+    )
+    query_ids = sorted(set(report_queries.values()))
+    plan = plan_units(query_ids)
+    ordered = prioritize(plan, query_priorities(query_ids))
+    return ordered, plan, report_queries
+
+
+async def _lookup(units, source, batch_size, options, on_result):
+    async with FetchEngine(**options) as engine:
+        for batch in _chunks(units, batch_size):
+            requests = [r for unit in batch for r in source.requests_for(unit)]
+            async for result in engine.fetch_all(requests):
+                on_result(result.request.meta["unit"], source.parse(result))
+    return engine.stats_summary()
+
+
+def run_keyword_round(report_ids, config, sinks):
+    """Look up every unique unit for `report_ids` once and fan each result out as it arrives.
+
+    `sinks` maps report_id -> callable(record). Returns a summary of the
+    round. Without KEYWORD_LOOKUP_URL configured no lookups are made.
+    """
+    ordered, plan, report_queries = plan_window(report_ids)
+    summary = {"units_requested": len(plan.query_ids), "units_unique": len(ordered), "lookups": 0}
+
+    template = config.get("KEYWORD_LOOKUP_URL")
+    if not template or not ordered:
+        return summary
+
+    reports_by_query = defaultdict(list)
+    for report_id, query_id in report_queries.items():
+        reports_by_query[query_id].append(report_id)
+
+    def fan_out(unit, record):
+        summary["lookups"] += 1
+        for query_id in plan.queries(unit):
+            for report_id in reports_by_query[query_id]:
+                sinks[report_id](record)
+
+    source = KeywordSource(template)
+    summary["collection_stats"] = asyncio.run(
+        _lookup(ordered, source, config["PLANNER_BATCH_SIZE"], engine_options(config, [source]), fan_out)
+    )
+    return summary
@@ -0,0 +1,189 @@
+"""Auto-run scheduler: turns due Query.next_run_at values into pending reports.
+
+Run it as its own process, next to gunicorn and the report worker:
+
+    python -m reports.scheduler
+
+Each tick is one indexed SELECT over (auto_run, next_run_at) for at most
+SCHEDULER_BATCH_SIZE due queries. A query is only enqueued if its
+next_run_at is still the value that was read, and the new report and the
+advanced next_run_at commit together, so restarts and overlapping
+schedulers never enqueue the same run twice. Each tick also finishes
+deleting clients marked for background purge and drops expired intake
+idempotency keys (database/purge.py).
+"""
+from calendar import monthrange
+from datetime import datetime, timedelta, time as dt_time
+import logging
+import time
+
+from flask import current_app
+from database.models import db, Query, Report
+from database.purge import expire_intake_keys, purge_marked
+from database.stats import bump_counters
+from monitoring.instrument import stage
+
+log = logging.getLogger(__name__)
+
+FORTNIGHT = timedelta(days=14)
+
+
+def add_months(value, months):
+    """Shift a datetime by whole months, clamping the day to the target month's length."""
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(value.day, monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def jitter_for(query_id, window_seconds):
+    """Stable per-query offset into the jitter window, so runs spread out but survive restarts."""
+    if window_seconds <= 0:
+        return timedelta(0)
+    return timedelta(seconds=(query_id * 2654435761) % window_seconds)
+
+
+def next_run_time(query, after, jitter_seconds):
+    """Next due time for `query` strictly after `after`, or None if its period is over.
+
+    Runs are anchored at period_start (or the query's creation date) plus the
+    query's jitter and repeat monthly, quarterly, fortnightly, or for
+    `custom` every period length. Every run is computed from the anchor, so month-end
+    clamping never drifts.
+    """
+    start_date = query.period_start or (query.created_at or after).date()
+    anchor = datetime.combine(start_date, dt_time.min) + jitter_for(query.id, jitter_seconds)
+
+    if query.frequency == "fortnightly":
+        step = FORTNIGHT
+    elif query.frequency == "custom" and query.period_start and query.period_end and query.period_end > query.period_start:
+        step = query.period_end - query.period_start
+    else:
+        step = None  # calendar months
+    months_per_run = 3 if query.frequency == "quarterly" else 1
+
+    if anchor > after:
+        candidate = anchor
+    elif step is not None:
+        candidate = anchor + step * ((after - anchor) // step + 1)
+    else:
+        months = (after.year - anchor.year) * 12 + (after.month - anchor.month)
+        months -= months % months_per_run
+        candidate = add_months(anchor, months)
+        while candidate <= after:
+            months += months_per_run
+            candidate = add_months(anchor, months)
+
+    if query.period_end and candidate.date() > query.period_end:
+        return None
+    return candidate
+
+
+def schedule_query(query, after=None):
+    """Set query.next_run_at from its current settings. Call after changing auto_run, frequency or period."""
+    if not query.auto_run:
+        query.next_run_at = None
+        return
+    after = after or datetime.utcnow()
+    query.next_run_at = next_run_time(query, after, current_app.config["SCHEDULER_JITTER_SECONDS"])
+
+
+def _schedule_columns():
+    return db.select(
+        Query.id, Query.client_id, Query.frequency, Query.period_start,
+        Query.period_end, Query.created_at, Query.next_run_at,
+    )
+
+
+def backfill_schedule():
+    """Compute next_run_at for auto-run queries that have none (rows from before the scheduler existed)."""
+    now = datetime.utcnow()
+    jitter = current_app.config["SCHEDULER_JITTER_SECONDS"]
+    rows = db.session.execute(
+        _schedule_columns().where(Query.auto_run.is_(True), Query.next_run_at.is_(None))
+    ).all()
+    updates = [
+        {"id": row.id, "next_run_at": due}
+        for row in rows
+        if (due := next_run_time(row, now, jitter)) is not None
+    ]
+    if updates:
+        db.session.execute(db.update(Query), updates)  # bulk UPDATE by primary key, one executemany
+    db.session.commit()
+    return len(updates)
+
+
+def enqueue_due(now=None, batch_size=None):
+    """Enqueue one batch of due auto-run queries. Returns the number of reports created."""
+    now = now or datetime.utcnow()
+    batch_size = batch_size or current_app.config["SCHEDULER_BATCH_SIZE"]
+    jitter = current_app.config["SCHEDULER_JITTER_SECONDS"]
+
+    due = db.session.execute(
+        _schedule_columns()
+        .where(Query.auto_run.is_(True), Query.next_run_at <= now)
+        .order_by(Query.next_run_at)
+        .limit(batch_size)
+    ).all()
+    if not due:
+        return 0
+
+    # Don't stack a new run on top of one still waiting or in progress.
+    busy = set(db.session.scalars(
+        db.select(Report.query_id).where(
+            Report.query_id.in_([row.id for row in due]),
+            Report.status.in_(("pending", "running")),
+        )
+    ))
+
+    new_reports = []
+    for row in due:
+        advanced = db.session.execute(
+            db.update(Query)
+            .where(Query.id == row.id, Query.next_run_at == row.next_run_at)
+            .values(next_run_at=next_run_time(row, now, jitter)),
+            execution_options={"synchronize_session": False},
+        )
+        if advanced.rowcount == 1 and row.id not in busy:
+            new_reports.append({"query_id": row.id, "status": "pending", "created_at": now})
+
+    if new_reports:
+        db.session.execute(db.insert(Report), new_reports)
+        bump_counters(reports=len(new_reports))
+    db.session.commit()
+    return len(new_reports)
+
+
+def run(app, once=False):
+    """Enqueue due reports in batches, and run the purges in database/purge.py, every SCHEDULER_POLL_INTERVAL seconds."""
+    with app.app_context():
+        backfilled = backfill_schedule()
+        log.info("Scheduler starting; %d auto-run queries backfilled", backfilled)
+        while True:
+            batch_size = app.config["SCHEDULER_BATCH_SIZE"]
+            total = 0
+            with stage("schedule"):
+                while True:
+                    created = enqueue_due(batch_size=batch_size)
+                    total += created
+                    if created < batch_size:
+                        break
+            if total:
+                log.info("Enqueued %d scheduled reports", total)
+            with stage("purge"):
+                purge_marked(app.config["PURGE_BATCH_SIZE"])
+                expire_intake_keys(app.config["INTAKE_IDEMPOTENCY_TTL"])
+            if once:
+                return total
+            time.sleep(app.config["SCHEDULER_POLL_INTERVAL"])
+
+
+if __name__ == "__main__":
+    from main import app
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        run(app)
+    except KeyboardInterrupt:
+        pass
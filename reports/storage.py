@@ -0,0 +1,181 @@
+"""Chunked, compressed storage for report records.
+
+A report's records are written as they are produced into report_segments
+rows. Each row is a zlib-compressed NDJSON chunk of at most
+REPORT_SEGMENT_RECORDS records. The reports row keeps only a small JSON
+header in Report.data plus record/byte counts. Writing holds at most one
+chunk per section in memory (plus the chunks queued on a SegmentFlusher),
+and reading decompresses one segment at a time, so memory per report is
+bounded no matter how many records it has.
+"""
+from concurrent.futures import ThreadPoolExecutor, wait
+import json
+import threading
+import zlib
+
+from database.models import db, Report, ReportSegment
+
+DEFAULT_SEGMENT_RECORDS = 500
+COMPRESSION_LEVEL = 6
+# Full chunks a SegmentFlusher holds before write() waits for one to be stored.
+MAX_PENDING_SEGMENTS = 4
+
+
+class SegmentFlusher:
+    """Compresses and stores full segments on a background thread.
+
+    Records reach their writers from the collection event loop, and
+    compressing and committing a chunk there stalls every fetch in flight.
+    Writers given a flusher only buffer in the caller's thread and hand
+    full chunks over. Each chunk is stored in its own app context, so on
+    its own database session. Use as `with SegmentFlusher(app) as flusher:`.
+    """
+
+    def __init__(self, app, max_pending=MAX_PENDING_SEGMENTS):
+        self.app = app
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="segments")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._executor.shutdown(wait=True)
+
+    def submit(self, fn, *args):
+        """Run fn(*args) on the flusher thread. Returns its Future; waits while the queue is full."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._run, fn, args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, fn, args):
+        with self.app.app_context():
+            return fn(*args)
+
+
+def _store_segment(report_id, seq, section, lines):
+    raw = b"\n".join(lines) + b"\n"
+    payload = zlib.compress(raw, COMPRESSION_LEVEL)
+    db.session.execute(db.insert(ReportSegment).values(
+        report_id=report_id,
+        seq=seq,
+        section=section,
+        record_count=len(lines),
+        raw_bytes=len(raw),
+        payload=payload,
+    ))
+    db.session.commit()
+    return len(raw), len(payload)
+
+
+class ReportWriter:
+    """Streams records for one report into compressed segments.
+
+    Opening a writer discards segments left by an earlier attempt of the
+    same report. With a `flusher` (SegmentFlusher), full chunks are stored
+    in the background; close() waits for them and raises the first error.
+    """
+
+    def __init__(self, report_id, segment_records=DEFAULT_SEGMENT_RECORDS, flusher=None):
+        self.report_id = report_id
+        self.segment_records = segment_records
+        self.flusher = flusher
+        self.seq = 0
+        self.record_count = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.section_counts = {}
+        self._buffers = {}  # section -> list of encoded lines
+        self._pending = []  # futures of chunks handed to the flusher
+        self.discard()
+
+    def write(self, section, record):
+        line = json.dumps(record, separators=(",", ":")).encode()
+        buffer = self._buffers.setdefault(section, [])
+        buffer.append(line)
+        if len(buffer) >= self.segment_records:
+            self._flush(section)
+
+    def _flush(self, section):
+        lines = self._buffers.pop(section, None)
+        if not lines:
+            return
+        seq, self.seq = self.seq, self.seq + 1
+        self.record_count += len(lines)
+        self.section_counts[section] = self.section_counts.get(section, 0) + len(lines)
+        if self.flusher is None:
+            self._stored(*_store_segment(self.report_id, seq, section, lines))
+        else:
+            self._pending.append(self.flusher.submit(_store_segment, self.report_id, seq, section, lines))
+
+    def _stored(self, raw_bytes, stored_bytes):
+        self.raw_bytes += raw_bytes
+        self.stored_bytes += stored_bytes
+
+    def _wait(self):
+        pending, self._pending = self._pending, []
+        wait(pending)
+        return pending
+
+    def close(self):
+        """Flush remaining buffers. Returns the counts to store on the reports row."""
+        for section in list(self._buffers):
+            self._flush(section)
+        for future in self._wait():
+            self._stored(*future.result())
+        return {
+            "record_count": self.record_count,
+            "raw_bytes": self.raw_bytes,
+            "stored_bytes": self.stored_bytes,
+        }
+
+    def discard(self):
+        """Drop every segment written for this report so far."""
+        self._buffers = {}
+        self._wait()  # a chunk still being stored would land after the delete
+        db.session.execute(db.delete(ReportSegment).where(ReportSegment.report_id == self.report_id))
+        db.session.commit()
+
+
+def iter_lines(report_id, section=None):
+    """Yield each stored record as a raw NDJSON line (bytes, no newline), one segment at a time."""
+    stmt = (
+        db.select(ReportSegment.payload)
+        .where(ReportSegment.report_id == report_id)
+        .order_by(ReportSegment.seq)
+    )
+    if section is not None:
+        stmt = stmt.where(ReportSegment.section == section)
+    for payload in db.session.scalars(stmt.execution_options(yield_per=1)):
+        for line in zlib.decompress(payload).splitlines():
+            if line:
+                yield line
+
+
+def iter_records(report_id, section=None):
+    """Yield decoded records of a report, optionally only one section.
+
+    Reports written before segmented storage keep their records inside
+    Report.data; those are read from there instead.
+    """
+    has_segments = db.session.scalar(
+        db.select(ReportSegment.seq).where(ReportSegment.report_id == report_id).limit(1)
+    ) is not None
+    if has_segments:
+        for line in iter_lines(report_id, section):
+            yield json.loads(line)
+        return
+    legacy = json.loads(db.session.scalar(db.select(Report.data).where(Report.id == report_id)) or "{}")
+    for name in ("results", "keyword_results") if section is None else (section,):
+        for record in legacy.get(name) or []:
+            yield record
+
+
+def read_header(report_id):
+    """The small JSON header stored on the reports row."""
+    return json.loads(db.session.scalar(db.select(Report.data).where(Report.id == report_id)) or "{}")
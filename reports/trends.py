@@ -0,0 +1,428 @@
+"""Rank and visibility history per query, kept as memory-mapped arrays.
+
+Every completed report adds one period to its query's history: the
+position at which the client (entity 0) and each competitor (entity =
+competitor id) rank for every (keyword, country) the report looked up.
+Positions come from the keyword lookup bodies (see sources/keyword.py);
+a body is JSON with a list of results under "organic_results", "organic"
+or "results", each with a "link" or "url" and optionally a "position".
+An entity ranks where its website's host, or a subdomain of it, first
+appears.
+
+Each query has a directory under TRENDS_DIR:
+
+    axes.json         periods, keywords, countries and entities, in array order
+    rank-K-C-E.u8     uint8 positions, shape (periods, K, C, E)
+    totals.npy        float64 (periods, E, 3): visibility, position sum and
+                      ranked cells over the whole period
+
+A position of 0 means not ranked; 255 means the lookup failed, and such
+cells count as neither. Visibility is the share of clicks a position
+earns (VISIBILITY_BY_POSITION), summed over cells. Periods are appended
+and axes only grow; new keywords, countries or competitors rewrite the
+rank file under a new name, so readers that already opened the old one
+are unaffected. Trends over the whole query read only totals.npy; trends
+over a subset of keywords or countries scan just that slice of the
+memory map, one period at a time.
+
+    python -m reports.trends [--query-id N]   # rebuild from stored reports
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import argparse
+import fcntl
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+
+from database.models import db, Client, Competitor, Query, Report
+from reports.storage import iter_records, read_header
+from sources.base import normalize_url
+
+log = logging.getLogger(__name__)
+
+CLIENT = 0  # entity id of the client's own site; competitors use their ids
+UNRANKED = 0
+FAILED = 255
+MAX_POSITION = 254
+RESULT_KEYS = ("organic_results", "organic", "results")
+
+# Approximate organic click-through rate by position; 11-20 earn 1%, lower positions nothing.
+VISIBILITY_BY_POSITION = (0.28, 0.15, 0.11, 0.08, 0.06, 0.05, 0.04, 0.03, 0.03, 0.02) + (0.01,) * 10
+
+# Per-byte lookup tables: what one rank cell contributes to each column of totals.
+_VALUES = np.zeros((256, 3))
+_VALUES[1:len(VISIBILITY_BY_POSITION) + 1, 0] = VISIBILITY_BY_POSITION
+_VALUES[1:FAILED, 1] = np.arange(1, FAILED)
+_VALUES[1:FAILED, 2] = 1
+VISIBILITY, POSITION_SUM, RANKED = range(3)
+
+
+def cell_totals(ranks):
+    """Visibility, position sum and ranked count per entity of a (..., E) uint8 block, as (E, 3)."""
+    entities = ranks.shape[-1]
+    cells = ranks.reshape(-1, entities) + np.arange(0, 256 * entities, 256)
+    histogram = np.bincount(cells.ravel(), minlength=256 * entities).reshape(entities, 256)
+    return histogram @ _VALUES
+
+
+def site_host(website):
+    host = (normalize_url(website).split("://", 1)[1].split("/", 1)[0].split(":", 1)[0]).lower()
+    return host.removeprefix("www.")
+
+
+def serp_positions(body):
+    """(position, host) of each organic result in a lookup body; empty if it can't be parsed."""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return []
+    if not isinstance(data, dict):
+        return []
+    items = next((data[key] for key in RESULT_KEYS if isinstance(data.get(key), list)), [])
+    positions = []
+    for i, item in enumerate(items, 1):
+        if not isinstance(item, dict):
+            continue
+        url = item.get("link") or item.get("url")
+        if url:
+            positions.append((item.get("position") or item.get("rank") or i, site_host(url)))
+    return positions
+
+
+def match_positions(record, hosts):
+    """Best position per entity index for one keyword_results record, or None if the lookup failed."""
+    body = record.get("body")
+    if record.get("error") or not body:
+        return None
+    best = {}
+    for position, host in serp_positions(body):
+        parts = host.split(".")
+        for i in range(len(parts) - 1):
+            entity = hosts.get(".".join(parts[i:]))
+            if entity is not None and entity not in best:
+                best[entity] = min(int(position), MAX_POSITION)
+    return best
+
+
+class Trends:
+    """One query's history: `ranks` is the (periods, keywords, countries, entities) memory map."""
+
+    def __init__(self, axes, ranks, totals):
+        self.periods = axes["periods"]
+        self.keywords = axes["keywords"]
+        self.countries = axes["countries"]
+        self.entities = axes["entities"]
+        self.ranks = ranks
+        self._totals = totals
+
+    def _indices(self, labels, axis):
+        """Sorted positions of `labels` on `axis`; None for no selection or one covering the whole axis."""
+        if labels is None:
+            return None
+        position = {label: i for i, label in enumerate(axis)}
+        indices = sorted({position[label] for label in labels if label in position})
+        return None if len(indices) == len(axis) else np.array(indices, dtype=np.intp)
+
+    def totals(self, keywords=None, countries=None):
+        """(periods, entities, 3) totals, over all cells or only the given keywords and countries."""
+        k, c = self._indices(keywords, self.keywords), self._indices(countries, self.countries)
+        if k is None and c is None:
+            return self._totals
+        out = np.empty_like(self._totals)
+        for p in range(len(self.periods)):
+            block = self.ranks[p]
+            block = block[k] if k is not None else block
+            out[p] = cell_totals(block[:, c] if c is not None else block)
+        return out
+
+    def visibility(self, **selection):
+        """(periods, entities) summed visibility."""
+        return self.totals(**selection)[..., VISIBILITY]
+
+    def share_of_voice(self, **selection):
+        """(periods, entities) share of the period's total visibility; NaN when nobody ranked."""
+        visibility = self.visibility(**selection)
+        total = visibility.sum(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return visibility / total
+
+    def average_position(self, **selection):
+        """(periods, entities) mean position over the cells where the entity ranked; NaN if none."""
+        totals = self.totals(**selection)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return totals[..., POSITION_SUM] / totals[..., RANKED]
+
+    def top_movers(self, entity=CLIENT, n=10, lag=1, keywords=None, countries=None):
+        """The (keyword, country) cells where `entity` gained and lost the most places over `lag` periods.
+
+        Not ranking counts as one place below the deepest position seen;
+        cells whose lookup failed in either period are skipped.
+        """
+        if len(self.periods) <= lag or entity not in self.entities:
+            return {"gainers": [], "losers": []}
+        e = self.entities.index(entity)
+        k, c = self._indices(keywords, self.keywords), self._indices(countries, self.countries)
+        k = np.arange(len(self.keywords)) if k is None else k
+        c = np.arange(len(self.countries)) if c is None else c
+        now = self.ranks[-1][np.ix_(k, c, [e])][..., 0].astype(np.int16)
+        before = self.ranks[-1 - lag][np.ix_(k, c, [e])][..., 0].astype(np.int16)
+        measured = (now != FAILED) & (before != FAILED)
+        floor = max(int(np.where(measured, np.maximum(now, before), 0).max(initial=0)), 1) + 1
+        change = np.where(before == UNRANKED, floor, before) - np.where(now == UNRANKED, floor, now)
+        change = np.where(measured, change, 0).ravel()
+        order = np.argsort(change, kind="stable")
+
+        def cells(indices):
+            return [
+                {
+                    "keyword": self.keywords[k[i // len(c)]],
+                    "country": self.countries[c[i % len(c)]],
+                    "previous": int(before.flat[i]) or None,
+                    "current": int(now.flat[i]) or None,
+                    "change": int(change[i]),
+                }
+                for i in indices
+            ]
+
+        gainers = [i for i in order[::-1][:n] if change[i] > 0]
+        losers = [i for i in order[:n] if change[i] < 0]
+        return {"gainers": cells(gainers), "losers": cells(losers)}
+
+
+def deltas(series, lag=1):
+    """Change of each value from `lag` periods earlier, along axis 0; the first `lag` rows are NaN."""
+    series = np.asarray(series, dtype=float)
+    out = np.full_like(series, np.nan)
+    out[lag:] = series[lag:] - series[:-lag]
+    return out
+
+
+def moving_average(series, window):
+    """Trailing mean over up to `window` periods along axis 0, ignoring NaN."""
+    series = np.asarray(series, dtype=float)
+    present = ~np.isnan(series)
+    sums = np.cumsum(np.where(present, series, 0.0), axis=0)
+    counts = np.cumsum(present, axis=0)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def _json(values, digits=4):
+    """Nested lists for JSON, NaN as None."""
+    values = np.asarray(values, dtype=float)
+    out = np.round(values, digits).astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
+
+
+def trend_summary(trends, query, keywords=None, countries=None, window=3, movers=10):
+    """What GET /queries/<id>/trends returns: per-period series per entity and the client's top movers."""
+    selection = {"keywords": keywords, "countries": countries}
+    share = trends.share_of_voice(**selection)
+    position = trends.average_position(**selection)
+    names = dict(db.session.execute(
+        db.select(Competitor.id, Competitor.name).where(Competitor.id.in_([e for e in trends.entities if e != CLIENT]))
+    ).all())
+    names[CLIENT] = query.client.name
+    return {
+        "query_id": query.id,
+        "periods": trends.periods,
+        "entities": [{"id": e, "name": names.get(e, f"Competitor {e}")} for e in trends.entities],
+        "share_of_voice": _json(share),
+        "share_of_voice_change": _json(deltas(share)),
+        "share_of_voice_moving_average": _json(moving_average(share, window)),
+        "visibility": _json(trends.visibility(**selection)),
+        "average_position": _json(position, 2),
+        "average_position_change": _json(deltas(position), 2),
+        "top_movers": trends.top_movers(CLIENT, movers, **selection),
+    }
+
+
+# --- Storage ---
+
+def _query_dir(root, query_id):
+    return os.path.join(root, str(query_id))
+
+
+def _rank_file(axes):
+    return "rank-{}-{}-{}.u8".format(len(axes["keywords"]), len(axes["countries"]), len(axes["entities"]))
+
+
+def _write_atomic(path, write):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _open_ranks(directory, axes, mode="r"):
+    shape = (len(axes["periods"]), len(axes["keywords"]), len(axes["countries"]), len(axes["entities"]))
+    if 0 in shape:
+        return np.zeros(shape, dtype=np.uint8)
+    return np.memmap(os.path.join(directory, _rank_file(axes)), dtype=np.uint8, mode=mode, shape=shape)
+
+
+def load(root, query_id):
+    """The query's Trends, or None if no report has been recorded for it."""
+    directory = _query_dir(root, query_id)
+    for _ in range(2):  # a writer may replace the rank file between reading axes.json and opening it
+        try:
+            with open(os.path.join(directory, "axes.json")) as f:
+                axes = json.load(f)
+            totals = np.load(os.path.join(directory, "totals.npy"))[:len(axes["periods"])]
+            return Trends(axes, _open_ranks(directory, axes), totals)
+        except FileNotFoundError:
+            continue
+    return None
+
+
+@contextmanager
+def _locked(directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _grow(directory, axes, grown):
+    """Copy the stored periods into a rank file shaped for `grown` axes (a superset of `axes`)."""
+    if not axes["periods"]:
+        return
+    old = _open_ranks(directory, axes)
+    new = _open_ranks(directory, dict(grown, periods=axes["periods"]), mode="w+")
+    new[:] = FAILED
+    index = [[grown[name].index(label) for label in axes[name]] for name in ("keywords", "countries", "entities")]
+    for p in range(len(axes["periods"])):
+        new[p][np.ix_(*index)] = old[p]
+    new.flush()
+
+
+def append_period(root, query_id, period, keywords, countries, entities, cells):
+    """Store one period of positions for a query, replacing the period if it is already stored.
+
+    `cells` maps (keyword, country) -> {entity: position} for successful
+    lookups and -> None for failed ones; a pair missing from `cells` is
+    stored as failed.
+    """
+    directory = _query_dir(root, query_id)
+    with _locked(directory):
+        try:
+            with open(os.path.join(directory, "axes.json")) as f:
+                axes = json.load(f)
+            totals = np.load(os.path.join(directory, "totals.npy"))[:len(axes["periods"])]
+        except FileNotFoundError:
+            axes = {"periods": [], "keywords": [], "countries": [], "entities": []}
+            totals = np.zeros((0, 0, 3))
+        grown = {
+            name: axes[name] + [label for label in dict.fromkeys(new) if label not in set(axes[name])]
+            for name, new in (("keywords", keywords), ("countries", countries), ("entities", entities))
+        }
+        stale = None
+        if any(len(grown[name]) != len(axes[name]) for name in grown):
+            _grow(directory, axes, grown)
+            stale = _rank_file(axes) if axes["periods"] else None
+            totals = np.concatenate(
+                [totals, np.zeros((len(totals), len(grown["entities"]) - totals.shape[1], 3))], axis=1
+            )
+        axes = dict(grown, periods=axes["periods"])
+
+        block = np.full((len(axes["keywords"]), len(axes["countries"]), len(axes["entities"])), FAILED, dtype=np.uint8)
+        k = {label: i for i, label in enumerate(axes["keywords"])}
+        c = {label: i for i, label in enumerate(axes["countries"])}
+        e = {label: i for i, label in enumerate(axes["entities"])}
+        for (keyword, country), positions in cells.items():
+            if positions is not None:
+                row = block[k[keyword], c[country]]
+                row[:] = UNRANKED
+                for entity, position in positions.items():
+                    row[e[entity]] = position
+
+        if period in axes["periods"]:
+            p = axes["periods"].index(period)
+        else:
+            p = len(axes["periods"])
+            axes["periods"] = axes["periods"] + [period]
+            totals = np.concatenate([totals, np.zeros((1, len(axes["entities"]), 3))])
+        path = os.path.join(directory, _rank_file(axes))
+        with open(path, "ab") as f:
+            f.truncate(max(os.path.getsize(path), block.nbytes * len(axes["periods"])))
+        ranks = _open_ranks(directory, axes, mode="r+")
+        ranks[p] = block
+        ranks.flush()
+        totals[p] = cell_totals(block)
+        _write_atomic(os.path.join(directory, "totals.npy"), lambda f: np.save(f, totals))
+        _write_atomic(os.path.join(directory, "axes.json"), lambda f: f.write(json.dumps(axes).encode()))
+        if stale:  # only now, so readers holding the previous axes.json can still open it
+            os.remove(os.path.join(directory, stale))
+
+
+def record_report(root, report_id):
+    """Add a completed report's keyword positions to its query's history. Returns False if it has none."""
+    report = db.session.get(Report, report_id)
+    header = read_header(report_id)
+    client_website = db.session.scalar(
+        db.select(Client.website).join(Query, Query.client_id == Client.id).where(Query.id == report.query_id)
+    )
+    hosts = {site_host(client_website): CLIENT} if client_website else {}
+    for competitor in header.get("competitors", []):
+        if competitor.get("website"):
+            hosts.setdefault(site_host(competitor["website"]), competitor["id"])
+
+    cells = {}
+    for record in iter_records(report_id, "keyword_results"):
+        key = (record["keyword"], record.get("country") or "")
+        positions = match_positions(record, hosts)
+        if positions is not None or key not in cells:
+            cells[key] = positions
+    if not cells:
+        return False
+    period = (report.generated_at or report.created_at or datetime.utcnow()).date().isoformat()
+    keywords = [k for k, _ in cells]
+    countries = [c for _, c in cells]
+    entities = [CLIENT] + [c["id"] for c in header.get("competitors", [])]
+    append_period(root, report.query_id, period, keywords, countries, entities, cells)
+    return True
+
+
+def remove(root, query_ids):
+    """Delete the stored history of these queries."""
+    for query_id in query_ids:
+        shutil.rmtree(_query_dir(root, query_id), ignore_errors=True)
+
+
+def rebuild(root, query_id=None):
+    """Replay stored complete reports, oldest first, into fresh histories. Returns the reports recorded."""
+    stmt = db.select(Report.id, Report.query_id).where(Report.status == "complete").order_by(Report.generated_at, Report.id)
+    if query_id is not None:
+        stmt = stmt.where(Report.query_id == query_id)
+    recorded = 0
+    seen = set()
+    for report_id, report_query_id in db.session.execute(stmt).all():
+        if report_query_id not in seen:
+            remove(root, [report_query_id])
+            seen.add(report_query_id)
+        recorded += record_report(root, report_id)
+    return recorded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild keyword rank histories from stored reports.")
+    parser.add_argument("--query-id", type=int, help="only this query")
+    args = parser.parse_args()
+
+    from main import app
+
+    with app.app_context():
+        root = app.config["TRENDS_DIR"]
+        if not root:
+            raise SystemExit("TRENDS_DIR is empty; trend history is disabled.")
+        print(f"Recorded {rebuild(root, args.query_id)} reports.")
@@ -0,0 +1,263 @@
+"""Background worker that drains pending reports.
+
+Run it as its own process, next to gunicorn:
+
+    python -m reports.worker
+
+Any number of worker processes can run against the same database. A report
+is claimed with a conditional UPDATE (status must still be 'pending'), so
+only one worker ever wins it. While a report runs, its worker keeps
+extending the lease; if the worker dies, another worker puts the row back
+to 'pending' once the lease has expired.
+"""
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+import json
+import logging
+import os
+import socket
+import time
+import traceback
+
+from flask import current_app
+
+from database.models import db, Client, Query, Report, SubscriptionTier
+from monitoring.instrument import flush as flush_metrics, stage
+from reports.pipeline import build_report
+from reports.planner import run_keyword_round
+from reports.storage import ReportWriter, SegmentFlusher
+from reports.trends import record_report
+
+log = logging.getLogger(__name__)
+
+def make_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_window(worker_id, lease_seconds, size):
+    """Atomically move up to `size` pending reports to running for this worker. Returns their ids.
+
+    Reports of the highest subscription tier go first, oldest first within
+    a tier; clients on an unknown tier rank lowest. Candidates come from one
+    ordered query and are claimed with one conditional UPDATE; ids another
+    worker won in between are left out and the shortfall is looked up again.
+    """
+    claimed = []
+    while len(claimed) < size:
+        candidates = db.session.scalars(
+            db.select(Report.id)
+            .join(Query, Query.id == Report.query_id)
+            .join(Client, Client.id == Query.client_id)
+            .outerjoin(SubscriptionTier, SubscriptionTier.slug == Client.subscription_tier)
+            .where(Report.status == "pending")
+            .order_by(
+                db.func.coalesce(SubscriptionTier.price, 0.0).desc(),
+                db.func.coalesce(SubscriptionTier.sort_order, 0).desc(),
+                Report.created_at,
+                Report.id,
+            )
+            .limit(size - len(claimed))
+        ).all()
+        if not candidates:
+            break
+        now = datetime.utcnow()
+        won = set(db.session.scalars(
+            db.update(Report)
+            .where(Report.id.in_(candidates), Report.status == "pending")
+            .values(
+                status="running",
+                worker_id=worker_id,
+                started_at=now,
+                lease_expires_at=now + timedelta(seconds=lease_seconds),
+                attempts=Report.attempts + 1,
+                error=None,
+            )
+            .returning(Report.id)
+        ).all())
+        db.session.commit()
+        claimed.extend(report_id for report_id in candidates if report_id in won)
+    return claimed
+
+
+def renew_leases(worker_id, report_ids, lease_seconds):
+    """Push out the lease on reports this worker is still running."""
+    if not report_ids:
+        return
+    db.session.execute(
+        db.update(Report)
+        .where(Report.id.in_(report_ids), Report.worker_id == worker_id, Report.status == "running")
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+    )
+    db.session.commit()
+
+
+def reclaim_stale(max_attempts):
+    """Requeue running reports whose lease expired; fail those out of attempts. Returns rows touched."""
+    now = datetime.utcnow()
+    stale = (Report.status == "running") & (Report.lease_expires_at < now)
+    failed = db.session.execute(
+        db.update(Report)
+        .where(stale, Report.attempts >= max_attempts)
+        .values(status="failed", error="Lease expired after final attempt", lease_expires_at=None)
+    ).rowcount
+    requeued = db.session.execute(
+        db.update(Report)
+        .where(stale)
+        .values(status="pending", worker_id=None, lease_expires_at=None)
+    ).rowcount
+    db.session.commit()
+    if failed or requeued:
+        log.warning("Reclaimed stale reports: %d requeued, %d failed", requeued, failed)
+    return failed + requeued
+
+
+def _finish(report_id, worker_id, **values):
+    # Guarded on worker_id so a worker whose lease was reclaimed can't overwrite the new owner.
+    db.session.execute(
+        db.update(Report)
+        .where(Report.id == report_id, Report.worker_id == worker_id, Report.status == "running")
+        .values(lease_expires_at=None, **values)
+    )
+    db.session.commit()
+
+
+def _fail(report_id, worker_id, writer, started):
+    db.session.rollback()
+    writer.discard()
+    _finish(
+        report_id, worker_id,
+        status="failed",
+        error=traceback.format_exc(),
+        duration_seconds=time.monotonic() - started,
+    )
+
+
+def _run_one(report_id, worker_id, writer, plan_summary):
+    started = time.monotonic()
+    try:
+        with stage("build_report"):
+            report = db.session.get(Report, report_id)
+            header = build_report(report.query_id, writer, plan_summary)
+        with stage("store_report"):
+            counts = writer.close()
+        header["sections"] = writer.section_counts
+    except Exception:
+        _fail(report_id, worker_id, writer, started)
+        log.exception("Report %d failed", report_id)
+        return False
+    _finish(
+        report_id, worker_id,
+        status="complete",
+        data=json.dumps(header),
+        summary=json.dumps(dict(writer.section_counts, competitors=len(header["competitors"]))),
+        generated_at=datetime.utcnow(),
+        duration_seconds=time.monotonic() - started,
+        **counts,
+    )
+    log.info("Report %d complete in %.2fs (%d records)", report_id, time.monotonic() - started, counts["record_count"])
+    if current_app.config["TRENDS_DIR"]:
+        try:
+            with stage("record_trends"):
+                record_report(current_app.config["TRENDS_DIR"], report_id)
+        except Exception:  # the report itself is complete; rebuild history with python -m reports.trends
+            db.session.rollback()
+            log.exception("Recording trends for report %d failed", report_id)
+    return True
+
+
+def process_window(report_ids, worker_id):
+    """Run a window of claimed reports. Executes inside a pool thread or process.
+
+    Keyword lookups are planned and deduplicated across the whole window
+    first (see reports.planner) and streamed into each report's storage as
+    they arrive; then each report's competitor sources are collected.
+    """
+    from main import app
+
+    with app.app_context(), SegmentFlusher(app) as flusher:
+        started = time.monotonic()
+        segment_records = app.config["REPORT_SEGMENT_RECORDS"]
+        # Sinks run in the collection event loop; the flusher keeps compression and commits off it.
+        writers = {rid: ReportWriter(rid, segment_records, flusher) for rid in report_ids}
+        try:
+            with stage("keyword_round"):
+                plan_summary = run_keyword_round(
+                    report_ids, app.config,
+                    {rid: (lambda record, w=w: w.write("keyword_results", record)) for rid, w in writers.items()},
+                )
+        except Exception:
+            for report_id, writer in writers.items():
+                _fail(report_id, worker_id, writer, started)
+            log.exception("Keyword round failed for reports %s", report_ids)
+            flush_metrics()
+            return 0
+        completed = sum(
+            _run_one(report_id, worker_id, writers[report_id], plan_summary)
+            for report_id in report_ids
+        )
+        flush_metrics()  # pool processes exit without running atexit hooks
+        return completed
+
+
+def process_report(report_id, worker_id):
+    """Run one claimed report on its own."""
+    return process_window([report_id], worker_id) == 1
+
+
+def _init_process():
+    # Forked children must not reuse the parent's pooled database connections.
+    from main import app
+
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def make_pool(kind, size):
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=size, initializer=_init_process)
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=size, thread_name_prefix="report")
+    raise ValueError(f"Unknown REPORT_WORKER_POOL {kind!r}; expected 'thread' or 'process'")
+
+
+def run(app, once=False):
+    """Poll for pending reports and run them on the configured pool until interrupted.
+
+    With once=True, drain what is pending now and return instead of polling.
+    """
+    cfg = app.config
+    worker_id = make_worker_id()
+    lease = cfg["REPORT_LEASE_SECONDS"]
+    size = cfg["REPORT_WORKER_CONCURRENCY"]
+    window = cfg["REPORT_WINDOW_SIZE"]
+    in_flight = {}  # future -> list of report ids
+
+    log.info("Report worker %s starting (%s pool, %d slots)", worker_id, cfg["REPORT_WORKER_POOL"], size)
+    with make_pool(cfg["REPORT_WORKER_POOL"], size) as pool, app.app_context():
+        while True:
+            for future in [f for f in in_flight if f.done()]:
+                del in_flight[future]
+
+            reclaim_stale(cfg["REPORT_MAX_ATTEMPTS"])
+            renew_leases(worker_id, [rid for ids in in_flight.values() for rid in ids], lease)
+
+            claimed = False
+            while len(in_flight) < size:
+                report_ids = claim_window(worker_id, lease, window)
+                if not report_ids:
+                    break
+                claimed = True
+                in_flight[pool.submit(process_window, report_ids, worker_id)] = report_ids
+
+            if once and not claimed and not in_flight:
+                return
+            time.sleep(cfg["REPORT_POLL_INTERVAL"] if not claimed else 0)
+
+if __name__ == "__main__":
+    from main import app
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        run(app)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,67 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class FetchRequest:
+    url: str
+    source: str  # name of the Source that produced it, used for per-source stats
+    method: str = "GET"
+    headers: dict = field(default_factory=dict)
+    meta: dict = field(default_factory=dict)  # carried through to the result untouched, e.g. competitor_id
+
+
+@dataclass
+class FetchResult:
+    request: FetchRequest
+    status: int | None = None  # None when no response was received
+    body: bytes = b""
+    headers: dict = field(default_factory=dict)
+    final_url: str = ""
+    elapsed: float = 0.0  # seconds, across all attempts
+    attempts: int = 0
+    error: str | None = None
+    from_cache: str | None = None  # "hit" (served fresh) or "revalidated" (304), see sources/cache.py
+
+    @property
+    def ok(self):
+        return self.error is None and self.status is not None and 200 <= self.status < 400
+
+
+class Source:
+    """One kind of data a report collects for a competitor.
+
+    Subclasses turn a competitor (the dict built by reports.pipeline) into
+    FetchRequests and turn each FetchResult into a plain dict for the report.
+    parse() only copies response metadata; anything that reads the body is
+    the job of `extractor` (see sources/extractors.py), which runs in the
+    extraction pool.
+    """
+
+    name = "base"
+    cache_ttl = None  # seconds a cached fetch stays fresh; None uses FETCH_CACHE_TTL
+    extractor = None  # staticmethod(fn) from sources/extractors.py, or None to keep only metadata
+
+    def requests_for(self, competitor):
+        raise NotImplementedError
+
+    def parse(self, result):
+        record = {
+            "source": self.name,
+            "url": result.request.url,
+            "final_url": result.final_url,
+            "status": result.status,
+            "bytes": len(result.body),
+            "content_type": result.headers.get("Content-Type", ""),
+            "elapsed_ms": round(result.elapsed * 1000, 1),
+            "attempts": result.attempts,
+            "error": result.error,
+            "cache": result.from_cache,
+        }
+        return record
+
+
+def normalize_url(url):
+    url = (url or "").strip()
+    if url and "://" not in url:
+        url = "https://" + url
+    return url
@@ -0,0 +1,215 @@
+"""Shared on-disk cache for fetched pages.
+
+Bodies live in content files under the cache directory; a small SQLite
+index next to them holds each entry's validators (ETag, Last-Modified),
+size, age and last access. Entries are keyed by normalized URL, so a
+competitor website listed under many clients is stored once and shared by
+every report and every worker process.
+
+An entry younger than its source's TTL is served without a request.
+Older entries with validators are revalidated with a conditional request,
+and a 304 reuses the stored body. The cache is kept under max_bytes by
+evicting least recently used entries.
+
+    python -m sources.cache   # print cumulative hit/miss/bytes-saved stats
+"""
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid")
+STAT_NAMES = ("hits", "revalidated", "misses", "stores", "evictions", "bytes_saved")
+
+
+def normalize_cache_key(url):
+    """Canonical form of a URL for cache lookups: lowercased scheme/host, no default port,
+    no fragment, tracking parameters dropped and the rest sorted."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+class CacheEntry:
+    def __init__(self, row, body_path):
+        self.key, self.status, self.etag, self.last_modified, self.content_type, self.size, self.stored_at = row
+        self.body_path = body_path
+
+    @property
+    def headers(self):
+        headers = {"Content-Type": self.content_type or ""}
+        if self.etag:
+            headers["ETag"] = self.etag
+        if self.last_modified:
+            headers["Last-Modified"] = self.last_modified
+        return headers
+
+    def age(self):
+        return time.time() - self.stored_at
+
+    def has_validators(self):
+        return bool(self.etag or self.last_modified)
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def read_body(self):
+        """The stored body, or None if it was evicted since the lookup."""
+        try:
+            with open(self.body_path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+class FetchCache:
+    def __init__(self, directory, max_bytes=1024 ** 3, default_ttl=86400, ttls=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}  # source name -> seconds
+        self.run_stats = dict.fromkeys(STAT_NAMES, 0)
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, status INTEGER, etag TEXT, last_modified TEXT,"
+                " content_type TEXT, size INTEGER, stored_at REAL, last_access REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO stats VALUES (?, 0)", [(n,) for n in STAT_NAMES + ("total_bytes",)]
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(os.path.join(self.directory, "index.db"), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _body_path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def ttl_for(self, source):
+        return self.ttls.get(source, self.default_ttl)
+
+    def count(self, name, amount=1):
+        """Add to a statistic for this run and to the cumulative total shared by all processes."""
+        if not amount:
+            return
+        self.run_stats[name] += amount
+        with self._connect() as conn:
+            conn.execute("UPDATE stats SET value = value + ? WHERE name = ?", (amount, name))
+
+    def lookup(self, url):
+        key = normalize_cache_key(url)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT key, status, etag, last_modified, content_type, size, stored_at"
+                " FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            path = self._body_path(key)
+            if not os.path.exists(path):
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                conn.execute("UPDATE stats SET value = value - ? WHERE name = 'total_bytes'", (row[5],))
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return CacheEntry(row, path)
+
+    def touch(self, entry):
+        """Mark a revalidated entry fresh again."""
+        with self._connect() as conn:
+            conn.execute("UPDATE entries SET stored_at = ? WHERE key = ?", (time.time(), entry.key))
+
+    def store(self, url, status, headers, body):
+        if "no-store" in headers.get("Cache-Control", ""):
+            return
+        key = normalize_cache_key(url)
+        path = self._body_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+        now = time.time()
+        with self._connect() as conn:
+            previous = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "UPDATE stats SET value = value + ? WHERE name = 'total_bytes'",
+                (len(body) - (previous[0] if previous else 0),),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key, status, headers.get("ETag"), headers.get("Last-Modified"),
+                    headers.get("Content-Type", ""), len(body), now, now,
+                ),
+            )
+        self.count("stores")
+        self.evict()
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        removed = 0
+        with self._connect() as conn:
+            total = conn.execute("SELECT value FROM stats WHERE name = 'total_bytes'").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            while total > self.max_bytes:
+                oldest = conn.execute("SELECT key, size FROM entries ORDER BY last_access LIMIT 100").fetchall()
+                if not oldest:
+                    break
+                for key, size in oldest:
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    try:
+                        os.remove(self._body_path(key))
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                    removed += 1
+            conn.execute("UPDATE stats SET value = ? WHERE name = 'total_bytes'", (total,))
+        self.count("evictions", removed)
+        return removed
+
+    def totals(self):
+        """Cumulative statistics across every process using this cache directory."""
+        with self._connect() as conn:
+            stats = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            stats["entries"], stats["bytes"] = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        lookups = stats["hits"] + stats["revalidated"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["revalidated"]) / lookups, 3) if lookups else None
+        return stats
+
+
+if __name__ == "__main__":
+    from config import Config
+
+    print(json.dumps(FetchCache(Config.FETCH_CACHE_DIR).totals(), indent=2))
@@ -0,0 +1,76 @@
+import asyncio
+
+from sources.cache import FetchCache
+from sources.competitor import DEFAULT_SOURCES
+from sources.engine import FetchEngine
+from sources.extract import ExtractionStage
+
+DEFAULT_EXTRACT_BUFFER_BYTES = 32 * 1024 * 1024
+
+
+def _extracted(record, sink):
+    def done(fields, error):
+        if fields:
+            record.update(fields)
+        if error:
+            record["extract_error"] = error
+        sink(record)
+    return done
+
+
+async def collect(competitors, sink, sources=None, extract_processes=0,
+                  extract_buffer_bytes=DEFAULT_EXTRACT_BUFFER_BYTES, **engine_options):
+    """Fetch every source for every competitor concurrently.
+
+    `competitors` are the dicts built by reports.pipeline. Each parsed
+    record, tagged with its competitor_id, is passed to `sink` as soon as
+    its source's extractor has run over the body (in the extraction pool
+    when `extract_processes` is set, see sources/extract.py). Fetches are
+    admitted only as results are taken here, so while extraction waits
+    fetching waits too. Returns the engine's per-source latency/throughput
+    summary, plus the extraction stage's counts.
+    """
+    sources = {s.name: s for s in (sources or DEFAULT_SOURCES)}
+    requests = [r for c in competitors for s in sources.values() for r in s.requests_for(c)]
+    async with FetchEngine(**engine_options) as engine:
+        async with ExtractionStage(extract_processes, extract_buffer_bytes) as stage:
+            async for result in engine.fetch_all(requests):
+                source = sources[result.request.source]
+                record = source.parse(result)
+                record["competitor_id"] = result.request.meta.get("competitor_id")
+                if source.extractor is None or not result.body:
+                    sink(record)
+                else:
+                    await stage.submit(source.extractor, result.body, record["content_type"], _extracted(record, sink))
+    return dict(engine.stats_summary(), extraction=stage.stats)
+
+
+def engine_options(config, sources=()):
+    """FetchEngine keyword arguments from the app config, including the shared fetch cache."""
+    options = {
+        "max_in_flight": config["COLLECT_MAX_IN_FLIGHT"],
+        "per_host_concurrency": config["COLLECT_PER_HOST_CONCURRENCY"],
+        "per_host_rate": config["COLLECT_PER_HOST_RATE"],
+        "timeout": config["COLLECT_TIMEOUT"],
+        "retries": config["COLLECT_RETRIES"],
+        "max_backoff": config["COLLECT_MAX_BACKOFF"],
+    }
+    if config["FETCH_CACHE_DIR"]:
+        options["cache"] = FetchCache(
+            config["FETCH_CACHE_DIR"],
+            max_bytes=config["FETCH_CACHE_MAX_BYTES"],
+            default_ttl=config["FETCH_CACHE_TTL"],
+            ttls={s.name: s.cache_ttl for s in sources if s.cache_ttl is not None},
+        )
+    return options
+
+
+def run_collection(competitors, config, sink, sources=None):
+    """Blocking entry point for the report worker."""
+    sources = sources or DEFAULT_SOURCES
+    return asyncio.run(collect(
+        competitors, sink, sources,
+        extract_processes=config["EXTRACT_PROCESSES"],
+        extract_buffer_bytes=config["EXTRACT_BUFFER_BYTES"],
+        **engine_options(config, sources),
+    ))
@@ -0,0 +1,82 @@
+from sources.base import Source, FetchRequest, normalize_url
+from sources.extractors import html_page, review_page, social_profile, video_page
+
+SOCIAL_URLS = {
+    "linkedin": "https://www.linkedin.com/company/{handle}",
+    "x": "https://x.com/{handle}",
+    "instagram": "https://www.instagram.com/{handle}/",
+    "facebook": "https://www.facebook.com/{handle}",
+    "tiktok": "https://www.tiktok.com/@{handle}",
+    "reddit": "https://www.reddit.com/user/{handle}",
+}
+
+
+class UrlFieldSource(Source):
+    """Fetches the URL stored in one Competitor column."""
+
+    field = None
+
+    def requests_for(self, competitor):
+        url = normalize_url(competitor.get(self.field))
+        if not url:
+            return []
+        return [FetchRequest(url=url, source=self.name, meta={"competitor_id": competitor["id"]})]
+
+
+class WebsiteSource(UrlFieldSource):
+    name = "website"
+    cache_ttl = 24 * 3600
+    field = "website"
+    extractor = staticmethod(html_page)
+
+
+class YouTubeSource(UrlFieldSource):
+    name = "youtube"
+    cache_ttl = 6 * 3600
+    field = "youtube_url"
+    extractor = staticmethod(video_page)
+
+
+class VimeoSource(UrlFieldSource):
+    name = "vimeo"
+    cache_ttl = 6 * 3600
+    field = "vimeo_url"
+    extractor = staticmethod(video_page)
+
+
+class ReviewPageSource(UrlFieldSource):
+    name = "reviews"
+    cache_ttl = 12 * 3600
+    field = "review_page_url"
+    extractor = staticmethod(review_page)
+
+
+class SocialSource(Source):
+    name = "social"
+    cache_ttl = 6 * 3600
+    extractor = staticmethod(social_profile)
+
+    def requests_for(self, competitor):
+        requests = []
+        for entry in competitor.get("social_handles", []):
+            handle = entry.get("handle", "").strip()
+            if handle.startswith("http://") or handle.startswith("https://"):
+                url = handle
+            elif entry.get("platform") in SOCIAL_URLS:
+                url = SOCIAL_URLS[entry["platform"]].format(handle=handle.lstrip("@"))
+            else:
+                continue
+            requests.append(FetchRequest(
+                url=url,
+                source=self.name,
+                meta={"competitor_id": competitor["id"], "platform": entry.get("platform")},
+            ))
+        return requests
+
+    def parse(self, result):
+        record = super().parse(result)
+        record["platform"] = result.request.meta.get("platform")
+        return record
+
+
+DEFAULT_SOURCES = [WebsiteSource(), YouTubeSource(), VimeoSource(), ReviewPageSource(), SocialSource()]
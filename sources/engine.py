@@ -0,0 +1,250 @@
+"""Asyncio fetch engine shared by every source.
+
+One aiohttp session (and so one keep-alive connection pool) serves a whole
+collection run. Concurrency is bounded three ways: a global in-flight cap,
+a per-host concurrency cap, and a per-host request rate. Failed requests
+(connection errors, timeouts, 429 and 5xx) are retried with exponential
+backoff and jitter, or after the server's Retry-After, capped at
+max_backoff; no slot is held while a request waits to retry. With a
+FetchCache attached, fresh entries skip the network entirely and stale
+ones are revalidated with conditional requests.
+"""
+from itertools import islice
+from urllib.parse import urlsplit
+import asyncio
+import random
+import time
+
+import aiohttp
+from multidict import CIMultiDict
+
+from sources.base import FetchResult
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+TRUNCATED_HEADER = "X-Balthazaar-Truncated"  # set on results cut off at max_body_bytes
+
+
+class HostLimiter:
+    """Caps concurrent requests to one host and spaces their start times to `rate` per second."""
+
+    def __init__(self, concurrency, rate):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_start = 0.0
+        self.lock = asyncio.Lock()
+
+    async def wait_turn(self):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class SourceStats:
+    """Latency and throughput for one source over a collection run."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.latencies = []
+        self.first_start = None
+        self.last_end = None
+
+    def record(self, result, started, ended):
+        self.requests += 1
+        self.retries += max(result.attempts - 1, 0)
+        self.bytes += len(result.body)
+        if not result.ok:
+            self.errors += 1
+        self.latencies.append(result.elapsed)
+        self.first_start = started if self.first_start is None else min(self.first_start, started)
+        self.last_end = ended if self.last_end is None else max(self.last_end, ended)
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        wall = (self.last_end - self.first_start) if self.requests else 0.0
+
+        def pct(p):
+            return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000, 1) if latencies else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes": self.bytes,
+            "latency_p50_ms": pct(0.50),
+            "latency_p95_ms": pct(0.95),
+            "latency_max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+            "requests_per_second": round(self.requests / wall, 2) if wall > 0 else None,
+            "bytes_per_second": round(self.bytes / wall, 1) if wall > 0 else None,
+        }
+
+
+class FetchEngine:
+    """Use as `async with FetchEngine(...) as engine:` and call fetch()/fetch_all()."""
+
+    def __init__(self, max_in_flight=100, per_host_concurrency=4, per_host_rate=5.0,
+                 timeout=20.0, retries=3, backoff=0.5, max_backoff=30.0, max_body_bytes=5 * 1024 * 1024,
+                 user_agent="Balthazaar/0.1", cache=None):
+        self.max_in_flight = max_in_flight
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_rate = per_host_rate
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_body_bytes = max_body_bytes
+        self.user_agent = user_agent
+        self.cache = cache
+        self.stats = {}
+        self._hosts = {}
+        self._in_flight = None
+        self._session = None
+
+    async def __aenter__(self):
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        connector = aiohttp.TCPConnector(
+            limit=self.max_in_flight,
+            limit_per_host=self.per_host_concurrency,
+            ttl_dns_cache=300,
+            keepalive_timeout=30,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers={"User-Agent": self.user_agent},
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+        self._session = None
+
+    def _limiter(self, url):
+        host = urlsplit(url).netloc.lower()
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            limiter = self._hosts[host] = HostLimiter(self.per_host_concurrency, self.per_host_rate)
+        return limiter
+
+    def _delay(self, attempt, response_headers=None):
+        retry_after = (response_headers or {}).get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), self.max_backoff)
+        return min(self.backoff * (2 ** attempt) * (0.5 + random.random()), self.max_backoff)
+
+    async def _attempt(self, request, result, extra_headers):
+        headers = {**request.headers, **extra_headers}
+        async with self._session.request(request.method, request.url, headers=headers) as resp:
+            result.status = resp.status
+            result.headers = CIMultiDict(resp.headers)
+            result.final_url = str(resp.url)
+            body = await resp.content.read(self.max_body_bytes + 1)
+            if len(body) > self.max_body_bytes:
+                body = body[:self.max_body_bytes]
+                result.headers[TRUNCATED_HEADER] = "1"
+            result.body = body
+
+    async def fetch(self, request):
+        """Fetch one request, retrying transient failures. Never raises for network errors."""
+        entry = cached_body = None
+        if self.cache is not None and request.method == "GET":
+            entry = await asyncio.to_thread(self.cache.lookup, request.url)
+            if entry is not None:
+                cached_body = await asyncio.to_thread(entry.read_body)
+                if cached_body is None:
+                    entry = None
+            if entry is not None and entry.age() < self.cache.ttl_for(request.source):
+                return await self._from_cache(request, entry, cached_body, "hit")
+
+        result = FetchResult(request=request)
+        conditional = entry.conditional_headers() if entry is not None else {}
+        limiter = self._limiter(request.url)
+        started = None
+        for attempt in range(self.retries + 1):
+            # Host slot first, global slot only around the request itself: requests queued
+            # behind one busy host must not hold the in-flight slots other hosts need.
+            async with limiter.semaphore:
+                await limiter.wait_turn()
+                async with self._in_flight:
+                    if started is None:
+                        started = time.monotonic()
+                    result.attempts = attempt + 1
+                    result.error = None
+                    try:
+                        await self._attempt(request, result, conditional)
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                        result.status = None
+                        result.error = f"{type(exc).__name__}: {exc}"
+                    else:
+                        if result.status not in RETRY_STATUSES:
+                            break
+                        result.error = f"HTTP {result.status}"
+            if attempt < self.retries:
+                # Both slots are free while backing off; the next attempt queues for them again.
+                await asyncio.sleep(self._delay(attempt, result.headers if result.status else None))
+        ended = time.monotonic()
+        result.elapsed = ended - started
+
+        if self.cache is not None and request.method == "GET":
+            if result.status == 304 and entry is not None:
+                await asyncio.to_thread(self.cache.touch, entry)
+                return await self._from_cache(request, entry, cached_body, "revalidated", result, started, ended)
+            await asyncio.to_thread(self.cache.count, "misses")
+            # A truncated body isn't the resource; caching it with validators would keep serving it.
+            if result.status == 200 and TRUNCATED_HEADER not in result.headers:
+                await asyncio.to_thread(self.cache.store, request.url, result.status, result.headers, result.body)
+
+        self.stats.setdefault(request.source, SourceStats()).record(result, started, ended)
+        return result
+
+    async def _from_cache(self, request, entry, body, how, network_result=None, started=None, ended=None):
+        result = FetchResult(
+            request=request,
+            status=entry.status,
+            body=body,
+            headers=entry.headers,
+            final_url=request.url,
+            elapsed=network_result.elapsed if network_result else 0.0,
+            attempts=network_result.attempts if network_result else 0,
+            from_cache=how,
+        )
+        await asyncio.to_thread(self.cache.count, "hits" if how == "hit" else "revalidated")
+        await asyncio.to_thread(self.cache.count, "bytes_saved", len(body))
+        now = time.monotonic()
+        self.stats.setdefault(request.source, SourceStats()).record(result, started or now, ended or now)
+        return result
+
+    async def fetch_all(self, requests, window=None):
+        """Fetch requests concurrently, yielding results as they complete.
+
+        At most `window` (default max_in_flight) requests are fetching or
+        waiting to be consumed at once; the next one starts only when the
+        caller takes a result. A slow consumer therefore slows fetching
+        instead of piling finished bodies up in memory.
+        """
+        requests = iter(requests)
+        pending = {asyncio.ensure_future(self.fetch(r)) for r in islice(requests, window or self.max_in_flight)}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+                    request = next(requests, None)
+                    if request is not None:
+                        pending.add(asyncio.ensure_future(self.fetch(request)))
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats_summary(self):
+        summary = {name: stats.summary() for name, stats in self.stats.items()}
+        if self.cache is not None:
+            summary["cache"] = dict(self.cache.run_stats)
+        return summary
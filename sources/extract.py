@@ -0,0 +1,200 @@
+"""Run CPU-bound extractors off the fetch event loop, in a process pool.
+
+Parsing HTML holds the GIL, so doing it where pages are fetched stalls
+every other fetch, and doing it in a thread doesn't help. An
+ExtractionStage copies each fetched body once into a shared memory arena
+and submits only (arena name, offset, length) to a pool of processes.
+The pool process maps the same memory and runs the source's extractor
+(sources/extractors.py) over a memoryview of it, so bodies are never
+pickled; only the small dict of extracted fields comes back.
+
+The arena is the stage's bounded queue: a body waits for a free span of
+EXTRACT_BUFFER_BYTES before it is handed over, and at most two tasks
+per pool process are queued at once. Waiting pauses the collect loop,
+and FetchEngine.fetch_all starts a new fetch only as the loop takes a
+result, so a slow pool slows fetching: besides the arena, at most
+max_in_flight fetched bodies wait in memory.
+Records reach the sink as their extraction finishes, in the event loop
+thread like every other record.
+
+The pool is created on first use and shared by every collection run in
+the process. EXTRACT_PROCESSES=0 runs extractors inline, in the loop.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+import asyncio
+import bisect
+import os
+import threading
+
+TASKS_PER_PROCESS = 2
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(processes):
+    """The process-wide extraction pool of this size, started on first use."""
+    with _pools_lock:
+        pool = _pools.get(processes)
+        if pool is None:
+            # spawn, not fork: the report worker has threads and open connections a fork would copy.
+            pool = _pools[processes] = ProcessPoolExecutor(max_workers=processes, mp_context=get_context("spawn"))
+        return pool
+
+
+def _discard_pool(pool):
+    # A pool whose process died stays broken; the next run starts a fresh one.
+    with _pools_lock:
+        for size, known in list(_pools.items()):
+            if known is pool:
+                del _pools[size]
+
+
+def _forget_pools():
+    # A forked child can't use its parent's pool processes; it starts its own on first use.
+    _pools.clear()
+
+
+os.register_at_fork(after_in_child=_forget_pools)
+
+
+def run_extractor(extractor, arena, offset, length, content_type):
+    """Pool-process side: run `extractor` over a body in the shared arena. Returns its fields."""
+    shm = SharedMemory(name=arena)
+    body = shm.buf[offset:offset + length]
+    try:
+        return extractor(body, content_type)
+    finally:
+        body.release()
+        shm.close()
+
+
+class Arena:
+    """First-fit allocation of byte spans in one shared memory block."""
+
+    def __init__(self, size):
+        self.shm = SharedMemory(create=True, size=size)
+        self.size = size
+        self.free = [(0, size)]  # sorted, non-adjacent (offset, length) spans
+
+    def allocate(self, length):
+        for i, (offset, span) in enumerate(self.free):
+            if span >= length:
+                if span == length:
+                    del self.free[i]
+                else:
+                    self.free[i] = (offset + length, span - length)
+                return offset
+        return None
+
+    def release(self, offset, length):
+        i = bisect.bisect(self.free, (offset, length))
+        self.free.insert(i, (offset, length))
+        if i + 1 < len(self.free) and offset + length == self.free[i + 1][0]:
+            self.free[i] = (offset, length + self.free.pop(i + 1)[1])
+        if i > 0 and self.free[i - 1][0] + self.free[i - 1][1] == offset:
+            self.free[i - 1] = (self.free[i - 1][0], self.free[i - 1][1] + self.free.pop(i)[1])
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ExtractionStage:
+    """Use as `async with ExtractionStage(...) as stage:` and call `await stage.submit(...)`.
+
+    Leaving the block waits for every submitted extraction to reach the sink.
+    """
+
+    def __init__(self, processes, buffer_bytes):
+        self.processes = processes
+        self.buffer_bytes = buffer_bytes
+        self.max_tasks = max(processes, 1) * TASKS_PER_PROCESS
+        self.stats = {"extracted": 0, "errors": 0, "waits": 0, "bytes": 0}
+        self._arena = None
+        self._pool = None
+        self._tasks = set()
+        self._running = 0
+        self._freed = None
+
+    async def __aenter__(self):
+        if self.processes:
+            self._pool = get_pool(self.processes)
+            self._arena = Arena(self.buffer_bytes)
+        self._freed = asyncio.Condition()
+        return self
+
+    async def __aexit__(self, *exc):
+        try:
+            outcomes = await asyncio.gather(*self._tasks, return_exceptions=True) if self._tasks else []
+        finally:
+            if self._arena is not None:
+                self._arena.close()
+                self._arena = None
+        failures = [o for o in outcomes if isinstance(o, BaseException)]
+        if failures and exc[0] is None:
+            raise failures[0]  # the sink failed; let the report fail as it would without the pool
+
+    async def submit(self, extractor, body, content_type, done):
+        """Extract `body` and call `done(fields, error)` with the result in the event loop thread.
+
+        Waits while the arena has no room for the body or the pool already
+        has its share of queued tasks.
+        """
+        if not self.processes:
+            self._finish(done, *self._inline(extractor, body, content_type))
+            return
+        length = len(body)
+        if length > self.buffer_bytes:
+            self._finish(done, None, f"body of {length} bytes exceeds EXTRACT_BUFFER_BYTES")
+            return
+        async with self._freed:
+            while True:
+                offset = self._arena.allocate(length) if self._running < self.max_tasks else None
+                if offset is not None:
+                    break
+                self.stats["waits"] += 1
+                await self._freed.wait()
+            self._running += 1
+        self._arena.shm.buf[offset:offset + length] = body
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._pool, run_extractor, extractor, self._arena.shm.name, offset, length, content_type
+            )
+        except Exception:
+            await self._release(offset, length)
+            raise
+        task = asyncio.ensure_future(self._complete(future, offset, length, done))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _release(self, offset, length):
+        self._arena.release(offset, length)
+        async with self._freed:
+            self._running -= 1
+            self._freed.notify_all()
+
+    async def _complete(self, future, offset, length, done):
+        try:
+            fields, error = await future, None
+        except Exception as exc:
+            if isinstance(exc, BrokenProcessPool):
+                _discard_pool(self._pool)
+            fields, error = None, f"{type(exc).__name__}: {exc}"
+        finally:
+            await self._release(offset, length)
+        self.stats["bytes"] += length
+        self._finish(done, fields, error)
+
+    def _inline(self, extractor, body, content_type):
+        try:
+            return extractor(memoryview(body), content_type), None
+        except Exception as exc:
+            return None, f"{type(exc).__name__}: {exc}"
+
+    def _finish(self, done, fields, error):
+        self.stats["errors" if error else "extracted"] += 1
+        done(fields, error)
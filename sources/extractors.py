@@ -0,0 +1,188 @@
+"""Turn fetched page bodies into structured report fields.
+
+An extractor is a module-level function `extractor(body, content_type)`
+returning a dict that is merged into the source's record. `body` is a
+memoryview that is only valid during the call: it may point into shared
+memory (see sources/extract.py), so extractors must not keep it or
+slices of it. Sources pick theirs with the `extractor` class attribute.
+
+Extractors run in pool processes, so they must be importable by name and
+free of app or database state.
+"""
+from html.parser import HTMLParser
+import json
+import re
+
+MAX_HEADINGS = 5
+MAX_TEXT = 300
+CHARSET_RE = re.compile(r"charset=([\w-]+)", re.IGNORECASE)
+WORD_RE = re.compile(r"\w+")
+FOLLOWERS_RE = re.compile(r"([\d][\d.,]*)\s*([KkMm]?)\s+(?:followers|subscribers|members)", re.IGNORECASE)
+
+
+def decode(body, content_type):
+    match = CHARSET_RE.search(content_type or "")
+    charset = match.group(1) if match else "utf-8"
+    try:
+        return str(body, charset, "replace")
+    except LookupError:
+        return str(body, "utf-8", "replace")
+
+
+class PageParser(HTMLParser):
+    """One pass over an HTML document collecting what the extractors report."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.title = []
+        self.meta = {}
+        self.canonical = None
+        self.headings = []
+        self.links = 0
+        self.images = 0
+        self.words = 0
+        self.json_ld = []
+        self._in = None  # "title", "h1", "script" (JSON-LD) or "skip" (other scripts, styles)
+        self._buffer = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "meta":
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            if key and attrs.get("content") is not None:
+                self.meta.setdefault(key, attrs["content"].strip())
+        elif tag == "link" and "canonical" in (attrs.get("rel") or "").lower().split():
+            self.canonical = attrs.get("href")
+        elif tag == "a" and attrs.get("href"):
+            self.links += 1
+        elif tag == "img":
+            self.images += 1
+        elif tag in ("title", "h1") and self._in is None:
+            self._in, self._buffer = tag, []
+        elif tag == "script" and (attrs.get("type") or "").lower() == "application/ld+json":
+            self._in, self._buffer = "script", []
+        elif tag in ("script", "style", "noscript"):
+            self._in = "skip"
+
+    def handle_endtag(self, tag):
+        if self._in is None:
+            return
+        text = "".join(self._buffer).strip()
+        if tag == "title" and self._in == "title":
+            self.title.append(text)
+        elif tag == "h1" and self._in == "h1":
+            if text and len(self.headings) < MAX_HEADINGS:
+                self.headings.append(" ".join(text.split())[:MAX_TEXT])
+        elif tag == "script" and self._in == "script":
+            try:
+                self.json_ld.append(json.loads(text))
+            except ValueError:
+                pass
+        elif not (tag in ("script", "style", "noscript") and self._in == "skip"):
+            return
+        self._in, self._buffer = None, []
+
+    def handle_data(self, data):
+        if self._in in ("title", "h1", "script"):
+            self._buffer.append(data)
+        if self._in != "skip" and self._in != "script":
+            self.words += len(WORD_RE.findall(data))
+
+
+def _json_ld_items(blocks):
+    """Every object in the page's JSON-LD, following lists and @graph."""
+    stack = list(blocks)
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list):
+            stack.extend(item)
+        elif isinstance(item, dict):
+            yield item
+            stack.extend(v for k, v in item.items() if k == "@graph" or isinstance(v, dict))
+
+
+def _types(item):
+    kind = item.get("@type")
+    return set(kind) if isinstance(kind, list) else {kind}
+
+
+def _number(value):
+    try:
+        return float(str(value).replace(",", ""))
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse(body, content_type):
+    parser = PageParser()
+    parser.feed(decode(body, content_type))
+    parser.close()
+    return parser
+
+
+def _page_fields(page):
+    meta = page.meta
+    title = " ".join(" ".join(page.title).split())
+    return {
+        "title": title[:MAX_TEXT] or meta.get("og:title", "")[:MAX_TEXT] or None,
+        "description": (meta.get("description") or meta.get("og:description") or "")[:MAX_TEXT] or None,
+        "canonical_url": page.canonical,
+        "headings": page.headings,
+        "word_count": page.words,
+        "link_count": page.links,
+        "image_count": page.images,
+        "structured_types": sorted({t for item in _json_ld_items(page.json_ld) for t in _types(item) if isinstance(t, str)}),
+    }
+
+
+def html_page(body, content_type):
+    """Title, description, headings, canonical URL, counts and structured-data types of an HTML page."""
+    if "html" not in (content_type or ""):
+        return {}
+    page = _parse(body, content_type)
+    return _page_fields(page)
+
+
+def video_page(body, content_type):
+    """html_page() plus the videos a channel or video page describes."""
+    if "html" not in (content_type or ""):
+        return {}
+    page = _parse(body, content_type)
+    fields = _page_fields(page)
+    videos = [item for item in _json_ld_items(page.json_ld) if "VideoObject" in _types(item)]
+    fields["video_count"] = len(videos) or (1 if "og:video" in page.meta or "og:video:url" in page.meta else 0)
+    views = [_number((item.get("interactionStatistic") or {}).get("userInteractionCount")) for item in videos]
+    fields["view_count"] = int(sum(v for v in views if v)) if any(views) else None
+    return fields
+
+
+def review_page(body, content_type):
+    """html_page() plus the aggregate rating from the page's structured data."""
+    if "html" not in (content_type or ""):
+        return {}
+    page = _parse(body, content_type)
+    fields = _page_fields(page)
+    rating = next(
+        (item for item in _json_ld_items(page.json_ld) if "AggregateRating" in _types(item)),
+        None,
+    )
+    fields["rating_value"] = _number(rating.get("ratingValue")) if rating else None
+    count = _number(rating.get("ratingCount") or rating.get("reviewCount")) if rating else None
+    fields["rating_count"] = int(count) if count is not None else None
+    return fields
+
+
+def social_profile(body, content_type):
+    """html_page() plus the follower count most profile pages state in their description."""
+    if "html" not in (content_type or ""):
+        return {}
+    page = _parse(body, content_type)
+    fields = _page_fields(page)
+    match = FOLLOWERS_RE.search(" ".join(filter(None, (page.meta.get("og:description"), page.meta.get("description")))))
+    followers = None
+    if match:
+        value = _number(match.group(1))
+        if value is not None:
+            followers = int(value * {"k": 1e3, "m": 1e6}.get(match.group(2).lower(), 1))
+    fields["followers"] = followers
+    return fields
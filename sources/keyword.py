@@ -0,0 +1,33 @@
+from urllib.parse import quote_plus
+
+from sources.base import Source, FetchRequest
+
+
+class KeywordSource(Source):
+    """Looks up one (keyword, country) work unit against a search/rank API.
+
+    `url_template` is formatted with the URL-quoted keyword and country,
+    e.g. "https://serp.example.com/search?q={keyword}&gl={country}".
+    """
+
+    name = "keywords"
+    cache_ttl = 6 * 3600
+
+    def __init__(self, url_template):
+        self.url_template = url_template
+
+    def requests_for(self, unit):
+        url = self.url_template.format(
+            keyword=quote_plus(unit.keyword),
+            country=quote_plus(unit.country or ""),
+        )
+        return [FetchRequest(url=url, source=self.name, meta={"unit": unit})]
+
+    def parse(self, result):
+        record = super().parse(result)
+        unit = result.request.meta["unit"]
+        record["keyword"] = unit.keyword
+        record["country"] = unit.country
+        if result.ok and "json" in record["content_type"]:
+            record["body"] = result.body.decode("utf-8", "replace")
+        return record
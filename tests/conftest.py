@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+# main builds its app from the environment at import time; keep tests off the real files.
+os.environ["METRICS_DB"] = ""
+os.environ["INTAKE_RATE_LIMIT_DB"] = ""
+os.environ["TRENDS_DIR"] = ""
+
+
+@pytest.fixture
+def app(tmp_path):
+    from config import Config
+    from database.engine import database_url
+    from main import bootstrap, create_app
+
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = database_url(f"sqlite:///{tmp_path / 'test.db'}")
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        bootstrap()
+        yield app
@@ -0,0 +1,38 @@
+import random
+
+from sqlalchemy import event
+
+from benchmarks.generate import client_rows
+from countries import COUNTRIES
+from database.models import db
+from intake.pipeline import write_clients
+
+SCALE = {"competitors": 2, "keywords": 5, "countries": 3}
+
+
+def add_clients(start, count):
+    write_clients(list(client_rows(random.Random(start), start, count, SCALE, list(COUNTRIES))))
+    db.session.commit()
+
+
+def dashboard_statements(app):
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        response = app.test_client().get("/")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    assert response.status_code == 200
+    return statements
+
+
+def test_dashboard_statement_count_does_not_grow_with_clients(app):
+    add_clients(0, 3)
+    few = dashboard_statements(app)
+    add_clients(3, 37)
+    many = dashboard_statements(app)
+    assert len(many) == len(few), "\n".join(many)
@@ -0,0 +1,223 @@
+"""FetchEngine against aiohttp.web stubs on 127.0.0.1; no network access needed.
+
+Each stub "host" is its own port, which is what the engine keys its
+per-host limits on. The stubs count requests and track how many are in
+flight, per host and in total.
+"""
+from collections import Counter
+import asyncio
+import socket
+import time
+
+from aiohttp import web
+
+from sources.base import FetchRequest
+from sources.engine import FetchEngine
+
+HOST = web.AppKey("host", int)
+
+
+class Stub:
+    """Use as `async with Stub(hosts=n) as stub:`; stub.urls[i] is host i's base URL."""
+
+    def __init__(self, hosts=1):
+        self.hosts = hosts
+        self.urls = []
+        self.hits = Counter()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.per_host = Counter()
+        self.max_per_host = Counter()
+        self.served = 0
+        self._runners = []
+
+    async def __aenter__(self):
+        for host in range(self.hosts):
+            app = web.Application()
+            app[HOST] = host
+            app.router.add_get("/slow", self.slow)
+            app.router.add_get("/flaky", self.flaky)
+            app.router.add_get("/retry-after", self.retry_after)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 0).start()
+            self.urls.append(f"http://127.0.0.1:{runner.addresses[0][1]}")
+            self._runners.append(runner)
+        return self
+
+    async def __aexit__(self, *exc):
+        for runner in self._runners:
+            await runner.cleanup()
+
+    async def slow(self, request):
+        """Answers after ?delay= seconds, recording concurrency meanwhile."""
+        host = request.app[HOST]
+        self.served += 1
+        self.in_flight += 1
+        self.per_host[host] += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.max_per_host[host] = max(self.max_per_host[host], self.per_host[host])
+        try:
+            await asyncio.sleep(float(request.query.get("delay", 0)))
+        finally:
+            self.in_flight -= 1
+            self.per_host[host] -= 1
+        return web.Response(text="ok")
+
+    async def flaky(self, request):
+        """503 for the first ?fails= requests with this ?key=, then 200."""
+        key = request.query["key"]
+        self.hits[key] += 1
+        if self.hits[key] <= int(request.query["fails"]):
+            return web.Response(status=503)
+        return web.Response(text="ok")
+
+    async def retry_after(self, request):
+        """429 with Retry-After: ?after= on the first request with this ?key=, then 200."""
+        key = request.query["key"]
+        self.hits[key] += 1
+        if self.hits[key] == 1:
+            return web.Response(status=429, headers={"Retry-After": request.query["after"]})
+        return web.Response(text="ok")
+
+
+def get(url):
+    return FetchRequest(url=url, source="stub")
+
+
+def engine(**options):
+    return FetchEngine(**dict({"per_host_rate": 0, "backoff": 0.01, "timeout": 5}, **options))
+
+
+async def fetch_all(engine, urls):
+    return [result async for result in engine.fetch_all([get(url) for url in urls])]
+
+
+def test_retries_transient_failures():
+    async def scenario():
+        async with Stub() as stub, engine(retries=3) as fetcher:
+            return await fetcher.fetch(get(f"{stub.urls[0]}/flaky?key=a&fails=2")), stub.hits["a"]
+
+    result, hits = asyncio.run(scenario())
+    assert result.ok and result.status == 200
+    assert result.attempts == hits == 3
+
+
+def test_gives_up_after_retries():
+    async def scenario():
+        async with Stub() as stub, engine(retries=2) as fetcher:
+            return await fetcher.fetch(get(f"{stub.urls[0]}/flaky?key=a&fails=10"))
+
+    result = asyncio.run(scenario())
+    assert not result.ok
+    assert result.status == 503 and result.error == "HTTP 503"
+    assert result.attempts == 3
+
+
+def test_connection_errors_are_retried_and_reported():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]  # nothing listens here once the socket is closed
+
+    async def scenario():
+        async with engine(retries=1) as fetcher:
+            return await fetcher.fetch(get(f"http://127.0.0.1:{port}/"))
+
+    result = asyncio.run(scenario())
+    assert result.status is None and result.error
+    assert result.attempts == 2
+
+
+def test_retry_after_is_honoured():
+    async def scenario():
+        async with Stub() as stub, engine(retries=1) as fetcher:
+            started = time.monotonic()
+            result = await fetcher.fetch(get(f"{stub.urls[0]}/retry-after?key=a&after=1"))
+            return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert result.status == 200 and result.attempts == 2
+    assert elapsed >= 1.0
+
+
+def test_retry_after_is_capped_at_max_backoff():
+    async def scenario():
+        async with Stub() as stub, engine(retries=1, max_backoff=0.2) as fetcher:
+            started = time.monotonic()
+            result = await fetcher.fetch(get(f"{stub.urls[0]}/retry-after?key=a&after=3600"))
+            return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert result.status == 200 and result.attempts == 2
+    assert elapsed < 2.0
+
+
+def test_per_host_concurrency_is_capped():
+    async def scenario():
+        async with Stub() as stub, engine(per_host_concurrency=3) as fetcher:
+            results = await fetch_all(fetcher, [f"{stub.urls[0]}/slow?delay=0.1"] * 10)
+            return results, stub.max_per_host[0]
+
+    results, most = asyncio.run(scenario())
+    assert all(r.ok for r in results)
+    assert most == 3
+
+
+def test_in_flight_requests_are_capped_across_hosts():
+    async def scenario():
+        async with Stub(hosts=3) as stub, engine(max_in_flight=5, per_host_concurrency=4) as fetcher:
+            results = await fetch_all(fetcher, [f"{url}/slow?delay=0.1" for url in stub.urls for _ in range(4)])
+            return results, stub.max_in_flight, max(stub.max_per_host.values())
+
+    results, most, most_per_host = asyncio.run(scenario())
+    assert len(results) == 12 and all(r.ok for r in results)
+    assert most == 5
+    assert most_per_host <= 4
+
+
+def test_busy_host_does_not_hold_global_slots():
+    async def scenario():
+        async with Stub(hosts=2) as stub, engine(max_in_flight=4, per_host_concurrency=1) as fetcher:
+            busy = [asyncio.ensure_future(fetcher.fetch(get(f"{stub.urls[0]}/slow?delay=0.3"))) for _ in range(8)]
+            await asyncio.sleep(0.05)  # let the busy host's requests queue up first
+            started = time.monotonic()
+            idle = await fetcher.fetch(get(f"{stub.urls[1]}/slow"))
+            waited = time.monotonic() - started
+            await asyncio.gather(*busy)
+            return idle, waited
+
+    idle, waited = asyncio.run(scenario())
+    assert idle.ok
+    assert waited < 0.3
+
+
+def test_backoff_releases_host_and_global_slots():
+    async def scenario():
+        async with Stub(hosts=2) as stub, engine(max_in_flight=1, per_host_concurrency=1, retries=1) as fetcher:
+            backing_off = asyncio.ensure_future(fetcher.fetch(get(f"{stub.urls[0]}/retry-after?key=a&after=1")))
+            await asyncio.sleep(0.2)  # the first attempt got its 429 and is sleeping
+            started = time.monotonic()
+            same_host = await fetcher.fetch(get(f"{stub.urls[0]}/slow"))
+            other_host = await fetcher.fetch(get(f"{stub.urls[1]}/slow"))
+            waited = time.monotonic() - started
+            return await backing_off, same_host, other_host, waited
+
+    backed_off, same_host, other_host, waited = asyncio.run(scenario())
+    assert backed_off.status == 200 and backed_off.attempts == 2
+    assert same_host.ok and other_host.ok
+    assert waited < 0.5
+
+
+def test_fetch_all_waits_for_the_consumer():
+    async def scenario():
+        async with Stub() as stub, engine(max_in_flight=3) as fetcher:
+            results = fetcher.fetch_all([get(f"{stub.urls[0]}/slow")] * 20)
+            first = await anext(results)
+            await asyncio.sleep(0.3)  # a slow consumer, e.g. waiting on the extraction pool
+            served_while_waiting = stub.served
+            rest = [result async for result in results]
+            return [first] + rest, served_while_waiting
+
+    results, served_while_waiting = asyncio.run(scenario())
+    assert len(results) == 20 and all(r.ok for r in results)
+    assert served_while_waiting <= 4
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from database import search as search_module
+from database.models import db, Client
+from database.search import search
+
+
+def add_clients(names):
+    clients = [Client(name=name, website=f"{name.lower().replace(' ', '-')}.example", contact_name="A",
+                      contact_email="a@example.com") for name in names]
+    db.session.add_all(clients)
+    db.session.commit()
+    return clients
+
+
+def test_small_match_sets_are_ranked_in_full(app):
+    add_clients([f"Acme {i}" for i in range(5)] + ["Acme Acme"])
+    results = search("acme")
+    assert results["partial"] == []
+    assert results["clients"][0]["name"] == "Acme Acme"
+
+
+def test_common_terms_rank_the_newest_live_matches(app, monkeypatch):
+    monkeypatch.setattr(search_module, "RANK_ALL_MATCHES", 5)
+    monkeypatch.setattr(search_module, "RANKED_CANDIDATES", 3)
+    clients = add_clients([f"Acme {i}" for i in range(10)])
+    clients[-1].deleted_at = datetime.utcnow()
+    db.session.commit()
+
+    results = search("acme")
+    assert results["partial"] == ["clients"]
+    assert sorted(c["id"] for c in results["clients"]) == [c.id for c in clients[6:9]]
@@ -0,0 +1,47 @@
+import pytest
+
+from database.models import db, Client, Query, Report, ReportSegment
+from reports.storage import ReportWriter, SegmentFlusher, iter_records
+
+
+@pytest.fixture
+def report_id(app):
+    client = Client(name="Acme", website="acme.example", contact_name="A", contact_email="a@acme.example")
+    db.session.add(client)
+    db.session.flush()
+    query = Query(client_id=client.id)
+    db.session.add(query)
+    db.session.flush()
+    report = Report(query_id=query.id)
+    db.session.add(report)
+    db.session.commit()
+    return report.id
+
+
+def test_flusher_stores_segments_in_order(app, report_id):
+    with SegmentFlusher(app, max_pending=2) as flusher:
+        writer = ReportWriter(report_id, segment_records=10, flusher=flusher)
+        for i in range(95):
+            writer.write("results", {"i": i})
+            writer.write("keyword_results", {"k": i})
+        counts = writer.close()
+
+    assert counts["record_count"] == 190
+    assert counts["raw_bytes"] > counts["stored_bytes"] > 0
+    assert [r["i"] for r in iter_records(report_id, "results")] == list(range(95))
+    assert [r["k"] for r in iter_records(report_id, "keyword_results")] == list(range(95))
+
+
+def test_flusher_errors_surface_on_close(app, report_id):
+    with SegmentFlusher(app) as flusher:
+        writer = ReportWriter(report_id, segment_records=2, flusher=flusher)
+        writer.write("results", {"i": 0})
+        writer.write("results", {"i": 1})
+        writer.seq = 0  # the next chunk collides with the segment row just stored
+        writer.write("results", {"i": 2})
+        writer.write("results", {"i": 3})
+        with pytest.raises(Exception):
+            writer.close()
+        writer.discard()
+
+    assert db.session.scalar(db.select(db.func.count()).select_from(ReportSegment)) == 0